@@ -31,12 +31,28 @@
 # DEALINGS IN THE SOFTWARE.
 ###############################################################################
 
-import os, sys, string, re
+import os, sys, re
 
-import math, random
+import math
 
 import json
 
+import hashlib, datetime, email.utils
+
+from wellConstructionIndex import readSiteBlock, readKeySites, coopKey, LazyCodes
+from wellConstructionColumns import readSiteColumns
+import wellConstructionDatabase
+import wellConstructionCache
+import wellConstructionProfile
+import wellConstructionSvg
+import wellConstructionIntervals
+import wellConstructionLithology
+import wellConstructionSection
+import wellConstructionSpatial
+from wellConstructionRecords import recordClass
+from wellConstructionRdb import rdbHeader, rdbRows, rdbSiteRows, rdbLines
+from wellConstructionExtents import wellExtents, sitesExtents
+
 # Set up logging
 #
 import logging
@@ -54,50 +70,7 @@ screen_logger.setLevel(logging.INFO)
 
 # Import modules for CGI handling
 #
-from urllib.parse import urlparse, parse_qs
-
-# Parse the Query String
-#
-params = {}
-
-HardWired = None
-#HardWired = 1
-
-if HardWired is not None:
-    #os.environ['QUERY_STRING'] = 'site_no=420358121280001'
-    #os.environ['QUERY_STRING'] = 'site_no=414903121234001'
-    #os.environ['QUERY_STRING'] = 'site_no=430508119582001'
-    #os.environ['QUERY_STRING'] = 'site_no=434124119270901'
-    #os.environ['QUERY_STRING'] = 'site_no=432822119011501'
-    #os.environ['QUERY_STRING'] = 'site_no=431357118582301'
-    #os.environ['QUERY_STRING'] = 'site_no=452335122564301'
-    #os.environ['QUERY_STRING'] = 'site_no=453705119513901'
-    #os.environ['QUERY_STRING'] = 'site_no=415947121243401'
-    os.environ['QUERY_STRING'] = 'site_no=422508121161501'
-    
-if 'QUERY_STRING' in os.environ:
-    queryString = os.environ['QUERY_STRING']
-
-    queryStringD = parse_qs(queryString, encoding='utf-8')
-
-    myParmsL = [
-       'site_no'
-       ]
-    
-    for myParm in myParmsL:
-       myItems = re.escape(queryStringD.get(myParm, [''])[0]).split(',')
-       if len(myItems) > 1:
-          params[myParm] = re.escape(queryStringD.get(myParm, [''])[0])
-       else:
-          params[myParm] = re.escape(myItems[0])
-
-if 'site_no' in params:
-    site_no = params['site_no']
-else:
-   message = "Requires a NWIS site number"
-   print("Content-type:application/json\n\n")
-   print('{ "message": "%s" }' % message)
-   sys.exit()
+from urllib.parse import parse_qs
 
 # ------------------------------------------------------------
 # -- Set
@@ -110,76 +83,95 @@ version_date    = "15May2024"
 
 program_args    = []
 
+data_dir        = "data"
+backend         = os.environ.get('WELL_CONSTRUCTION_BACKEND', 'files')
+table_nmL       = ['sitefile', 'gw_cons', 'gw_hole', 'gw_csng', 'gw_open', 'gw_geoh', 'gw_repr']
+coopParmD       = {'coop_site_no': 'coop_site_no', 'registration_no': 'registration_no_va'}
+intervalParmD   = {'hole': 'gw_hole', 'csng': 'gw_csng', 'open': 'gw_open'}
+near_k          = 10
+near_max        = 1000
+ingest_manifest = "ingest.json"
+snapshot_root   = "snapshots"
+snapshot_pointer = "current"
+
+manifestD       = {}
+pointerD        = {}
+
+# =============================================================================
+
+def parseQueryString (queryString):
+
+   params = {}
+
+   queryStringD = parse_qs(queryString, encoding='utf-8')
+
+   myParmsL = [
+      'site_no',
+      'coop_site_no',
+      'registration_no',
+      'depth',
+      'elevation',
+      'intervals',
+      'lith_unit_cd',
+      'lith_cd',
+      'bbox',
+      'near',
+      'k',
+      'profile',
+      'format'
+      ]
+
+   for myParm in myParmsL:
+      myItems = re.escape(queryStringD.get(myParm, [''])[0]).split(',')
+      if len(myItems) > 1:
+         params[myParm] = re.escape(queryStringD.get(myParm, [''])[0])
+      else:
+         params[myParm] = re.escape(myItems[0])
+
+   return params
+
+# =============================================================================
+
+def jsonMessage (message):
+
+   return '{ "message": "%s" }' % message
+
 # =============================================================================
 
 def processAqfrCodes (service_rdbL):
 
-   serviceL    = []
    message     = ''
    aqfrInfoD   = {}
 
-   myFields    = [
-                  "state_cd", 
-                  "aqfr_cd", 
-                  "aqfr_nm"
-                 ]
-   
    # Parse head lines
    #
-   while len(service_rdbL) > 0:
-         
-      Line = service_rdbL[0].strip("\n|\r")
-      del service_rdbL[0]
-      #print(Line)
+   lineIter    = iter(service_rdbL)
+   columnL, formatL = rdbHeader(lineIter)
+   if columnL is None:
+      message = "Missing header lines"
+      return message, aqfrInfoD
 
-      # Grab column names in header
-      #
-      if Line[0] != '#':
-         columnL = Line.split('\t')
-         break
-
-   # Format line in header section
+   # Column positions resolved once for the file
    #
-   del service_rdbL[0]
+   aqfrIndex   = columnL.index('aqfr_cd')
+   nameIndex   = columnL.index('aqfr_nm')
 
    # Parse data lines
    #
-   while len(service_rdbL) > 0:
-
-      Line = service_rdbL[0].strip("\n|\r")
-      del service_rdbL[0]
+   for valuesL in rdbRows(lineIter):
 
-      valuesL  = Line.split('\t')
+      aqfrInfoD[valuesL[aqfrIndex]] = valuesL[nameIndex]
 
-      state_cd = valuesL[ columnL.index('state_cd') ]
-      aqfr_cd  = valuesL[ columnL.index('aqfr_cd') ]
-      aqfr_nm  = valuesL[ columnL.index('aqfr_nm') ]
-      
-      aqfrInfoD[aqfr_cd] = aqfr_nm
- 
    return message, aqfrInfoD
-     
 
 # =============================================================================
 
 def jsonDefinitions (service_rdbL):
 
-   serviceL    = []
    message     = ''
    codeInfoD   = {}
    ImageInfoD  = {}
 
-   myFields    = [
-                  "table_nm", 
-                  "gw_ref_cd", 
-                  "gw_ref_nm", 
-                  "parameter_cd", 
-                  "parameter_nm", 
-                  "head_1_tx", 
-                  "english_unit_tx", 
-                  "column_nm"
-                 ]
-   
    # Parse head lines
    #
    if len(service_rdbL) > 0:
@@ -229,67 +221,40 @@ def jsonDefinitions (service_rdbL):
 
 def processDefinitions (table_nmL, service_rdbL):
 
-   serviceL    = []
    message     = ''
    codeInfoD   = {}
 
-   myFields    = [
-                  "table_nm", 
-                  "gw_ref_cd", 
-                  "gw_ref_nm", 
-                  "parameter_cd", 
-                  "parameter_nm", 
-                  "head_1_tx", 
-                  "english_unit_tx", 
-                  "column_nm"
-                 ]
-   
    # Parse head lines
    #
-   while len(service_rdbL) > 0:
-         
-      Line = service_rdbL[0].strip("\n|\r")
-      del service_rdbL[0]
-      #print(Line)
-
-      # Grab column names in header
-      #
-      if Line[0] != '#':
-         columnL = Line.split('\t')
-         break
+   lineIter    = iter(service_rdbL)
+   columnL, formatL = rdbHeader(lineIter)
+   if columnL is None:
+      message = "Missing header lines"
+      return message, codeInfoD
 
-   # Format line in header section
+   # Column positions resolved once for the file
    #
-   del service_rdbL[0]
-
-   #print("\n".join(columnL))
+   positionD   = dict((column, columnL.index(column)) for column in ['table_nm', 'column_nm', 'parameter_cd', 'parameter_nm', 'english_unit_tx', 'head_1_tx', 'gw_ref_cd', 'gw_ref_nm'])
 
    # Parse data lines
    #
-   while len(service_rdbL) > 0:
-
-      Line = service_rdbL[0].strip("\n|\r")
-      del service_rdbL[0]
+   for valuesL in rdbRows(lineIter):
 
-      valuesL = Line.split('\t')
-
-      # Record
-      #
-      table_nm        = valuesL[ columnL.index('table_nm') ]
+      table_nm        = valuesL[ positionD['table_nm'] ]
       if len(table_nm) > 0:
          table_nm = table_nm.replace('_##', '')
 
       # Record
       #
       if table_nm in table_nmL:
-         
-         column_nm       = valuesL[ columnL.index('column_nm') ]
-         parameter_cd    = valuesL[ columnL.index('parameter_cd') ]
-         parameter_nm    = valuesL[ columnL.index('parameter_nm') ]
-         english_unit_tx = valuesL[ columnL.index('english_unit_tx') ]
-         head_1_tx       = valuesL[ columnL.index('head_1_tx') ]
-         gw_ref_cd       = valuesL[ columnL.index('gw_ref_cd') ]
-         gw_ref_nm       = valuesL[ columnL.index('gw_ref_nm') ]
+
+         column_nm       = valuesL[ positionD['column_nm'] ]
+         parameter_cd    = valuesL[ positionD['parameter_cd'] ]
+         parameter_nm    = valuesL[ positionD['parameter_nm'] ]
+         english_unit_tx = valuesL[ positionD['english_unit_tx'] ]
+         head_1_tx       = valuesL[ positionD['head_1_tx'] ]
+         gw_ref_cd       = valuesL[ positionD['gw_ref_cd'] ]
+         gw_ref_nm       = valuesL[ positionD['gw_ref_nm'] ]
 
          if column_nm not in codeInfoD:
             codeInfoD[column_nm] = {}
@@ -310,745 +275,1672 @@ def processDefinitions (table_nmL, service_rdbL):
 
 def processNwisFile (keyColumn, site_no, service_rdbL):
 
-   serviceL    = []
-   recordCount = 0
    message     = ''
    siteInfoL   = []
-   siteFlag    = 0
-   
+
    # Parse head lines
    #
-   while len(service_rdbL) > 0:
-         
-      Line = service_rdbL[0].strip("\n|\r")
-      del service_rdbL[0]
-      #print(Line)
+   lineIter    = iter(service_rdbL)
+   columnL, formatL = rdbHeader(lineIter)
+   if columnL is None:
+      message = "Missing header lines"
+      return message, siteInfoL
 
-      # Grab column names in header
-      #
-      if Line[0] != '#':
-         columnL = Line.split('\t')
-         break
+   # Check column names
+   #
+   if keyColumn not in columnL:
+      message = "Missing index column " + keyColumn
+      return message, siteInfoL
+
+   # Column positions resolved once for the file
+   #
+   keyIndex    = columnL.index(keyColumn)
+   Record      = recordClass(columnL)
+
+   # Parse data lines of the site's block
+   #
+   for valuesL in rdbSiteRows(lineIter, keyIndex, site_no):
+
+      if len(valuesL) < len(columnL):
+         message  = "Parsing issue for column %s " % columnL[len(valuesL)]
+         message += "Unable to parse %s" % "\t".join(valuesL)
+         return message, siteInfoL
+
+      siteInfoL.append(Record(valuesL))
+
+   return message, siteInfoL
+
+# =============================================================================
+
+def processNwisSites (keyColumn, siteL, service_rdbL):
+
+   message     = ''
+   siteInfoD   = {}
+   columnL     = None
 
-   # Format line in header section
+   # Requested sites in file order
    #
-   del service_rdbL[0]
+   siteL       = sorted(set(siteL))
+   siteIndex   = 0
+
+   # Parse head lines
+   #
+   lineIter    = iter(service_rdbL)
+   columnL, formatL = rdbHeader(lineIter)
+   if columnL is None:
+      message = "Missing header lines"
+      return message, siteInfoD
 
    # Check column names
    #
    if keyColumn not in columnL:
       message = "Missing index column " + keyColumn
-      return message, serviceD
+      return message, siteInfoD
 
-   # Parse data lines
+   keyIndex    = columnL.index(keyColumn)
+   Record      = recordClass(columnL)
+
+   # Merge-join the sorted data lines against the sorted site list
    #
-   while len(service_rdbL) > 0:
+   for valuesL in rdbRows(lineIter):
 
-      Line = service_rdbL[0].strip("\n|\r")
-      del service_rdbL[0]
+      indexSite = valuesL[ keyIndex ]
 
-      valuesL = Line.split('\t')
+      while siteIndex < len(siteL) and siteL[siteIndex] < indexSite:
+         siteIndex += 1
 
-      indexSite = str(valuesL[ columnL.index(keyColumn) ])
+      if siteIndex >= len(siteL):
+         break
 
       # Check site
       #
-      if indexSite == site_no:
-
-         recordD  = {}
-         siteFlag = 1
-      
-         for column in columnL:
-   
-            try:
-               indexValue      = valuesL[ columnL.index(column) ]
-               recordD[column] = indexValue
-            except ValueError:
-               message  = "Parsing issue for column %s " % column
-               message += "Unable to parse %s" % Line
-               return message, siteInfoD
+      if indexSite == siteL[siteIndex]:
+
+         if len(valuesL) != len(columnL):
+            message  = "Parsing issue for site %s " % indexSite
+            message += "Unable to parse %s" % "\t".join(valuesL)
+            return message, siteInfoD
 
-         # Check for sites with no valid location
-         #
          if indexSite not in siteInfoD:
             siteInfoD[indexSite] = []
-                  
-         siteInfoL.append(recordD)
-         
-      else:
-         if siteFlag > 0:
-            break
 
-   return message, siteInfoL
+         siteInfoD[indexSite].append(Record(valuesL))
+
+   return message, siteInfoD
 
 # =============================================================================
-def get_max_min(min_value, max_value):
- 
-    factor         = 0.01 
-    interval_shift = 0.67;
-    delta          = max_value - min_value
- 
-    interval       = factor; 
-    delta          = delta / 5.0; 
-     
-    # Determine interval 
-    # 
-    while delta > factor:
-        if delta <= (factor * 1):
-            interval = factor * 1
-        elif (delta <= (factor * 2)):
-            interval = factor * 2
-        elif (delta <= (factor * 2.5)):
-            if (factor < 10.0):
-                interval = factor * 2
-            else :
-                interval = factor * 2.5
-        elif (delta <= (factor * 5)):
-            interval = factor * 5
-        else:
-            interval = factor * 10 
-        factor = factor * 10 
-     
-    # Maximum 
-    # 
-    factor = int(max_value / interval)
-    value  = factor * interval
-    if(max_value > value ):
-        value = (factor + 1) * interval; 
- 
-    if(abs(max_value - value) <= interval_shift * interval):
-       max_value = value + interval
-    else:
-	    max_value = value
-     
-    # Minimum 
-    # 
-    factor = int(min_value / interval)
-    value  = int(factor * interval)
-    #print("Min",min_value,"Value",value,"Factor",factor)
-    if(min_value < value ):
-        value = (factor - 1) * interval; 
-    #print("Min",min_value,"Value",value,"Factor",factor,"shift",interval_shift * interval)
- 
-    if(abs(min_value - value) <= interval_shift * interval):
-	    min_value = value - interval
-    else:
-	    min_value = value
-     
-    return min_value,max_value,interval
+
+def processNwisGroups (keyColumn, service_rdbL):
+
+   # Parse head lines
+   #
+   lineIter    = iter(service_rdbL)
+   columnL, formatL = rdbHeader(lineIter)
+   if columnL is None or keyColumn not in columnL:
+      return
+
+   keyIndex    = columnL.index(keyColumn)
+   Record      = recordClass(columnL)
+
+   # Yield the records of each site in file order
+   #
+   groupSite   = None
+   siteInfoL   = []
+   for valuesL in rdbRows(lineIter):
+
+      indexSite = valuesL[ keyIndex ]
+
+      if indexSite != groupSite:
+         if groupSite is not None:
+            yield groupSite, siteInfoL
+         groupSite = indexSite
+         siteInfoL = []
+
+      siteInfoL.append(Record(valuesL))
+
+   if groupSite is not None:
+      yield groupSite, siteInfoL
 
 # =============================================================================
+# =============================================================================
 
-# ----------------------------------------------------------------------
-# -- Main program
-# ----------------------------------------------------------------------
-well_lookup_file = "data/well_construction_lookup.json"
-aqfr_lookup_file = "data/aqfr_cd_query.txt"
-gw_gwdd_file     = "data/gw_gwdd.txt"
-sitefile_file    = "data/sitefile_01.txt"
-siteInfoD        = {}
-message          = ''
-table_nmL        =  ['sitefile', 'gw_cons', 'gw_hole', 'gw_csng', 'gw_open', 'gw_geoh', 'gw_repr']
-# https://staging-or.water.usgs.gov/cgi-bin/harney/requestGwChange.py?seasonOne=2001-01-01,20011-03-31,Min&seasonTwo=2020-01-01,20201-03-31,Min
-
-# Read
-#
-if os.path.exists(well_lookup_file):
+def readAqfrCode (aqfr_lookup_file, aqfr_cd):
 
-   # Open file
+   # Lines holding the code from the code index, or the whole file when the
+   #  index is missing or older than the file
    #
-   fh = open(well_lookup_file, 'r')
-   if fh is None:
-      message = "Can not open file %s" % well_lookup_file
-      print("Content-type:application/json\n\n")
-      print('{ "message": "%s" }' % message)
-      sys.exit()
+   timer = wellConstructionProfile.phaseStart('lookup_aqfr')
 
-   contentL = fh.readlines()
+   countD   = {'lines': 0, 'bytes': 0}
 
-   fh.close()
+   message, contentL = readSiteBlock(aqfr_lookup_file, aqfr_cd, 'aqfr_cd')
+   if contentL is None:
+      fh = open(aqfr_lookup_file, 'r')
+      message, aqfrInfoD = processAqfrCodes(rdbLines(fh, countD))
+      fh.close()
+   else:
+      message, aqfrInfoD = processAqfrCodes(rdbLines(contentL, countD))
 
-   if len(contentL) > 0:
-      message, DefinitionsD, ImageInfoD = jsonDefinitions(contentL)
+   wellConstructionProfile.phaseEnd(timer, lines=countD['lines'], bytes=countD['bytes'], records=1 if aqfr_cd in aqfrInfoD else 0)
 
-      if len(message) > 0:
-         print("Content-type:application/json\n\n")
-         print('{ "message": "%s" }' % message)
-         sys.exit()
-
-      if len(DefinitionsD) < 1:
-         message = 'No definitions found in file ' + well_lookup_file
-         print("Content-type:application/json\n\n")
-         print('{ "message": "%s" }' % message)
-         sys.exit()
-
-      #print(DefinitionsD)
-      #message = json.dumps(DefinitionsD,indent=2)
-      #print("Content-type:application/json\n\n")
-      #print('{ "message": "%s" }' % message)
-      #sys.exit()
-   
+   return aqfrInfoD.get(aqfr_cd)
+
+# =============================================================================
+
+def readCoopSites (key, keyColumn, data_dir=data_dir):
+
+   message   = ''
+   siteL     = None
+   coop_file = os.path.join(data_dir, "gw_coop_01.txt")
+
+   timer = wellConstructionProfile.phaseStart('lookup_coop')
+
+   # Prebuilt key index or key table
+   #
+   if backend == 'sqlite':
+      siteL = wellConstructionDatabase.readKeySites(data_dir, key, keyColumn)
+      if siteL is None:
+         message = "Missing table gw_coop_keys in database %s" % wellConstructionDatabase.database_name
+         return message, []
    else:
-      print("Content-type:application/json\n\n")
-      print('{ "message": "%s" }' % message)
-      sys.exit()
-   
-else:
-   message = "Can not open file %s" % well_lookup_file
-   print("Content-type:application/json\n\n")
-   print('{ "message": "%s" }' % message)
-   sys.exit()
+      siteL = readKeySites(coop_file, key, keyColumn)
 
-# Read
-#
-if os.path.exists(aqfr_lookup_file):
+   # Scan without a current index
+   #
+   if siteL is None:
+      if not os.path.exists(coop_file):
+         message = "Can not open table gw_coop"
+         return message, []
+
+      siteL     = []
+      columnL   = None
+      lineCount = 0
+      indexKey  = coopKey(key)
+
+      fh = open(coop_file, 'r')
+      for Line in fh:
+         lineCount += 1
+         if Line[0] == '#':
+            continue
+         valuesL = Line.strip("\n|\r").split('\t')
+         if columnL is None:
+            columnL = valuesL
+            if keyColumn not in columnL:
+               fh.close()
+               message = "Missing column %s in table gw_coop" % keyColumn
+               return message, []
+            keyIndex  = columnL.index(keyColumn)
+            siteIndex = columnL.index('site_no')
+            fh.readline()
+            continue
+         if len(valuesL) > keyIndex and coopKey(valuesL[keyIndex]) == indexKey and valuesL[siteIndex] not in siteL:
+            siteL.append(valuesL[siteIndex])
+      fh.close()
+
+      siteL.sort()
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteL))
+
+   return message, siteL
 
-   # Open file
+# =============================================================================
+
+def requestSiteNumbers (params, data_dir=data_dir):
+
+   # Sites requested by site_no or else by cooperator well log or
+   #  registration numbers
    #
-   fh = open(aqfr_lookup_file, 'r')
-   if fh is None:
-      message = "Can not open file %s" % aqfr_lookup_file
-      print("Content-type:application/json\n\n")
-      print('{ "message": "%s" }' % message)
-      sys.exit()
+   site_no = params.get('site_no', '')
+   if len(site_no) > 0:
+      return '', site_no
+
+   for myParm in coopParmD:
+      keyL = [x for x in params.get(myParm, '').split(',') if len(coopKey(x)) > 0]
+      if len(keyL) < 1:
+         continue
+
+      siteL = []
+      for key in keyL:
+         message, keySiteL = readCoopSites(key, coopParmD[myParm], data_dir)
+         if len(message) > 0:
+            return message, ''
+         siteL.extend([x for x in keySiteL if x not in siteL])
 
-   contentL = fh.readlines()
+      if len(siteL) < 1:
+         message = "No NWIS site found for %s %s" % (myParm, ",".join([coopKey(x) for x in keyL]))
+         return message, ''
 
-   fh.close()
+      return '', ",".join(siteL)
 
-   if len(contentL) > 0:
-      message, aqfrInfoD = processAqfrCodes(contentL)
+   return '', site_no
 
-      if len(message) > 0:
-         print("Content-type:application/json\n\n")
-         print('{ "message": "%s" }' % message)
-         sys.exit()
-
-      if len(aqfrInfoD) < 1:
-         message = 'No definitions found in file ' + aqfr_lookup_file
-         print("Content-type:application/json\n\n")
-         print('{ "message": "%s" }' % message)
-         sys.exit()
-
-      #print(DefinitionsD)
-      #message = json.dumps(DefinitionsD,indent=2)
-      #print("Content-type:application/json\n\n")
-      #print('{ "message": "%s" }' % message)
-      #sys.exit()
-   
+# =============================================================================
+
+def requestIntervals (params, data_dir=data_dir):
+
+   # Range of depths below land surface or of elevations
+   #
+   mode      = 'depth' if len(params.get('depth', '')) > 0 else 'elevation'
+   try:
+      rangeL = [float(x.replace('\\', '')) for x in params[mode].split(',')]
+   except ValueError:
+      rangeL = []
+   if len(rangeL) not in (1, 2) or not all(math.isfinite(x) for x in rangeL):
+      message = "Requires a %s or a %s range as top,bottom" % (mode, mode)
+      return message, None
+
+   # Hole, casing and open intervals, or those requested
+   #
+   tableL    = list(intervalParmD.values())
+   if len(params.get('intervals', '')) > 0:
+      tableL = [intervalParmD[x] for x in params['intervals'].split(',') if x in intervalParmD]
+      if len(tableL) < 1:
+         message = "Intervals must be one or more of %s" % ",".join(intervalParmD.keys())
+         return message, None
+
+   timer     = wellConstructionProfile.phaseStart('intervals')
+   message, store = wellConstructionIntervals.openIntervalStore(data_dir, backend)
+   if len(message) > 0:
+      return message, None
+
+   siteD     = wellConstructionIntervals.queryIntervals(store, rangeL[0], rangeL[-1], mode, tableL)
+   wellConstructionProfile.phaseEnd(timer, records=sum(len(x) for x in siteD.values()))
+
+   return '', json.dumps({mode: [min(rangeL), max(rangeL)], 'sites': siteD})
+
+# =============================================================================
+
+def requestLithology (params, DefinitionsD, aqfrInfoD, data_dir=data_dir):
+
+   # Sites open to each requested aquifer or lithology code
+   #
+   timer     = wellConstructionProfile.phaseStart('lithology')
+   message, store = wellConstructionLithology.openLithologyStore(data_dir, backend)
+   if len(message) > 0:
+      return message, None
+
+   resultD   = {}
+   postings  = 0
+   for column in wellConstructionLithology.lith_columnL:
+      codeL = [x.replace('\\', '') for x in params.get(column, '').split(',') if len(x) > 0]
+      if len(codeL) < 1:
+         continue
+
+      resultD[column] = {}
+      for code in codeL:
+         description = ''
+         if column == 'lith_unit_cd':
+            description = aqfrInfoD.get(code, '')
+         else:
+            description = DefinitionsD.get('lith_cd', {}).get('Codes', {}).get(code, '')
+
+         siteL = wellConstructionLithology.querySites(store, column, code)
+         resultD[column][code] = {'description': description, 'sites': siteL}
+         postings += len(siteL)
+
+   wellConstructionProfile.phaseEnd(timer, records=postings)
+
+   return '', json.dumps(resultD)
+
+# =============================================================================
+
+def requestSpatial (params, data_dir=data_dir):
+
+   # Wells within a box given as west,south,east,north or nearest to a
+   #  point given as lat,lon
+   #
+   mode      = 'bbox' if len(params.get('bbox', '')) > 0 else 'near'
+   try:
+      valueL = [float(x.replace('\\', '')) for x in params[mode].split(',')]
+   except ValueError:
+      valueL = []
+   if not all(math.isfinite(x) for x in valueL):
+      valueL = []
+
+   # Latitudes and longitudes of each form
+   #
+   if mode == 'bbox':
+      latL, lonL = valueL[1::2], valueL[0::2]
    else:
-      print("Content-type:application/json\n\n")
-      print('{ "message": "%s" }' % message)
-      sys.exit()
-   
-else:
-   message = "Can not open file %s" % aqfr_lookup_file
-   print("Content-type:application/json\n\n")
-   print('{ "message": "%s" }' % message)
-   sys.exit()
+      latL, lonL = valueL[0:1], valueL[1:2]
+
+   if mode == 'bbox' and (len(valueL) != 4 or valueL[1] > valueL[3]):
+      message = "Requires a bbox as west,south,east,north"
+      return message, None
+   if mode == 'near' and len(valueL) != 2:
+      message = "Requires a near point as lat,lon"
+      return message, None
+   if any(abs(x) > 90.0 for x in latL) or any(abs(x) > 180.0 for x in lonL):
+      message = "Requires latitudes between -90 and 90 and longitudes between -180 and 180"
+      return message, None
+
+   k         = near_k
+   if len(params.get('k', '')) > 0:
+      try:
+         k = int(params['k'])
+      except ValueError:
+         k = 0
+      if k < 1 or k > near_max:
+         message = "Requires k between 1 and %d" % near_max
+         return message, None
+
+   timer     = wellConstructionProfile.phaseStart('spatial')
+   message, store = wellConstructionSpatial.openSpatialStore(data_dir, backend)
+   if len(message) > 0:
+      return message, None
+
+   if mode == 'bbox':
+      siteL  = wellConstructionSpatial.queryBox(store, *valueL)
+      resultD = {'bbox': valueL, 'sites': siteL}
+   else:
+      siteL  = wellConstructionSpatial.queryNearest(store, valueL[0], valueL[1], k)
+      resultD = {'near': valueL, 'k': k, 'sites': siteL}
+   wellConstructionProfile.phaseEnd(timer, records=len(siteL))
+
+   return '', json.dumps(resultD)
+
+# =============================================================================
+
+def loadLookups (data_dir=data_dir):
+
+   message          = ''
+   DefinitionsD     = {}
+   ImageInfoD       = {}
+   aqfrInfoD        = {}
+
+   well_lookup_file = os.path.join(data_dir, "well_construction_lookup.json")
+   aqfr_lookup_file = os.path.join(data_dir, "aqfr_cd_query.txt")
+
+   # Read
+   #
+   if os.path.exists(well_lookup_file):
+
+      timer = wellConstructionProfile.phaseStart('lookup_definitions')
 
-# Read
-#
-for file in table_nmL:
-   
-   nwis_file = os.path.join("data", "".join([file, "_01.txt"]))
-   if os.path.exists(nwis_file):
-   
       # Open file
       #
-      fh = open(nwis_file, 'r')
+      fh = open(well_lookup_file, 'r')
       if fh is None:
-         message = "Can not open sitefile file %s" % nwis_file
-         print("Content-type:application/json\n\n")
-         print('{ "message": "%s" }' % message)
-         sys.exit()
+         message = "Can not open file %s" % os.path.basename(well_lookup_file)
+         return message, DefinitionsD, ImageInfoD, aqfrInfoD
 
       contentL = fh.readlines()
-   
+
       fh.close()
-   
+
       if len(contentL) > 0:
-         message, nwisInfoD = processNwisFile("site_no", site_no, contentL)
-   
+         message, DefinitionsD, ImageInfoD = jsonDefinitions(contentL)
+
+         wellConstructionProfile.phaseEnd(timer, lines=len(contentL), bytes=sum(len(x) for x in contentL), records=len(DefinitionsD))
+
          if len(message) > 0:
-            print("Content-type:application/json\n\n")
-            print('{ "message": "%s" }' % message)
-            sys.exit()
-   
-         if len(nwisInfoD) > 0:
-            siteInfoD[file] = nwisInfoD
-         elif len(nwisInfoD) < 1 and file == "sitefile":
-            print("Content-type:application/json\n\n")
-            print('{ "message": "%s" }' % ("Site %s missing information in %s file" % (site_no, nwis_file)))
-            sys.exit()
-         elif len(nwisInfoD) < 1 and file == "gw_cons":
-            print("Content-type:application/json\n\n")
-            print('{ "message": "%s" }' % ("Site %s missing well construction information" % site_no))
-            sys.exit()
-      
+            return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+         if len(DefinitionsD) < 1:
+            message = 'No definitions found in file ' + os.path.basename(well_lookup_file)
+            return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
       else:
-         print("Content-type:application/json\n\n")
-         print('{ "message": "%s" }' % message)
-         sys.exit()
-   
+         message = "Empty file %s" % os.path.basename(well_lookup_file)
+         return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
    else:
-      message = "Can not open file %s" % nwis_file
-      print("Content-type:application/json\n\n")
-      print('{ "message": "%s" }' % message)
-      sys.exit()
+      message = "Can not open file %s" % os.path.basename(well_lookup_file)
+      return message, DefinitionsD, ImageInfoD, aqfrInfoD
 
-#print(json.dumps(siteInfoD['sitefile'],indent=2))
+   # Look up aquifer codes on demand from the database
+   #
+   if backend == 'sqlite':
+      db_file = wellConstructionDatabase.databaseFileName(data_dir)
+      if not os.path.exists(db_file):
+         message = "Can not open database %s" % os.path.basename(db_file)
+         return message, DefinitionsD, ImageInfoD, aqfrInfoD
 
-# Prepare output
-# -------------------------------------------------
-#
-y_max         = -999999999999999.99
-y_min         =  999999999999999.99
+      aqfrInfoD = LazyCodes(lambda aqfr_cd: wellConstructionDatabase.readAqfrCode(data_dir, aqfr_cd))
 
-elevation_max = None
-elevation_min = None
+      return message, DefinitionsD, ImageInfoD, aqfrInfoD
 
-depth_max     = None
-depth_min     =  0.0
+   # Look up aquifer codes on demand through the code index
+   #
+   message, contentL = readSiteBlock(aqfr_lookup_file, '', 'aqfr_cd')
+   if contentL is not None:
+      aqfrInfoD = LazyCodes(lambda aqfr_cd: readAqfrCode(aqfr_lookup_file, aqfr_cd))
 
-land_surface  = 0.0
+      return message, DefinitionsD, ImageInfoD, aqfrInfoD
 
-dia_max       = None
-dia_min       =  0.0
+   # Read
+   #
+   if os.path.exists(aqfr_lookup_file):
 
-# Process sitefile records
-#
-siteD = {}
-alt_datum_cd = ""
+      timer = wellConstructionProfile.phaseStart('lookup_aqfr')
 
-if 'sitefile' in siteInfoD:
-   recordD = {}
-   for record in siteInfoD['sitefile']:
-      alt_va = record['alt_va']
-      try:
-         land_surface  = float(alt_va)
-         elevation_max = land_surface
-      except:
-         land_surface  = 0.0
-         elevation_max = land_surface
-   
-      alt_datum_cd = record['alt_datum_cd']
-   
-      well_depth   = record['well_depth_va']
-      try:
-         depth_max  = float(well_depth)
-      except:
-         nothing       = 'nothing'
-   
-      hole_depth    = record['hole_depth_va']
-      try:
-         holeDepth  = float(hole_depth)
-         if depth_max is None:
-            depth_max  = holeDepth
+      # Open file
+      #
+      fh = open(aqfr_lookup_file, 'r')
+      if fh is None:
+         message = "Can not open file %s" % os.path.basename(aqfr_lookup_file)
+         return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+      countD = {'lines': 0, 'bytes': 0}
+
+      message, aqfrInfoD = processAqfrCodes(rdbLines(fh, countD))
+
+      fh.close()
+
+      if countD['lines'] > 0:
+         wellConstructionProfile.phaseEnd(timer, lines=countD['lines'], bytes=countD['bytes'], records=len(aqfrInfoD))
+
+         if len(message) > 0:
+            return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+         if len(aqfrInfoD) < 1:
+            message = 'No definitions found in file ' + os.path.basename(aqfr_lookup_file)
+            return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+      else:
+         message = "Empty file %s" % os.path.basename(aqfr_lookup_file)
+         return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+   else:
+      message = "Can not open file %s" % os.path.basename(aqfr_lookup_file)
+      return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+   return message, DefinitionsD, ImageInfoD, aqfrInfoD
+
+# =============================================================================
+
+def readSiteInfo (site_no, data_dir=data_dir):
+
+   message          = ''
+   siteInfoD        = {}
+
+   # Indexed queries against the database
+   #
+   if backend == 'sqlite':
+      message, sitesInfoD, siteMessageD = readSitesInfo([site_no], data_dir)
+      if len(message) > 0:
+         return message, siteInfoD
+      if site_no in siteMessageD:
+         return siteMessageD[site_no], siteInfoD
+      return message, sitesInfoD[site_no]
+
+   # Read
+   #
+   for file in table_nmL:
+
+      nwis_file = os.path.join(data_dir, "".join([file, "_01.txt"]))
+      if os.path.exists(nwis_file):
+
+         timer = wellConstructionProfile.phaseStart('read_%s' % file)
+
+         # Read the site rows from the compiled column store
+         #
+         message, nwisInfoD = readSiteColumns(file, site_no, data_dir, nwis_file)
+         if len(message) > 0:
+            return message, siteInfoD
+
+         if nwisInfoD is not None:
+            wellConstructionProfile.phaseEnd(timer, records=len(nwisInfoD))
+            if len(nwisInfoD) > 0:
+               siteInfoD[file] = nwisInfoD
+            elif file == "gw_cons":
+               message = "Site %s missing well construction information" % site_no
+               return message, siteInfoD
+            continue
+
+         # Seek to the site block using the site_no offset index
+         #
+         message, contentL = readSiteBlock(nwis_file, site_no)
+         if len(message) > 0:
+            return message, siteInfoD
+
+         if contentL is not None:
+            wellConstructionProfile.phaseEnd(timer, bytes=sum(len(x) for x in contentL))
          else:
-            if holeDepth > depth_max:
-               depth_max  = holeDepth
-      except:
-         nothing       = 'nothing'
+            wellConstructionProfile.phaseEnd(timer)
 
-   siteD = record
-         
-else:
-   message = "Site %s not found in NWIS" % site_no
-   print(message)
-   sys.exit()   
+         # Scan the site block, or stream the file up to the end of the
+         #  site's block when the index is missing or out of date
+         #
+         timer  = wellConstructionProfile.phaseStart('scan_%s' % file)
+         countD = {'lines': 0, 'bytes': 0}
 
-# Process seal records
-#
-geohD = {}
-if 'gw_geoh' in siteInfoD:
-
-   for record in siteInfoD['gw_geoh']:
-      geoh             = True
-      geoh_seq_nu      = int(record['geoh_seq_nu'])
-      lith_cd          = record['lith_cd']
-      lith_top_va      = record['lith_top_va']
-      lith_bottom_va   = record['lith_bottom_va']
-      lith_unit_cd     = record['lith_unit_cd']
-      
-      try:
-         lith_top_va   = float(record['lith_top_va'])
-         if lith_top_va > depth_max:
-            depth_max = lith_top_va
-      except:
-         lith_top_va   = None          
-      
-      try:
-         lith_bottom_va   = float(record['lith_bottom_va'])
-         if lith_bottom_va > depth_max:
-            depth_max = lith_bottom_va
-      except:
-         lith_bottom_va   = None
+         if contentL is None:
 
-      # Valid record
-      #
-      if geoh_seq_nu not in recordD:
-         geohD[geoh_seq_nu] = {}
-   
-      geohD[geoh_seq_nu]['lith_cd']        = lith_cd
-      geohD[geoh_seq_nu]['lith_top_va']    = lith_top_va
-      geohD[geoh_seq_nu]['lith_bottom_va'] = lith_bottom_va
-      geohD[geoh_seq_nu]['lith_unit_cd']   = lith_unit_cd
-      geohD[geoh_seq_nu]['lith_ds']        = ''
-      geohD[geoh_seq_nu]['image']          = ''
-      geohD[geoh_seq_nu]['lith_unit_ds']   = ''
-      if len(lith_cd) > 0:
-         geohD[geoh_seq_nu]['lith_ds'] = DefinitionsD['lith_cd']['Codes'][lith_cd]
-         if 'lith_cd' in ImageInfoD:
-            geohD[geoh_seq_nu]['image'] = ImageInfoD['lith_cd'][lith_cd]
-      if len(lith_unit_cd) > 0:
-         geohD[geoh_seq_nu]['lith_unit_ds'] = aqfrInfoD[lith_unit_cd]
-         if len(geohD[geoh_seq_nu]['image']) < 1:
-            geohD[geoh_seq_nu]['image'] = '000.svg'
-
-# Process seal records
-#
-wellD = {}
-if 'gw_cons' in siteInfoD:
-
-   myColumns = ['cons_src_cd', 'seal_cd', 'seal_ds', 'seal_depth_va', 'finish_cd', 'finish_ds']
-   
-   for record in siteInfoD['gw_cons']:
-
-      cons_seq_nu      = int(record['cons_seq_nu'])
-      cons_src_cd      = record['cons_src_cd']
-      seal_cd          = record['seal_cd']
-      finish_cd        = record['finish_cd']
-      
-      try:
-         seal_depth_va = float(record['seal_depth_va'])
-         if seal_depth_va > depth_max:
-            depth_max = seal_depth_va
-      except:
-         seal_depth_va = record['seal_depth_va']
+            # Open file
+            #
+            fh = open(nwis_file, 'r')
+            if fh is None:
+               message = "Can not open table %s" % file
+               return message, siteInfoD
 
-      # Valid record
-      #
-      recordD                  = {}
-      recordD['cons_seq_nu']   = cons_seq_nu
-      recordD['seal_depth_va'] = seal_depth_va
-      recordD['cons_src_cd']   = cons_src_cd
-      recordD['finish_cd']     = finish_cd
-      recordD['finish_ds']     = ''
-      if len(finish_cd) > 0:
-         recordD['finish_ds'] = DefinitionsD['finish_cd']['Codes'][finish_cd]
-      recordD['seal_cd']       = seal_cd
-      recordD['seal_ds']       = ''
-      recordD['seal_cl']       = ''
-      if len(seal_cd) > 0:
-         recordD['seal_ds'] = DefinitionsD['seal_cd']['Codes'][seal_cd]
-         if 'seal_cd' in ImageInfoD:
-            recordD['seal_cl'] = ImageInfoD['seal_cd'][seal_cd]
-   
-      if cons_seq_nu not in wellD:
-         wellD[cons_seq_nu] = {}
-      if 'gw_cons' not in wellD[cons_seq_nu]:
-         wellD[cons_seq_nu]['gw_cons'] = {}
-      wellD[cons_seq_nu]['gw_cons'] = recordD
-
-# Process hole records
-#
-myHoleFields = [
-                'cons_seq_nu',
-                'hole_seq_nu',
-                'hole_top_va',
-                'hole_bottom_va',
-                'hole_dia_va'
-               ]
-
-if 'gw_hole' in siteInfoD:
-
-   for record in siteInfoD['gw_hole']:
-      hole             = True
-      cons_seq_nu    = int(record['cons_seq_nu'])
-      hole_seq_nu    = int(record['hole_seq_nu'])
-      try:
-         hole_dia_va      = float(record['hole_dia_va'])
-      except:
-         hole             = False          
-      try:
-         hole_top_va      = float(record['hole_top_va'])
-      except:
-         hole             = False          
-      try:
-         hole_bottom_va   = float(record['hole_bottom_va'])
-      except:
-         hole             = False          
+            message, nwisInfoD = processNwisFile("site_no", site_no, rdbLines(fh, countD))
 
-      # Valid record
-      #
-      if hole:
+            fh.close()
 
-         recordD                   = {}
-         recordD['cons_seq_nu']    = cons_seq_nu
-         recordD['hole_seq_nu']    = hole_seq_nu
-      
-         try:
-            hole_top_va = float(record['hole_top_va'])
-            if hole_top_va > depth_max:
-               depth_max = hole_top_va
-         except:
-            hole_top_va = record['hole_top_va']
-            
-         recordD['hole_top_va']    = hole_top_va
-      
-         try:
-            hole_bottom_va = float(record['hole_bottom_va'])
-            if hole_bottom_va > depth_max:
-               depth_max = hole_bottom_va
-         except:
-            hole_bottom_va = record['hole_bottom_va']
-            
-         recordD['hole_bottom_va']    = hole_bottom_va
-      
-         try:
-            hole_dia_va = float(record['hole_dia_va'])
-            if dia_max is None:
-               dia_max = hole_dia_va
-            if hole_dia_va > dia_max:
-               dia_max = hole_dia_va
-         except:
-            hole_dia_va = recordD['hole_dia_va']
-            
-         recordD['hole_dia_va']    = hole_dia_va
-   
-         if cons_seq_nu not in wellD:
-            wellD[cons_seq_nu] = {}
-         if 'gw_hole' not in wellD[cons_seq_nu]:
-            wellD[cons_seq_nu]['gw_hole'] = {}
-         if hole_seq_nu not in wellD[cons_seq_nu]['gw_hole']:
-            wellD[cons_seq_nu]['gw_hole'][hole_seq_nu] = {}
+         else:
+            message, nwisInfoD = processNwisFile("site_no", site_no, rdbLines(contentL, countD))
 
-         wellD[cons_seq_nu]['gw_hole'][hole_seq_nu] = recordD
+            # Bytes of the block already counted when it was read
+            #
+            countD['bytes'] = 0
 
-# Process casing records
-#
-myCsngFields = [
-                'cons_seq_nu',
-                'csng_seq_nu',
-                'csng_top_va',
-                'csng_bottom_va',
-                'csng_material_cd',
-                'csng_thick_va',
-                'csng_dia_va'
-               ]
-
-if 'gw_csng' in siteInfoD:
-
-   for record in siteInfoD['gw_csng']:
-      csng             = True
-      cons_seq_nu      = int(record['cons_seq_nu'])
-      csng_seq_nu      = int(record['csng_seq_nu'])
-      csng_material_cd = record['csng_material_cd']
-      
-      try:
-         csng_dia_va      = float(record['csng_dia_va'])
-      except:
-         csng             = False          
-      try:
-         csng_top_va      = float(record['csng_top_va'])
-      except:
-         csng             = False          
-      try:
-         csng_bottom_va   = float(record['csng_bottom_va'])
-      except:
-         csng             = False          
+         wellConstructionProfile.phaseEnd(timer, lines=countD['lines'], bytes=countD['bytes'], records=len(nwisInfoD))
 
-      # Valid record
-      #
-      if csng:
-   
-         recordD                     = {}
-         recordD['cons_seq_nu']      = cons_seq_nu
-         recordD['csng_seq_nu']      = csng_seq_nu
-         recordD['csng_top_va']      = csng_top_va
-         recordD['csng_bottom_va']   = csng_bottom_va
-         recordD['csng_dia_va']      = csng_dia_va
-         recordD['csng_material_cd'] = csng_material_cd
-         recordD['csng_material_ds'] = ''
-         recordD['csng_material_cl'] = ''
-         if len(csng_material_cd) > 0:
-            recordD['csng_material_ds']    = DefinitionsD['csng_material_cd']['Codes'][csng_material_cd]
-            if 'csng_material_cd' in ImageInfoD:
-               recordD['csng_material_cl'] = ImageInfoD['csng_material_cd'][csng_material_cd]
-   
-         if cons_seq_nu not in wellD:
-            wellD[cons_seq_nu] = {}
-         if 'gw_csng' not in wellD[cons_seq_nu]:
-            wellD[cons_seq_nu]['gw_csng'] = {}
-         if csng_seq_nu not in wellD[cons_seq_nu]['gw_csng']:
-            wellD[cons_seq_nu]['gw_csng'][csng_seq_nu] = {}
+         if countD['lines'] < 1:
+            message = "Empty table %s" % file
+            return message, siteInfoD
 
-         wellD[cons_seq_nu]['gw_csng'][csng_seq_nu] = recordD
+         if len(message) > 0:
+            return message, siteInfoD
 
-         if csng_bottom_va > depth_max:
-            depth_max = open_bottom_va
-   
-         try:
-            dia = float(csng_dia_va)
-            if dia_max is None:
-               dia_max = dia
-            if dia > dia_max:
-               dia_max = dia
-         except:
-            nothing = "nothing"
-    
-# Process open interval records
-#
-myOpenFields = [
-                'cons_seq_nu',
-                'open_seq_nu',
-                'open_top_va',
-                'open_bottom_va',
-                'open_material_cd',
-                'open_cd',
-                'open_dia_va'
-               ]
-
-if 'gw_open' in siteInfoD:
-
-   for record in siteInfoD['gw_open']:
-      opens            = True
-      cons_seq_nu      = int(record['cons_seq_nu'])
-      open_seq_nu      = int(record['open_seq_nu'])
-      open_cd          = record['open_cd']
-      open_material_cd = record['open_material_cd']
-      
-      try:
-         open_dia_va      = float(record['open_dia_va'])
-      except:
-         opens            = False          
-      try:
-         open_top_va      = float(record['open_top_va'])
-      except:
-         opens            = False          
-      try:
-         open_bottom_va   = float(record['open_bottom_va'])
-      except:
-         opens            = False          
-      
-      # Valid record
-      #
-      if opens:
-   
-         recordD                     = {}
-         recordD['cons_seq_nu']      = cons_seq_nu
-         recordD['open_seq_nu']      = open_seq_nu
-         recordD['open_top_va']      = open_top_va
-         recordD['open_bottom_va']   = open_bottom_va
-         recordD['open_dia_va']      = open_dia_va
-         recordD['open_material_cd'] = open_material_cd
-         recordD['open_cd']          = open_cd
-         recordD['open_ds']          = ''
-         recordD['image']            = ''
-         if len(open_cd) > 0:
-            recordD['open_ds'] = DefinitionsD['open_cd']['Codes'][open_cd]
-            if 'open_cd' in ImageInfoD:
-               recordD['image'] = ImageInfoD['open_cd'][open_cd]
-   
-         if cons_seq_nu not in wellD:
-            wellD[cons_seq_nu] = {}
-         if 'gw_open' not in wellD[cons_seq_nu]:
-            wellD[cons_seq_nu]['gw_open'] = {}
-         if open_seq_nu not in wellD[cons_seq_nu]['gw_open']:
-            wellD[cons_seq_nu]['gw_open'][open_seq_nu] = {}
+         if len(nwisInfoD) > 0:
+            siteInfoD[file] = nwisInfoD
+         elif file == "sitefile":
+            message = "Site %s missing information in table %s" % (site_no, file)
+            return message, siteInfoD
+         elif file == "gw_cons":
+            message = "Site %s missing well construction information" % site_no
+            return message, siteInfoD
 
-         wellD[cons_seq_nu]['gw_open'][open_seq_nu] = recordD
+      else:
+         message = "Can not open table %s" % file
+         return message, siteInfoD
 
-         if open_bottom_va > depth_max:
-            depth_max = open_bottom_va
-   
-         try:
-            dia = float(open_dia_va)
-            if dia_max is None:
-               dia_max = dia
-            if dia > dia_max:
-               dia_max = dia
-         except:
-            nothing = "nothing"
+   return message, siteInfoD
 
-# Output json
-# -------------------------------------------------
-#
-jsonL = []
-
-jsonL.append("{")
-jsonL.append('"sitefile":' + json.dumps(siteD) + ',')
-
-if len(geohD) > 0:
-   Geohs = []
-   for geoh_seq_nu in sorted(geohD.keys()):
-      Geohs.append(json.dumps(geohD[geoh_seq_nu]))
-   jsonL.append('"gw_geoh":' + '[' + ",".join(Geohs) + '],')
-
-jsonL.append('"well_construction":' + '{')
-
-Records = []
-
-for cons_seq_nu in sorted(wellD.keys()):
-
-   Record = []
-   
-   if 'gw_cons' in wellD[cons_seq_nu]:
-      Cons = json.dumps(wellD[cons_seq_nu]['gw_cons'])
-      
-      Record.append('"gw_cons":' + '[' + Cons + ']')
-      
-   if 'gw_hole' in wellD[cons_seq_nu]:
-      Holes = []
-      for seq_nu in wellD[cons_seq_nu]['gw_hole']:
-         Hole = wellD[cons_seq_nu]['gw_hole'][seq_nu]
-         Holes.append(json.dumps(Hole))
-
-      Record.append('"gw_hole":' + '[' + ",".join(Holes) + ']')
-      
-   if 'gw_csng' in wellD[cons_seq_nu]:
-      Cases = []
-      for seq_nu in wellD[cons_seq_nu]['gw_csng']:
-         Csng = wellD[cons_seq_nu]['gw_csng'][seq_nu]
-         Cases.append(json.dumps(Csng))
-
-      Record.append('"gw_csng":' + '[' + ",".join(Cases) + ']')
-      
-   if 'gw_open' in wellD[cons_seq_nu]:
-      Opens = []
-      for seq_nu in wellD[cons_seq_nu]['gw_open']:
-         Open = wellD[cons_seq_nu]['gw_open'][seq_nu]
-         Opens.append(json.dumps(Open))
-
-      Record.append('"gw_open":' + '[' + ",".join(Opens) + ']')
-
-   #Records.append(" { %s } " % ','.join(Record))
-   Records.append(" %s " % ','.join(Record))
-
-jsonL.append(','.join(Records))
-jsonL.append('},')
-
-if depth_max is None:
-   jsonL.append('"%s": %s,' % ( "y_max", "null"))
-else:
-   jsonL.append('"%s": %f,' % ( "y_max", float(depth_max)))
-if depth_min is None:
-   jsonL.append('"%s": %s,' % ( "y_min", "null"))
-else:
-   jsonL.append('"%s": %f,' % ( "y_min", float(depth_min)))
-if dia_max is None:
-   jsonL.append('"%s": %s,' % ( "dia_max", "null"))
-else:
-   jsonL.append('"%s": %f,' % ( "dia_max", float(dia_max)))
-jsonL.append('"%s": %f' % ( "land_surface", float(land_surface)))
-
-jsonL.append('}')
-
-# Output json
-# -------------------------------------------------
-#
-print("Content-type:application/json\n\n")
-print("".join(jsonL))
+# =============================================================================
 
-sys.exit()
+def readSitesTable (file, siteL, data_dir, nwis_file):
+
+   message          = ''
+   nwisInfoD        = {}
+
+   # Read the site rows from the compiled column store
+   #
+   for site_no in siteL:
+      message, siteInfoL = readSiteColumns(file, site_no, data_dir, nwis_file)
+      if len(message) > 0:
+         return message, nwisInfoD
+      if siteInfoL is None:
+         nwisInfoD = None
+         break
+      if len(siteInfoL) > 0:
+         nwisInfoD[site_no] = siteInfoL
+
+   # Otherwise one pass over the table
+   #
+   if nwisInfoD is None:
+      fh = open(nwis_file, 'r')
+      message, nwisInfoD = processNwisSites("site_no", siteL, fh)
+      fh.close()
+
+   return message, nwisInfoD
+
+# =============================================================================
+
+def readSitesInfo (siteL, data_dir=data_dir):
+
+   message          = ''
+   sitesInfoD       = {}
+   siteMessageD     = {}
+
+   for site_no in siteL:
+      sitesInfoD[site_no] = {}
+
+   # Read each table once for all sites
+   #
+   for file in table_nmL:
+
+      nwis_file = os.path.join(data_dir, "".join([file, "_01.txt"]))
+
+      timer     = wellConstructionProfile.phaseStart('read_%s' % file)
+
+      # Indexed query against the database
+      #
+      if backend == 'sqlite':
+         message, nwisInfoD = wellConstructionDatabase.readSiteRows(data_dir, file, siteL)
+
+      elif os.path.exists(nwis_file):
+         message, nwisInfoD = readSitesTable(file, siteL, data_dir, nwis_file)
+
+      else:
+         message = "Can not open table %s" % file
+
+      if len(message) > 0:
+         return message, sitesInfoD, siteMessageD
+
+      wellConstructionProfile.phaseEnd(timer, records=sum(len(x) for x in nwisInfoD.values()))
+
+      for site_no in siteL:
+         if site_no in nwisInfoD:
+            sitesInfoD[site_no][file] = nwisInfoD[site_no]
+         elif site_no in siteMessageD:
+            continue
+         elif file == "sitefile":
+            siteMessageD[site_no] = "Site %s missing information in table %s" % (site_no, file)
+         elif file == "gw_cons":
+            siteMessageD[site_no] = "Site %s missing well construction information" % site_no
+
+   return message, sitesInfoD, siteMessageD
+
+# =============================================================================
+
+def assembleWellConstruction (site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, extent=None):
+
+   message       = ''
+
+   # Prepare output
+   # -------------------------------------------------
+   #
+   y_max         = -999999999999999.99
+   y_min         =  999999999999999.99
+
+   elevation_max = None
+   elevation_min = None
+
+   land_surface  = 0.0
+
+   timer = wellConstructionProfile.phaseStart('assemble_sitefile')
+
+   # Process sitefile records
+   #
+   siteD = {}
+   alt_datum_cd = ""
+
+   if 'sitefile' in siteInfoD:
+      recordD = {}
+      for record in siteInfoD['sitefile']:
+         alt_va = record['alt_va']
+         try:
+            land_surface  = float(alt_va)
+            elevation_max = land_surface
+         except:
+            land_surface  = 0.0
+            elevation_max = land_surface
+
+         alt_datum_cd = record['alt_datum_cd']
+
+      siteD = dict(record)
+
+   else:
+      message = "Site %s not found in NWIS" % site_no
+      return message, None, None, None, None, None
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteInfoD.get('sitefile', [])))
+   timer = wellConstructionProfile.phaseStart('assemble_geoh')
+
+   # Process seal records
+   #
+   geohD = {}
+   if 'gw_geoh' in siteInfoD:
+
+      for record in siteInfoD['gw_geoh']:
+         geoh_seq_nu      = int(record['geoh_seq_nu'])
+         lith_cd          = record['lith_cd']
+         lith_top_va      = record['lith_top_va']
+         lith_bottom_va   = record['lith_bottom_va']
+         lith_unit_cd     = record['lith_unit_cd']
+
+         try:
+            lith_top_va   = float(record['lith_top_va'])
+         except:
+            lith_top_va   = None
+
+         try:
+            lith_bottom_va   = float(record['lith_bottom_va'])
+         except:
+            lith_bottom_va   = None
+
+         # Valid record
+         #
+         if geoh_seq_nu not in recordD:
+            geohD[geoh_seq_nu] = {}
+
+         geohD[geoh_seq_nu]['lith_cd']        = lith_cd
+         geohD[geoh_seq_nu]['lith_top_va']    = lith_top_va
+         geohD[geoh_seq_nu]['lith_bottom_va'] = lith_bottom_va
+         geohD[geoh_seq_nu]['lith_unit_cd']   = lith_unit_cd
+         geohD[geoh_seq_nu]['lith_ds']        = ''
+         geohD[geoh_seq_nu]['image']          = ''
+         geohD[geoh_seq_nu]['lith_unit_ds']   = ''
+         if len(lith_cd) > 0:
+            geohD[geoh_seq_nu]['lith_ds'] = DefinitionsD['lith_cd']['Codes'][lith_cd]
+            if 'lith_cd' in ImageInfoD:
+               geohD[geoh_seq_nu]['image'] = ImageInfoD['lith_cd'][lith_cd]
+         if len(lith_unit_cd) > 0:
+            geohD[geoh_seq_nu]['lith_unit_ds'] = aqfrInfoD[lith_unit_cd]
+            if len(geohD[geoh_seq_nu]['image']) < 1:
+               geohD[geoh_seq_nu]['image'] = '000.svg'
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteInfoD.get('gw_geoh', [])))
+   timer = wellConstructionProfile.phaseStart('assemble_cons')
+
+   # Process seal records
+   #
+   wellD = {}
+   if 'gw_cons' in siteInfoD:
+
+      for record in siteInfoD['gw_cons']:
+
+         cons_seq_nu      = int(record['cons_seq_nu'])
+         cons_src_cd      = record['cons_src_cd']
+         seal_cd          = record['seal_cd']
+         finish_cd        = record['finish_cd']
+
+         try:
+            seal_depth_va = float(record['seal_depth_va'])
+         except:
+            seal_depth_va = record['seal_depth_va']
+
+         # Valid record
+         #
+         recordD                  = {}
+         recordD['cons_seq_nu']   = cons_seq_nu
+         recordD['seal_depth_va'] = seal_depth_va
+         recordD['cons_src_cd']   = cons_src_cd
+         recordD['finish_cd']     = finish_cd
+         recordD['finish_ds']     = ''
+         if len(finish_cd) > 0:
+            recordD['finish_ds'] = DefinitionsD['finish_cd']['Codes'][finish_cd]
+         recordD['seal_cd']       = seal_cd
+         recordD['seal_ds']       = ''
+         recordD['seal_cl']       = ''
+         if len(seal_cd) > 0:
+            recordD['seal_ds'] = DefinitionsD['seal_cd']['Codes'][seal_cd]
+            if 'seal_cd' in ImageInfoD:
+               recordD['seal_cl'] = ImageInfoD['seal_cd'][seal_cd]
+
+         if cons_seq_nu not in wellD:
+            wellD[cons_seq_nu] = {}
+         if 'gw_cons' not in wellD[cons_seq_nu]:
+            wellD[cons_seq_nu]['gw_cons'] = {}
+         wellD[cons_seq_nu]['gw_cons'] = recordD
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteInfoD.get('gw_cons', [])))
+   timer = wellConstructionProfile.phaseStart('assemble_hole')
+
+   # Process hole records
+   #
+   if 'gw_hole' in siteInfoD:
+
+      for record in siteInfoD['gw_hole']:
+         hole             = True
+         cons_seq_nu    = int(record['cons_seq_nu'])
+         hole_seq_nu    = int(record['hole_seq_nu'])
+         try:
+            hole_dia_va      = float(record['hole_dia_va'])
+         except:
+            hole             = False
+         try:
+            hole_top_va      = float(record['hole_top_va'])
+         except:
+            hole             = False
+         try:
+            hole_bottom_va   = float(record['hole_bottom_va'])
+         except:
+            hole             = False
+
+         # Valid record
+         #
+         if hole:
+
+            recordD                   = {}
+            recordD['cons_seq_nu']    = cons_seq_nu
+            recordD['hole_seq_nu']    = hole_seq_nu
+
+            recordD['hole_top_va']    = hole_top_va
+            recordD['hole_bottom_va'] = hole_bottom_va
+            recordD['hole_dia_va']    = hole_dia_va
+
+            if cons_seq_nu not in wellD:
+               wellD[cons_seq_nu] = {}
+            if 'gw_hole' not in wellD[cons_seq_nu]:
+               wellD[cons_seq_nu]['gw_hole'] = {}
+            if hole_seq_nu not in wellD[cons_seq_nu]['gw_hole']:
+               wellD[cons_seq_nu]['gw_hole'][hole_seq_nu] = {}
+
+            wellD[cons_seq_nu]['gw_hole'][hole_seq_nu] = recordD
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteInfoD.get('gw_hole', [])))
+   timer = wellConstructionProfile.phaseStart('assemble_csng')
+
+   # Process casing records
+   #
+   if 'gw_csng' in siteInfoD:
+
+      for record in siteInfoD['gw_csng']:
+         csng             = True
+         cons_seq_nu      = int(record['cons_seq_nu'])
+         csng_seq_nu      = int(record['csng_seq_nu'])
+         csng_material_cd = record['csng_material_cd']
+
+         try:
+            csng_dia_va      = float(record['csng_dia_va'])
+         except:
+            csng             = False
+         try:
+            csng_top_va      = float(record['csng_top_va'])
+         except:
+            csng             = False
+         try:
+            csng_bottom_va   = float(record['csng_bottom_va'])
+         except:
+            csng             = False
+
+         # Valid record
+         #
+         if csng:
+
+            recordD                     = {}
+            recordD['cons_seq_nu']      = cons_seq_nu
+            recordD['csng_seq_nu']      = csng_seq_nu
+            recordD['csng_top_va']      = csng_top_va
+            recordD['csng_bottom_va']   = csng_bottom_va
+            recordD['csng_dia_va']      = csng_dia_va
+            recordD['csng_material_cd'] = csng_material_cd
+            recordD['csng_material_ds'] = ''
+            recordD['csng_material_cl'] = ''
+            if len(csng_material_cd) > 0:
+               recordD['csng_material_ds']    = DefinitionsD['csng_material_cd']['Codes'][csng_material_cd]
+               if 'csng_material_cd' in ImageInfoD:
+                  recordD['csng_material_cl'] = ImageInfoD['csng_material_cd'][csng_material_cd]
+
+            if cons_seq_nu not in wellD:
+               wellD[cons_seq_nu] = {}
+            if 'gw_csng' not in wellD[cons_seq_nu]:
+               wellD[cons_seq_nu]['gw_csng'] = {}
+            if csng_seq_nu not in wellD[cons_seq_nu]['gw_csng']:
+               wellD[cons_seq_nu]['gw_csng'][csng_seq_nu] = {}
+
+            wellD[cons_seq_nu]['gw_csng'][csng_seq_nu] = recordD
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteInfoD.get('gw_csng', [])))
+   timer = wellConstructionProfile.phaseStart('assemble_open')
+
+   # Process open interval records
+   #
+   if 'gw_open' in siteInfoD:
+
+      for record in siteInfoD['gw_open']:
+         opens            = True
+         cons_seq_nu      = int(record['cons_seq_nu'])
+         open_seq_nu      = int(record['open_seq_nu'])
+         open_cd          = record['open_cd']
+         open_material_cd = record['open_material_cd']
+
+         try:
+            open_dia_va      = float(record['open_dia_va'])
+         except:
+            opens            = False
+         try:
+            open_top_va      = float(record['open_top_va'])
+         except:
+            opens            = False
+         try:
+            open_bottom_va   = float(record['open_bottom_va'])
+         except:
+            opens            = False
+
+         # Valid record
+         #
+         if opens:
+
+            recordD                     = {}
+            recordD['cons_seq_nu']      = cons_seq_nu
+            recordD['open_seq_nu']      = open_seq_nu
+            recordD['open_top_va']      = open_top_va
+            recordD['open_bottom_va']   = open_bottom_va
+            recordD['open_dia_va']      = open_dia_va
+            recordD['open_material_cd'] = open_material_cd
+            recordD['open_cd']          = open_cd
+            recordD['open_ds']          = ''
+            recordD['image']            = ''
+            if len(open_cd) > 0:
+               recordD['open_ds'] = DefinitionsD['open_cd']['Codes'][open_cd]
+               if 'open_cd' in ImageInfoD:
+                  recordD['image'] = ImageInfoD['open_cd'][open_cd]
+
+            if cons_seq_nu not in wellD:
+               wellD[cons_seq_nu] = {}
+            if 'gw_open' not in wellD[cons_seq_nu]:
+               wellD[cons_seq_nu]['gw_open'] = {}
+            if open_seq_nu not in wellD[cons_seq_nu]['gw_open']:
+               wellD[cons_seq_nu]['gw_open'][open_seq_nu] = {}
+
+            wellD[cons_seq_nu]['gw_open'][open_seq_nu] = recordD
+
+   wellConstructionProfile.phaseEnd(timer, records=len(siteInfoD.get('gw_open', [])))
+
+   # Graph extents from the depth and diameter columns of all tables
+   #
+   if extent is None:
+      timer  = wellConstructionProfile.phaseStart('extents')
+      extent = wellExtents(siteInfoD)
+      wellConstructionProfile.phaseEnd(timer)
+
+   return message, siteD, geohD, wellD, extent, land_surface
+
+# =============================================================================
+
+def streamWellConstruction (site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, extent=None):
+
+   message, siteD, geohD, wellD, extent, land_surface = assembleWellConstruction(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, extent)
+   if len(message) > 0:
+      return message, None
+
+   depth_max, depth_min, dia_max = extent
+
+   return message, wellConstructionChunks(siteD, geohD, wellD, depth_max, depth_min, dia_max, land_surface)
+
+# =============================================================================
+
+def wellConstructionChunks (siteD, geohD, wellD, depth_max, depth_min, dia_max, land_surface):
+
+   # Output json
+   # -------------------------------------------------
+   #
+   yield "{"
+   yield '"sitefile":' + json.dumps(siteD) + ','
+
+   if len(geohD) > 0:
+      yield '"gw_geoh":' + '['
+      separator = ''
+      for geoh_seq_nu in sorted(geohD.keys()):
+         yield separator + json.dumps(geohD[geoh_seq_nu])
+         separator = ','
+      yield '],'
+
+   yield '"well_construction":' + '{'
+
+   recordSeparator = ''
+
+   for cons_seq_nu in sorted(wellD.keys()):
+
+      yield recordSeparator + ' '
+      recordSeparator = ','
+
+      separator = ''
+
+      if 'gw_cons' in wellD[cons_seq_nu]:
+         Cons = json.dumps(wellD[cons_seq_nu]['gw_cons'])
+
+         yield separator + '"gw_cons":' + '[' + Cons + ']'
+         separator = ','
+
+      for file in ['gw_hole', 'gw_csng', 'gw_open']:
+         if file in wellD[cons_seq_nu]:
+            yield separator + '"%s":' % file + '['
+            separator = ','
+            itemSeparator = ''
+            for seq_nu in wellD[cons_seq_nu][file]:
+               yield itemSeparator + json.dumps(wellD[cons_seq_nu][file][seq_nu])
+               itemSeparator = ','
+            yield ']'
+
+      yield ' '
+
+   yield '},'
+
+   if depth_max is None:
+      yield '"%s": %s,' % ( "y_max", "null")
+   else:
+      yield '"%s": %f,' % ( "y_max", float(depth_max))
+   if depth_min is None:
+      yield '"%s": %s,' % ( "y_min", "null")
+   else:
+      yield '"%s": %f,' % ( "y_min", float(depth_min))
+   if dia_max is None:
+      yield '"%s": %s,' % ( "dia_max", "null")
+   else:
+      yield '"%s": %f,' % ( "dia_max", float(dia_max))
+   yield '"%s": %f' % ( "land_surface", float(land_surface))
+
+   yield '}'
+
+# =============================================================================
+
+def buildWellConstruction (site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, extent=None):
+
+   message, chunkIter = streamWellConstruction(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, extent)
+   if len(message) > 0:
+      return message, None
+
+   return message, "".join(chunkIter)
+
+# =============================================================================
+
+def buildWellConstructionSvg (site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, embed=False):
+
+   message, siteD, geohD, wellD, extent, land_surface = assembleWellConstruction(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD)
+   if len(message) > 0:
+      return message, None
+
+   timer   = wellConstructionProfile.phaseStart('render_svg')
+   svgText = wellConstructionSvg.renderWellSvg(site_no, siteD, geohD, wellD, extent, land_surface, embed)
+   wellConstructionProfile.phaseEnd(timer, bytes=len(svgText))
+
+   return message, svgText
+
+# =============================================================================
+
+def inputFileList (data_dir=data_dir, source=None):
+
+   if source is None:
+      source = backend
+
+   fileL = [
+            os.path.join(data_dir, "well_construction_lookup.json"),
+            os.path.join(data_dir, "aqfr_cd_query.txt")
+           ]
+
+   if source == 'sqlite':
+      fileL.append(wellConstructionDatabase.databaseFileName(data_dir))
+   else:
+      fileL.extend([os.path.join(data_dir, "".join([file, "_01.txt"])) for file in table_nmL])
+
+   return fileL
+
+# =============================================================================
+
+def snapshotDir (data_dir=data_dir):
+
+   # Snapshot named by the pointer file, read once per version of the
+   #  pointer, or the data directory itself without one
+   #
+   pointer_file = os.path.join(data_dir, snapshot_pointer)
+   try:
+      statInfo = os.stat(pointer_file)
+   except OSError:
+      return data_dir
+
+   pointerKey = (os.path.abspath(pointer_file), statInfo.st_ino, statInfo.st_size, statInfo.st_mtime_ns)
+   if pointerKey not in pointerD:
+      try:
+         fh = open(pointer_file, 'r')
+         name = fh.read().strip()
+         fh.close()
+      except OSError:
+         name = ''
+      for oldKey in [x for x in list(pointerD) if x[0] == pointerKey[0]]:
+         pointerD.pop(oldKey, None)
+      pointerD[pointerKey] = name
+
+   snapshot_dir = os.path.join(data_dir, snapshot_root, pointerD[pointerKey])
+   if len(pointerD[pointerKey]) < 1 or not os.path.isdir(snapshot_dir):
+      return data_dir
+
+   return snapshot_dir
+
+# =============================================================================
+
+def ingestManifest (data_dir=data_dir):
+
+   # Versions and changed sites recorded by the incremental ingest, read
+   #  once per version of the manifest
+   #
+   manifest_file = os.path.join(data_dir, ingest_manifest)
+   try:
+      statInfo = os.stat(manifest_file)
+   except OSError:
+      return {}
+
+   manifestKey = (os.path.abspath(manifest_file), statInfo.st_size, statInfo.st_mtime_ns)
+   if manifestKey not in manifestD:
+      try:
+         fh = open(manifest_file, 'r')
+         content = json.load(fh)
+         fh.close()
+      except (OSError, ValueError):
+         content = {}
+      for oldKey in [x for x in list(manifestD) if x[0] == manifestKey[0]]:
+         manifestD.pop(oldKey, None)
+      manifestD[manifestKey] = content
+
+   return manifestD[manifestKey]
+
+# =============================================================================
+
+def dataVersion (data_dir=data_dir):
+
+   version  = wellConstructionCache.dataVersion(inputFileList(data_dir), backend)
+
+   # Data left as an incremental ingest wrote it keeps the version it had
+   #  before, the changed sites being cached under new keys
+   #
+   versionD = ingestManifest(data_dir).get('versions', {}).get(backend)
+   if versionD is not None and versionD.get('data') == version:
+      return versionD['cache']
+
+   return version
+
+# =============================================================================
+
+def siteCacheKey (site_no, version, data_dir=data_dir):
+
+   # Sites changed by an incremental ingest carry its generation
+   #
+   manifest = ingestManifest(data_dir)
+   versionD = manifest.get('versions', {}).get(backend)
+   if versionD is not None and versionD.get('cache') == version and site_no in manifest.get('sites', {}):
+      return "%s.g%d" % (site_no, manifest['sites'][site_no])
+
+   return site_no
+
+# =============================================================================
+
+def canonicalValue (value):
+
+   # Column values as text the same on every backend, the column store
+   #  returning numbers typed and the tables and database as padded text
+   #
+   text = str(value).strip()
+   try:
+      number = float(text)
+   except ValueError:
+      return text
+
+   if not math.isfinite(number):
+      return text
+
+   return repr(number)
+
+# =============================================================================
+
+def siteValidators (siteInfoD, data_dir=data_dir):
+
+   # Lookup file versions affect the descriptions in the output, so they
+   #  are part of the ETag, and their modification times bound Last-Modified
+   #
+   lookupL      = [
+                   os.path.join(data_dir, "well_construction_lookup.json"),
+                   os.path.join(data_dir, "aqfr_cd_query.txt")
+                  ]
+
+   siteHash     = hashlib.sha1()
+   siteHash.update(("%s %s\n" % (program, version)).encode('utf-8'))
+   siteHash.update(wellConstructionCache.dataVersion(lookupL).encode('utf-8'))
+
+   # Source rows and their newest modification date
+   #
+   modifiedL    = []
+   for file in sorted(siteInfoD.keys()):
+      for recordD in siteInfoD[file]:
+         siteHash.update(json.dumps(dict((x, canonicalValue(y)) for x, y in recordD.items()), sort_keys=True).encode('utf-8'))
+         for column in recordD:
+            if column.endswith('_md'):
+               try:
+                  modifiedL.append(datetime.datetime.strptime(str(recordD[column]).strip(), '%d-%b-%Y %H:%M:%S'))
+               except ValueError:
+                  pass
+
+   for lookup_file in lookupL:
+      if os.path.exists(lookup_file):
+         modifiedL.append(datetime.datetime.fromtimestamp(int(os.path.getmtime(lookup_file)), datetime.timezone.utc).replace(tzinfo=None))
+
+   etag         = '"%s"' % siteHash.hexdigest()
+   lastModified = ''
+   if len(modifiedL) > 0:
+      lastModified = email.utils.format_datetime(max(modifiedL).replace(tzinfo=datetime.timezone.utc), usegmt=True)
+
+   return etag, lastModified
+
+# =============================================================================
+
+def notModified (etag, lastModified, conditionD):
+
+   # If-None-Match takes precedence over If-Modified-Since
+   #
+   ifNoneMatch = conditionD.get('If-None-Match', '').strip()
+   if len(ifNoneMatch) > 0:
+      if ifNoneMatch == '*':
+         return True
+      tagL = [x.strip() for x in ifNoneMatch.split(',')]
+      tagL = [x[2:] if x.startswith('W/') else x for x in tagL]
+      return etag in tagL
+
+   ifModifiedSince = conditionD.get('If-Modified-Since', '').strip()
+   if len(ifModifiedSince) > 0 and len(lastModified) > 0:
+      try:
+         sinceDate    = email.utils.parsedate_to_datetime(ifModifiedSince)
+         modifiedDate = email.utils.parsedate_to_datetime(lastModified)
+      except (TypeError, ValueError):
+         return False
+      if sinceDate.tzinfo is None:
+         sinceDate = sinceDate.replace(tzinfo=datetime.timezone.utc)
+      return modifiedDate <= sinceDate
+
+   return False
+
+# =============================================================================
+
+def requestValidators (site_no, version, data_dir=data_dir):
+
+   siteInfoD = None
+
+   # Cache validators for the current version of the data
+   #
+   cacheKey   = siteCacheKey(site_no, version, data_dir)
+   validators = wellConstructionCache.cacheGet(version, cacheKey + ".validators")
+   if validators is not None:
+      etag, lastModified = validators.split('\n')
+   else:
+
+      # Read site records
+      #
+      message, siteInfoD = readSiteInfo(site_no, data_dir)
+      if len(message) > 0:
+         return message, None, '', ''
+
+      timer = wellConstructionProfile.phaseStart('validators')
+      etag, lastModified = siteValidators(siteInfoD, data_dir)
+      wellConstructionProfile.phaseEnd(timer)
+      wellConstructionCache.cachePut(version, cacheKey + ".validators", "\n".join([etag, lastModified]))
+
+   return '', siteInfoD, etag, lastModified
+
+# =============================================================================
+
+def flightResponse (flight, message, content, headerL):
+
+   # A leader's response is built and cached in full before it is sent and
+   #  handed to the requests waiting on it, so they go on once it is built
+   #  rather than once its client has read it
+   #
+   if flight is None:
+      return message, content, headerL
+
+   shared = None
+   try:
+      if len(message) < 1 and content is not None:
+         content = ["".join(wellConstructionProfile.profileChunks(None, content))]
+         shared  = (content[0], headerL)
+   finally:
+      wellConstructionCache.flightEnd(flight, shared)
+
+   return message, content, headerL
+
+# =============================================================================
+
+def sharedResponse (shared, conditionD=None):
+
+   # Response handed over by the leader of a flight
+   #
+   content, headerL = shared
+   headerD = dict(headerL)
+
+   if conditionD is not None and notModified(headerD['ETag'], headerD.get('Last-Modified', ''), conditionD):
+      return '', None, headerL
+
+   return '', [content], headerL
+
+# =============================================================================
+
+def requestWellConstruction (site_no, DefinitionsD, ImageInfoD, aqfrInfoD, data_dir=data_dir, conditionD=None):
+
+   # Concurrent requests for a site not cached yet share the first one's work
+   #
+   version        = dataVersion(data_dir)
+   flight, shared = wellConstructionCache.flightJoin(version, siteCacheKey(site_no, version, data_dir))
+   if shared is not None:
+      return sharedResponse(shared, conditionD)
+
+   message, content, headerL = siteResponse(site_no, DefinitionsD, ImageInfoD, aqfrInfoD, version, data_dir, conditionD)
+
+   return flightResponse(flight, message, content, headerL)
+
+# =============================================================================
+
+def siteResponse (site_no, DefinitionsD, ImageInfoD, aqfrInfoD, version, data_dir=data_dir, conditionD=None):
+
+   # Cache validators for the current version of the data
+   #
+   message, siteInfoD, etag, lastModified = requestValidators(site_no, version, data_dir)
+   if len(message) > 0:
+      return message, None, []
+
+   headerL = [('ETag', etag)]
+   if len(lastModified) > 0:
+      headerL.append(('Last-Modified', lastModified))
+
+   # Conditional request answered before any JSON is built
+   #
+   if conditionD is not None and notModified(etag, lastModified, conditionD):
+      return '', None, headerL
+
+   # Cached response
+   #
+   timer    = wellConstructionProfile.phaseStart('cache')
+   jsonText = wellConstructionCache.cacheGet(version, siteCacheKey(site_no, version, data_dir))
+   wellConstructionProfile.phaseEnd(timer, records=0 if jsonText is None else 1)
+   if jsonText is not None:
+      return '', [jsonText], headerL
+
+   # Read site records
+   #
+   if siteInfoD is None:
+      message, siteInfoD = readSiteInfo(site_no, data_dir)
+      if len(message) > 0:
+         return message, None, []
+
+   # Assemble well construction, streamed to the caller and cached at the end
+   #
+   message, chunkIter = streamWellConstruction(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD)
+   if len(message) > 0:
+      return message, None, []
+
+   return message, wellConstructionCache.cacheStream(version, siteCacheKey(site_no, version, data_dir), chunkIter), headerL
+
+# =============================================================================
+
+def requestWellConstructionSvg (site_no, DefinitionsD, ImageInfoD, aqfrInfoD, data_dir=data_dir, conditionD=None):
+
+   # Concurrent requests for a diagram not cached yet share the first one's work
+   #
+   version        = dataVersion(data_dir)
+   flight, shared = wellConstructionCache.flightJoin(version, siteCacheKey(site_no, version, data_dir) + ".svg")
+   if shared is not None:
+      return sharedResponse(shared, conditionD)
+
+   message, content, headerL = siteSvgResponse(site_no, DefinitionsD, ImageInfoD, aqfrInfoD, version, data_dir, conditionD)
+
+   return flightResponse(flight, message, content, headerL)
+
+# =============================================================================
+
+def siteSvgResponse (site_no, DefinitionsD, ImageInfoD, aqfrInfoD, version, data_dir=data_dir, conditionD=None):
+
+   # Cache validators for the current version of the data, the diagram
+   #  tagged apart from the JSON of the same site
+   #
+   message, siteInfoD, etag, lastModified = requestValidators(site_no, version, data_dir)
+   if len(message) > 0:
+      return message, None, []
+
+   etag    = etag[:-1] + '-svg"'
+   headerL = [('ETag', etag)]
+   if len(lastModified) > 0:
+      headerL.append(('Last-Modified', lastModified))
+
+   if conditionD is not None and notModified(etag, lastModified, conditionD):
+      return '', None, headerL
+
+   # Cached diagram
+   #
+   timer   = wellConstructionProfile.phaseStart('cache')
+   svgText = wellConstructionCache.cacheGet(version, siteCacheKey(site_no, version, data_dir) + ".svg")
+   wellConstructionProfile.phaseEnd(timer, records=0 if svgText is None else 1)
+   if svgText is not None:
+      return '', [svgText], headerL
+
+   # Read site records
+   #
+   if siteInfoD is None:
+      message, siteInfoD = readSiteInfo(site_no, data_dir)
+      if len(message) > 0:
+         return message, None, []
+
+   # Render diagram
+   #
+   message, svgText = buildWellConstructionSvg(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD)
+   if len(message) > 0:
+      return message, None, []
+
+   wellConstructionCache.cachePut(version, siteCacheKey(site_no, version, data_dir) + ".svg", svgText)
+
+   return message, [svgText], headerL
+
+# =============================================================================
+
+def requestWellConstructionSites (siteL, DefinitionsD, ImageInfoD, aqfrInfoD, data_dir=data_dir):
+
+   # Unique sites in requested order
+   #
+   siteL = list(dict.fromkeys([x for x in siteL if len(x) > 0]))
+
+   # Cached responses for the current version of the data
+   #
+   version      = dataVersion(data_dir)
+   cachedD      = {}
+   sitesInfoD   = {}
+   siteMessageD = {}
+   for site_no in siteL:
+      jsonText = wellConstructionCache.cacheGet(version, siteCacheKey(site_no, version, data_dir))
+      if jsonText is not None:
+         cachedD[site_no] = jsonText
+
+   # Read remaining site records with one pass over each table
+   #
+   readL = [x for x in siteL if x not in cachedD]
+   if len(readL) > 0:
+      message, sitesInfoD, siteMessageD = readSitesInfo(readL, data_dir)
+      if len(message) > 0:
+         return message, None
+
+   return '', wellConstructionSitesChunks(siteL, cachedD, sitesInfoD, siteMessageD, DefinitionsD, ImageInfoD, aqfrInfoD, version, data_dir)
+
+# =============================================================================
+
+def requestCrossSection (siteL, DefinitionsD, ImageInfoD, aqfrInfoD, data_dir=data_dir):
+
+   # Unique sites in section order
+   #
+   siteL = list(dict.fromkeys([x for x in siteL if len(x) > 0]))
+
+   # Read site records with one pass over each table
+   #
+   message, sitesInfoD, siteMessageD = readSitesInfo(siteL, data_dir)
+   if len(message) > 0:
+      return message, None
+
+   timer    = wellConstructionProfile.phaseStart('section')
+   sectionD = wellConstructionSection.sectionProfiles(siteL, sitesInfoD, siteMessageD, DefinitionsD, ImageInfoD, aqfrInfoD)
+   wellConstructionProfile.phaseEnd(timer, records=sum(len(x.get(y, [])) for x in sectionD['sites'] for y in wellConstructionSection.section_tableL))
+
+   return '', json.dumps(sectionD)
+
+# =============================================================================
+
+def wellConstructionSitesChunks (siteL, cachedD, sitesInfoD, siteMessageD, DefinitionsD, ImageInfoD, aqfrInfoD, version, data_dir=data_dir):
+
+   # Graph extents for all sites as grouped reductions
+   #
+   extentD = sitesExtents(dict((x, sitesInfoD[x]) for x in siteL if x not in cachedD and x not in siteMessageD))
+
+   # Assemble well construction keyed by site, one site at a time, each
+   #  site built whole so a site that fails leaves a message in its place
+   #  rather than cutting the response short
+   #
+   yield "{"
+
+   separator = ''
+   for site_no in siteL:
+
+      yield separator + json.dumps(site_no) + ':'
+      separator = ','
+
+      if site_no in cachedD:
+         yield cachedD[site_no]
+      elif site_no in siteMessageD:
+         yield jsonMessage(siteMessageD[site_no])
+      else:
+         try:
+            message, chunkIter = streamWellConstruction(site_no, sitesInfoD[site_no], DefinitionsD, ImageInfoD, aqfrInfoD, extentD[site_no])
+            if len(message) < 1:
+               jsonText = "".join(chunkIter)
+         except Exception as error:
+            message = "Site %s unable to build well construction %s" % (site_no, error)
+
+         if len(message) > 0:
+            yield jsonMessage(message)
+         else:
+            wellConstructionCache.cachePut(version, siteCacheKey(site_no, version, data_dir), jsonText)
+            yield jsonText
+
+   yield "}"
+
+# =============================================================================
+
+def profiledResponse (profile, chunkIter, profileBlock=False, label=''):
+
+   # Response chunks timed as they are produced, optionally followed by the
+   #  request's profile once the last one is sent
+   #
+   try:
+      if profileBlock:
+         yield '{"response":'
+
+      yield from wellConstructionProfile.profileChunks(profile, chunkIter)
+
+      if profileBlock:
+         yield ',"profile":' + json.dumps(wellConstructionProfile.profileReport(profile)) + '}'
+   finally:
+      wellConstructionProfile.finishProfile(profile, debug, label)
+
+# =============================================================================
+
+def main ():
+
+   # Parse the Query String
+   #
+   params = {}
+
+   HardWired = None
+   #HardWired = 1
+
+   if HardWired is not None:
+       #os.environ['QUERY_STRING'] = 'site_no=420358121280001'
+       #os.environ['QUERY_STRING'] = 'site_no=414903121234001'
+       #os.environ['QUERY_STRING'] = 'site_no=430508119582001'
+       #os.environ['QUERY_STRING'] = 'site_no=434124119270901'
+       #os.environ['QUERY_STRING'] = 'site_no=432822119011501'
+       #os.environ['QUERY_STRING'] = 'site_no=431357118582301'
+       #os.environ['QUERY_STRING'] = 'site_no=452335122564301'
+       #os.environ['QUERY_STRING'] = 'site_no=453705119513901'
+       #os.environ['QUERY_STRING'] = 'site_no=415947121243401'
+       os.environ['QUERY_STRING'] = 'site_no=422508121161501'
+
+   if 'QUERY_STRING' in os.environ:
+       params = parseQueryString(os.environ['QUERY_STRING'])
+
+   profile = wellConstructionProfile.startProfile()
+
+   # Data snapshot current when the request started, kept to the end
+   #
+   snapshot_dir = snapshotDir(data_dir)
+
+   message, site_no = requestSiteNumbers(params, snapshot_dir)
+   if len(message) > 0:
+      print("Content-type:application/json\n\n")
+      print(jsonMessage(message))
+      wellConstructionProfile.finishProfile(profile, debug, 'sites')
+      sys.exit()
+
+   # Wells with segments overlapping a depth or elevation range
+   #
+   if len(site_no) < 1 and (len(params.get('depth', '')) > 0 or len(params.get('elevation', '')) > 0):
+      message, jsonText = requestIntervals(params, snapshot_dir)
+      if len(message) > 0:
+         jsonText = jsonMessage(message)
+      print("Server-Timing: %s" % wellConstructionProfile.serverTiming(profile))
+      print("Content-type:application/json\n\n")
+      print(jsonText)
+      wellConstructionProfile.finishProfile(profile, debug, 'intervals')
+      sys.exit()
+
+   # Wells open to aquifer or lithology codes
+   #
+   if len(site_no) < 1 and (len(params.get('lith_unit_cd', '')) > 0 or len(params.get('lith_cd', '')) > 0):
+      message, DefinitionsD, ImageInfoD, aqfrInfoD = loadLookups(snapshot_dir)
+      if len(message) < 1:
+         message, jsonText = requestLithology(params, DefinitionsD, aqfrInfoD, snapshot_dir)
+      if len(message) > 0:
+         jsonText = jsonMessage(message)
+      print("Server-Timing: %s" % wellConstructionProfile.serverTiming(profile))
+      print("Content-type:application/json\n\n")
+      print(jsonText)
+      wellConstructionProfile.finishProfile(profile, debug, 'lithology')
+      sys.exit()
+
+   # Wells within a map box or nearest to a point
+   #
+   if len(site_no) < 1 and (len(params.get('bbox', '')) > 0 or len(params.get('near', '')) > 0):
+      message, jsonText = requestSpatial(params, snapshot_dir)
+      if len(message) > 0:
+         jsonText = jsonMessage(message)
+      print("Server-Timing: %s" % wellConstructionProfile.serverTiming(profile))
+      print("Content-type:application/json\n\n")
+      print(jsonText)
+      wellConstructionProfile.finishProfile(profile, debug, 'spatial')
+      sys.exit()
+
+   if len(site_no) < 1:
+      message = "Requires a NWIS site number"
+      print("Content-type:application/json\n\n")
+      print(jsonMessage(message))
+      wellConstructionProfile.finishProfile(profile, debug, 'sites')
+      sys.exit()
+
+   # Read lookup tables
+   #
+   message, DefinitionsD, ImageInfoD, aqfrInfoD = loadLookups(snapshot_dir)
+   if len(message) > 0:
+      print("Content-type:application/json\n\n")
+      print(jsonMessage(message))
+      sys.exit()
+
+   # Build well construction for site
+   #
+   headerL     = []
+   contentType = "application/json"
+   conditionD  = {
+                  'If-None-Match'     : os.environ.get('HTTP_IF_NONE_MATCH', ''),
+                  'If-Modified-Since' : os.environ.get('HTTP_IF_MODIFIED_SINCE', '')
+                 }
+   if params.get('format', '') == 'section':
+      message, jsonText = requestCrossSection(site_no.split(','), DefinitionsD, ImageInfoD, aqfrInfoD, snapshot_dir)
+      chunkIter = [jsonText]
+   elif params.get('format', '') == 'svg':
+      if ',' in site_no:
+         message = "SVG diagram requires a single NWIS site number"
+      else:
+         message, chunkIter, headerL = requestWellConstructionSvg(site_no, DefinitionsD, ImageInfoD, aqfrInfoD, snapshot_dir, conditionD)
+         contentType = "image/svg+xml"
+   elif ',' in site_no:
+      message, chunkIter = requestWellConstructionSites(site_no.split(','), DefinitionsD, ImageInfoD, aqfrInfoD, snapshot_dir)
+   else:
+      message, chunkIter, headerL = requestWellConstruction(site_no, DefinitionsD, ImageInfoD, aqfrInfoD, snapshot_dir, conditionD)
+   if len(message) > 0:
+      print("Content-type:application/json\n\n")
+      print(jsonMessage(message))
+      sys.exit()
+
+   # Not modified since the client's copy
+   #
+   headerL.append(('Server-Timing', wellConstructionProfile.serverTiming(profile)))
+
+   if chunkIter is None:
+      print("Status: 304 Not Modified")
+      for header, value in headerL:
+         print("%s: %s" % (header, value))
+      print("")
+      sys.exit()
+
+   # Output json or svg
+   # -------------------------------------------------
+   #
+   for header, value in headerL:
+      print("%s: %s" % (header, value))
+   print("Content-type:%s\n\n" % contentType)
+   profileBlock = params.get('profile', '') == '1' and contentType == "application/json"
+   for chunk in profiledResponse(profile, chunkIter, profileBlock, site_no):
+      sys.stdout.write(chunk)
+   sys.stdout.write("\n")
+
+   sys.exit()
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+   main()
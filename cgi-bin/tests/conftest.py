@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: conftest.py
+#
+# Project:  wellConstruction
+# Purpose:  Test setup, the modules are imported from cgi-bin as the scripts
+#            import each other, and an extract of a few dozen sites from
+#            the repo data shared by the tests.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, sys, shutil
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wellConstructionIngest
+import wellConstructionSnapshot
+import wellConstructionCache
+import wellConstructionService
+import requestWellConstruction as wc
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+repo_data_dir    = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+table_nmL        = ['gw_cons', 'gw_hole', 'gw_csng', 'gw_open', 'gw_geoh', 'gw_coop', 'gw_repr']
+lookup_fileL     = ['well_construction_lookup.json', 'aqfr_cd_query.txt']
+
+sitefile_columnL = ['agency_cd', 'site_no', 'station_nm', 'dec_lat_va', 'dec_long_va', 'alt_va', 'alt_datum_cd', 'well_depth_va', 'hole_depth_va', 'sitefile_md']
+sitefile_formatL = ['5s', '15s', '50s', '11n', '12n', '8n', '10s', '8n', '8n', '25d']
+
+# =============================================================================
+
+def readTable (nwis_file):
+
+   message, header, columnL, lineEnd = wellConstructionIngest.readHeader(nwis_file)
+   assert message == ''
+
+   fh = open(nwis_file, 'rb')
+   fh.seek(len(header))
+   message, rowL = wellConstructionIngest.splitRows(fh.read(), columnL, nwis_file)
+   fh.close()
+   assert message == ''
+
+   return {'header': header, 'columns': columnL, 'rows': rowL, 'end': lineEnd}
+
+# =============================================================================
+
+def writeTable (nwis_file, tableD, rowL=None):
+
+   if rowL is None:
+      rowL = tableD['rows']
+
+   fh = open(nwis_file, 'wb')
+   fh.write(tableD['header'])
+   fh.write(b''.join('\t'.join(x).encode('utf-8') + tableD['end'] for x in sorted(rowL, key=lambda x: x[1])))
+   fh.close()
+
+# =============================================================================
+
+@pytest.fixture(scope='session')
+def sourceTables ():
+
+   # Rows of a few dozen sites from the repo data, with and without
+   #  lithology, cooperator and repair records, and a sitefile for them
+   #
+   tableD      = dict((x, readTable(os.path.join(repo_data_dir, "%s_01.txt" % x))) for x in table_nmL)
+
+   def sites (table):
+      return set(x[1] for x in tableD[table]['rows'])
+
+   siteS       = set(sorted(sites('gw_open') & sites('gw_geoh'))[:25])
+   siteS      |= set(sorted(sites('gw_cons') - siteS)[:15])
+   siteS      |= set(sorted((sites('gw_coop') & sites('gw_cons')) - siteS)[:10])
+   siteS      |= set(sorted((sites('gw_repr') & sites('gw_cons')) - siteS)[:3])
+
+   for table in table_nmL:
+      tableD[table]['rows'] = [x for x in tableD[table]['rows'] if x[1] in siteS]
+
+   lineEnd     = tableD['gw_cons']['end']
+   header      = "".join(["# sitefile", "\n", "\t".join(sitefile_columnL), "\n", "\t".join(sitefile_formatL), "\n"]).encode('utf-8')
+   rowL        = []
+   for i, site_no in enumerate(sorted(siteS)):
+      rowL.append(['USGS', site_no, "WELL %d" % i, "%.6f" % (42.0 + i * 0.013), "%.6f" % (-121.0 - i * 0.017), "%.1f" % (4000.0 + i * 7.5), 'NGVD29', "%.0f" % (100 + i * 11), '', '01-JAN-2019 00:00:00'])
+   tableD['sitefile'] = {'header': header, 'columns': sitefile_columnL, 'rows': rowL, 'end': lineEnd}
+
+   return tableD
+
+# =============================================================================
+
+def writeData (data_dir, tableD):
+
+   os.makedirs(data_dir)
+   for table, sourceD in tableD.items():
+      writeTable(os.path.join(data_dir, "%s_01.txt" % table), sourceD)
+   for lookup_file in lookup_fileL:
+      shutil.copy(os.path.join(repo_data_dir, lookup_file), os.path.join(data_dir, lookup_file))
+
+# =============================================================================
+
+def buildData (data_dir, backend):
+
+   # Every index and store, as published in a snapshot
+   #
+   message = wellConstructionSnapshot.buildStores(data_dir, backend)
+   assert message == ''
+
+# =============================================================================
+
+@pytest.fixture(scope='session')
+def extractData (tmp_path_factory, sourceTables):
+
+   # The extract read by scanning its tables, and built for each backend
+   #
+   dataD       = {}
+   for name in ['scan', 'files', 'sqlite']:
+      data_dir = str(tmp_path_factory.mktemp(name) / "data")
+      writeData(data_dir, sourceTables)
+      if name != 'scan':
+         buildData(data_dir, name)
+      dataD[name] = data_dir
+
+   return dataD
+
+# =============================================================================
+
+def requestSite (data_dir, site_no, backend='files', conditionD=None):
+
+   # Message, body and headers of a site request as the script answers it,
+   #  body None when not modified
+   #
+   saved_backend = wc.backend
+   wc.backend    = backend
+   try:
+      message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(data_dir)
+      assert message == ''
+
+      message, content, headerL = wc.requestWellConstruction(site_no, DefinitionsD, ImageInfoD, aqfrInfoD, data_dir, conditionD)
+      if content is not None:
+         content = "".join(content)
+   finally:
+      wc.backend = saved_backend
+
+   return message, content, dict(headerL)
+
+# =============================================================================
+
+def requestSites (data_dir, siteL, backend='files'):
+
+   # Body of a request for several sites as the script answers it
+   #
+   saved_backend = wc.backend
+   wc.backend    = backend
+   try:
+      message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(data_dir)
+      assert message == ''
+
+      message, chunkIter = wc.requestWellConstructionSites(siteL, DefinitionsD, ImageInfoD, aqfrInfoD, data_dir)
+      assert message == ''
+      content = "".join(chunkIter)
+   finally:
+      wc.backend = saved_backend
+
+   return content
+
+# =============================================================================
+
+def serviceRequest (site_no, environD={}):
+
+   # Status, headers and body of a site request answered by the service
+   #
+   statusL = []
+   def start_response (status, headerL):
+      statusL.append((status, dict(headerL)))
+
+   environ = dict(environD, QUERY_STRING="site_no=%s" % site_no)
+   body    = b''.join(wellConstructionService.application(environ, start_response))
+
+   return statusL[0][0], statusL[0][1], body.decode('utf-8')
+
+# =============================================================================
+
+def scanResponses (extractData, siteL):
+
+   # Bodies of the sites read by scanning the tables, the reference the
+   #  indexes and backends are held to
+   #
+   wellConstructionCache.cacheClear()
+
+   responseD   = {}
+   for site_no in siteL:
+      message, content, headerD = requestSite(extractData['scan'], site_no)
+      responseD[site_no] = message if len(message) > 0 else content
+
+   return responseD
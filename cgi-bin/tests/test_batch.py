@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_batch.py
+#
+# Project:  wellConstruction
+# Purpose:  Requests for many sites read with one merge-join pass over each
+#            table checked against the single site reads, with a message in
+#            place of each site that can not be built.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, json
+
+import pytest
+
+import wellConstructionCache
+import requestWellConstruction as wc
+
+from conftest import writeData, requestSite, requestSites
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+missing_site    = '999999999999999'
+bare_site       = '400000000000001'
+
+# =============================================================================
+
+@pytest.fixture(scope='module')
+def batchData (tmp_path_factory, sourceTables):
+
+   # The extract with a site in the sitefile holding no construction
+   #  records
+   #
+   tableD      = dict(sourceTables)
+   sitefileD   = dict(tableD['sitefile'])
+   siteRow     = list(sitefileD['rows'][0])
+   siteRow[1]  = bare_site
+   sitefileD['rows'] = sitefileD['rows'] + [siteRow]
+   tableD['sitefile'] = sitefileD
+
+   data_dir    = str(tmp_path_factory.mktemp("batch") / "data")
+   writeData(data_dir, tableD)
+
+   return data_dir, sorted(x[1] for x in sourceTables['sitefile']['rows'])
+
+# =============================================================================
+
+def test_merge_join (batchData):
+
+   # Every other site, out of order and repeated, with sites missing from
+   #  the tables
+   #
+   data_dir, siteL = batchData
+   requestL    = siteL[::-2] + siteL[:3] + [missing_site, bare_site, '0']
+
+   for file in wc.table_nmL:
+      nwis_file = os.path.join(data_dir, "%s_01.txt" % file)
+
+      fh = open(nwis_file, 'r')
+      message, nwisInfoD = wc.processNwisSites("site_no", requestL, fh)
+      fh.close()
+      assert message == ''
+
+      scanD = {}
+      for site_no in set(requestL):
+         fh = open(nwis_file, 'r')
+         message, siteInfoL = wc.processNwisFile("site_no", site_no, fh)
+         fh.close()
+         assert message == ''
+         if len(siteInfoL) > 0:
+            scanD[site_no] = [list(x.values()) for x in siteInfoL]
+
+      assert dict((x, [list(y.values()) for y in z]) for x, z in nwisInfoD.items()) == scanD, file
+
+# =============================================================================
+
+def test_batch_response (batchData):
+
+   data_dir, siteL = batchData
+   requestL    = siteL[7:] + [missing_site, siteL[0], '', bare_site, siteL[7]] + siteL[:7:3]
+   uniqueL     = list(dict.fromkeys([x for x in requestL if len(x) > 0]))
+
+   # Each site as a single request answers it, a message for the sites
+   #  missing from the sitefile or without construction records
+   #
+   wellConstructionCache.cacheClear()
+   bodyL       = []
+   for site_no in uniqueL:
+      message, content, headerD = requestSite(data_dir, site_no)
+      bodyL.append(json.dumps(site_no) + ':' + (content if content is not None else wc.jsonMessage(message)))
+   expected    = "{" + ",".join(bodyL) + "}"
+
+   assert json.loads(expected)[missing_site] == {'message': "Site %s missing information in table sitefile" % missing_site}
+   assert json.loads(expected)[bare_site] == {'message': "Site %s missing well construction information" % bare_site}
+
+   # Read in one pass, then with the single requests cached
+   #
+   wellConstructionCache.cacheClear()
+   assert requestSites(data_dir, requestL) == expected
+
+   for site_no in siteL[::5]:
+      requestSite(data_dir, site_no)
+   assert requestSites(data_dir, requestL) == expected
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_cache.py
+#
+# Project:  wellConstruction
+# Purpose:  Response cache served in place of a read while the data is
+#            unchanged, and passed over once a table or lookup file is
+#            touched or changed.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import wellConstructionCache
+import requestWellConstruction as wc
+
+from conftest import writeTable, writeData, requestSite
+
+# =============================================================================
+
+def touchFile (nwis_file):
+
+   statInfo = os.stat(nwis_file)
+   os.utime(nwis_file, ns=(statInfo.st_atime_ns, statInfo.st_mtime_ns + 10 ** 9))
+
+# =============================================================================
+
+def test_cache_invalidation (tmp_path, monkeypatch, sourceTables):
+
+   cache_dir   = str(tmp_path / "cache")
+   data_dir    = str(tmp_path / "data")
+   monkeypatch.setattr(wellConstructionCache, 'cache_dir', cache_dir)
+   writeData(data_dir, sourceTables)
+
+   tableD      = sourceTables['gw_hole']
+   site_no     = tableD['rows'][0][1]
+
+   wellConstructionCache.cacheClear()
+   message, content, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+
+   version     = wc.dataVersion(data_dir)
+   assert wellConstructionCache.cacheGet(version, site_no) == content
+   assert os.path.exists(wellConstructionCache.cacheFileName(version, site_no))
+
+   # Served from memory, then from disk, without reading the tables
+   #
+   readSiteInfo = wc.readSiteInfo
+   def failRead (*args):
+      raise AssertionError("tables read for a cached response")
+   monkeypatch.setattr(wc, 'readSiteInfo', failRead)
+
+   assert requestSite(data_dir, site_no) == ('', content, headerD)
+   wellConstructionCache.cacheClear()
+   assert requestSite(data_dir, site_no) == ('', content, headerD)
+
+   # A table or lookup file touched gives a new version, read again, and
+   #  the entries of the earlier version are removed from disk
+   #
+   monkeypatch.setattr(wc, 'readSiteInfo', readSiteInfo)
+   for name in ["gw_csng_01.txt", "aqfr_cd_query.txt"]:
+      touchFile(os.path.join(data_dir, name))
+      assert wc.dataVersion(data_dir) != version
+
+      message, touchedContent, touchedHeaderD = requestSite(data_dir, site_no)
+      assert message == ''
+      assert touchedContent == content
+
+      assert not os.path.exists(os.path.join(cache_dir, version))
+      version = wc.dataVersion(data_dir)
+      assert os.path.exists(wellConstructionCache.cacheFileName(version, site_no))
+
+   # A changed row is read from the table, the same as a fresh directory
+   #  with the changed table gives
+   #
+   rowL        = [list(x) for x in tableD['rows']]
+   dia         = tableD['columns'].index('hole_dia_va')
+   rowL[0][dia] = "%.1f" % (float(rowL[0][dia] or 0) + 20.0)
+   writeTable(os.path.join(data_dir, "gw_hole_01.txt"), tableD, rowL)
+
+   message, changedContent, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+   assert changedContent != content
+
+   scan_dir    = str(tmp_path / "scan")
+   writeData(scan_dir, dict(sourceTables, gw_hole=dict(tableD, rows=rowL)))
+   wellConstructionCache.cacheClear()
+   message, scanContent, headerD = requestSite(scan_dir, site_no)
+   assert changedContent == scanContent
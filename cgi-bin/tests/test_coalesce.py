@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_coalesce.py
+#
+# Project:  wellConstruction
+# Purpose:  Concurrent requests for a site sharing the first one's build,
+#            and a flight whose leader never ends taken over after the
+#            timeout.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import threading, time
+
+import wellConstructionCache
+import requestWellConstruction as wc
+
+from conftest import requestSite, scanResponses
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+waiter_count    = 6
+wait_limit      = 10.0
+
+# =============================================================================
+
+def statsDelta (statsD):
+
+   return dict((x, y - statsD[x]) for x, y in wellConstructionCache.flightStats().items())
+
+# =============================================================================
+
+def waitFor (condition):
+
+   endTime = time.monotonic() + wait_limit
+   while not condition():
+      assert time.monotonic() < endTime
+      time.sleep(0.01)
+
+# =============================================================================
+
+def startThreads (count, target):
+
+   resultL = [None] * count
+   def run (index):
+      resultL[index] = target()
+
+   threadL = [threading.Thread(target=run, args=(x,)) for x in range(count)]
+   for thread in threadL:
+      thread.start()
+
+   return threadL, resultL
+
+# =============================================================================
+
+def test_flight_join (monkeypatch):
+
+   monkeypatch.setattr(wellConstructionCache, 'coalesce', True)
+   monkeypatch.setattr(wellConstructionCache, 'flight_timeout', wait_limit)
+   wellConstructionCache.cacheClear()
+
+   # The waiters are handed the leader's result, or build their own when
+   #  the leader ends without one
+   #
+   for result in ['shared result', None]:
+      statsD         = wellConstructionCache.flightStats()
+      flight, shared = wellConstructionCache.flightJoin('v1', 'site')
+      assert flight is not None and shared is None
+
+      threadL, resultL = startThreads(waiter_count, lambda: wellConstructionCache.flightJoin('v1', 'site'))
+      waitFor(lambda: statsDelta(statsD)['coalesced'] == waiter_count)
+
+      wellConstructionCache.flightEnd(flight, result)
+      for thread in threadL:
+         thread.join()
+
+      assert resultL == [(None, result)] * waiter_count
+      assert statsDelta(statsD) == {'flights': 1, 'coalesced': waiter_count, 'timeouts': 0}
+
+   # Not coalesced once cached
+   #
+   wellConstructionCache.cachePut('v1', 'site', 'cached', disk=False)
+   assert wellConstructionCache.flightJoin('v1', 'site') == (None, None)
+
+# =============================================================================
+
+def test_flight_timeout (monkeypatch):
+
+   monkeypatch.setattr(wellConstructionCache, 'coalesce', True)
+   monkeypatch.setattr(wellConstructionCache, 'flight_timeout', 0.2)
+   wellConstructionCache.cacheClear()
+
+   # A waiter gives up on a leader that never ends its flight
+   #
+   statsD         = wellConstructionCache.flightStats()
+   flight, shared = wellConstructionCache.flightJoin('v2', 'site')
+
+   startTime      = time.monotonic()
+   assert wellConstructionCache.flightJoin('v2', 'site') == (None, None)
+   assert time.monotonic() - startTime >= 0.15
+   assert statsDelta(statsD) == {'flights': 1, 'coalesced': 1, 'timeouts': 1}
+
+   # The stale flight is taken over, and the late end of the first leader
+   #  leaves the new flight in place
+   #
+   newFlight, shared = wellConstructionCache.flightJoin('v2', 'site')
+   assert newFlight is not None and newFlight is not flight
+
+   wellConstructionCache.flightEnd(flight, 'late result')
+   assert wellConstructionCache.flightD[('v2', 'site')][0] is newFlight[1]
+
+   wellConstructionCache.flightEnd(newFlight, None)
+   assert ('v2', 'site') not in wellConstructionCache.flightD
+
+# =============================================================================
+
+def test_coalesced_requests (monkeypatch, extractData, sourceTables):
+
+   monkeypatch.setattr(wellConstructionCache, 'coalesce', True)
+   monkeypatch.setattr(wellConstructionCache, 'flight_timeout', wait_limit)
+
+   data_dir    = extractData['files']
+   site_no     = sourceTables['gw_geoh']['rows'][0][1]
+   content     = scanResponses(extractData, [site_no])[site_no]
+
+   # The leader's read held until every other request waits on its flight
+   #
+   readSiteInfo = wc.readSiteInfo
+   readL        = []
+   release      = threading.Event()
+   def heldRead (*args):
+      readL.append(args[0])
+      release.wait(wait_limit)
+      return readSiteInfo(*args)
+   monkeypatch.setattr(wc, 'readSiteInfo', heldRead)
+
+   # The leader's body handed to every request, then a 304 to the
+   #  requests that send its ETag
+   #
+   conditionD  = None
+   for repeat in range(2):
+      wellConstructionCache.cacheClear()
+      statsD   = wellConstructionCache.flightStats()
+      readL[:] = []
+      release.clear()
+
+      leaderL, leaderResultL = startThreads(1, lambda: requestSite(data_dir, site_no))
+      waitFor(lambda: statsDelta(statsD)['flights'] == 1)
+
+      threadL, resultL = startThreads(waiter_count, lambda: requestSite(data_dir, site_no, conditionD=conditionD))
+      waitFor(lambda: statsDelta(statsD)['coalesced'] == waiter_count)
+      release.set()
+      for thread in leaderL + threadL:
+         thread.join()
+
+      assert readL == [site_no]
+      assert statsDelta(statsD) == {'flights': 1, 'coalesced': waiter_count, 'timeouts': 0}
+
+      headerD  = leaderResultL[0][2]
+      assert leaderResultL == [('', content, headerD)]
+      if conditionD is None:
+         assert resultL == [('', content, headerD)] * waiter_count
+      else:
+         assert resultL == [('', None, headerD)] * waiter_count
+
+      conditionD = {'If-None-Match': headerD['ETag']}
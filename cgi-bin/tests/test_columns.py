@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_columns.py
+#
+# Project:  wellConstruction
+# Purpose:  Rows and responses read from the compiled column stores checked
+#            byte for byte against a scan of the tables.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, shutil
+
+import wellConstructionColumns
+import wellConstructionCache
+import requestWellConstruction as wc
+
+from conftest import writeTable, writeData, requestSite, requestSites, scanResponses
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+missing_siteL   = ['000000000000000', '999999999999999']
+
+# =============================================================================
+
+def canonicalRows (siteInfoL):
+
+   return [[wc.canonicalValue(y) for y in x.values()] for x in siteInfoL]
+
+# =============================================================================
+
+def test_column_rows (extractData, sourceTables):
+
+   # Rows from the mapped columns hold the values of the table's rows, the
+   #  numbers typed and the text as written
+   #
+   data_dir    = extractData['files']
+   siteL       = sorted(x[1] for x in sourceTables['sitefile']['rows']) + missing_siteL
+
+   for table in wellConstructionColumns.column_tableL:
+      nwis_file = os.path.join(data_dir, "%s_01.txt" % table)
+
+      for site_no in siteL:
+         message, siteInfoL = wellConstructionColumns.readSiteColumns(table, site_no, data_dir, nwis_file)
+         assert message == ''
+         assert siteInfoL is not None
+
+         fh = open(nwis_file, 'r')
+         message, scanL = wc.processNwisFile("site_no", site_no, fh)
+         fh.close()
+         assert message == ''
+
+         assert canonicalRows(siteInfoL) == canonicalRows(scanL), (table, site_no)
+
+# =============================================================================
+
+def test_column_responses (extractData, sourceTables):
+
+   siteL       = sorted(x[1] for x in sourceTables['sitefile']['rows'])
+   responseD   = scanResponses(extractData, siteL)
+
+   wellConstructionCache.cacheClear()
+   for site_no in siteL:
+      message, content, headerD = requestSite(extractData['files'], site_no)
+      assert message == ''
+      assert content == responseD[site_no], site_no
+
+   wellConstructionCache.cacheClear()
+   scanContent = requestSites(extractData['scan'], siteL)
+
+   wellConstructionCache.cacheClear()
+   assert requestSites(extractData['files'], siteL) == scanContent
+
+# =============================================================================
+
+def test_stale_store (tmp_path, extractData, sourceTables):
+
+   # A store older than its table is passed over and the table scanned
+   #
+   data_dir    = str(tmp_path / "data")
+   shutil.copytree(extractData['files'], data_dir)
+
+   tableD      = sourceTables['gw_hole']
+   rowL        = [list(x) for x in tableD['rows']]
+   site_no     = rowL[0][1]
+   dia         = tableD['columns'].index('hole_dia_va')
+   rowL[0][dia] = "%.1f" % (float(rowL[0][dia] or 0) + 20.0)
+
+   nwis_file   = os.path.join(data_dir, "gw_hole_01.txt")
+   writeTable(nwis_file, tableD, rowL)
+
+   assert wellConstructionColumns.openColumnStore('gw_hole', data_dir, nwis_file) is None
+   message, siteInfoL = wellConstructionColumns.readSiteColumns('gw_hole', site_no, data_dir, nwis_file)
+   assert message == ''
+   assert siteInfoL is None
+
+   scan_dir    = str(tmp_path / "scan")
+   writeData(scan_dir, dict(sourceTables, gw_hole=dict(tableD, rows=rowL)))
+
+   wellConstructionCache.cacheClear()
+   message, content, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+
+   wellConstructionCache.cacheClear()
+   message, scanContent, headerD = requestSite(scan_dir, site_no)
+   assert message == ''
+   assert content == scanContent
+
+   wellConstructionCache.cacheClear()
+   message, storeContent, headerD = requestSite(extractData['files'], site_no)
+   assert content != storeContent
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_conditional.py
+#
+# Project:  wellConstruction
+# Purpose:  Conditional requests answered not modified for a matching ETag
+#            or a date not before Last-Modified, through the script and the
+#            service.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, datetime, email.utils
+
+import wellConstructionCache
+import wellConstructionService
+
+from conftest import writeData, requestSite, serviceRequest
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+lookup_fileL    = ['well_construction_lookup.json', 'aqfr_cd_query.txt']
+
+# =============================================================================
+
+def httpDate (date):
+
+   return email.utils.format_datetime(date.replace(tzinfo=datetime.timezone.utc), usegmt=True)
+
+# =============================================================================
+
+def setLookupTimes (data_dir, date):
+
+   mtime = date.replace(tzinfo=datetime.timezone.utc).timestamp()
+   for lookup_file in lookup_fileL:
+      os.utime(os.path.join(data_dir, lookup_file), (mtime, mtime))
+
+# =============================================================================
+
+def test_conditional_requests (tmp_path, monkeypatch, sourceTables):
+
+   data_dir    = str(tmp_path / "data")
+   writeData(data_dir, sourceTables)
+
+   site_no     = sourceTables['gw_geoh']['rows'][0][1]
+
+   # Newest modification date of the site's rows
+   #
+   rowDateL    = []
+   for table, tableD in sourceTables.items():
+      for valuesL in tableD['rows']:
+         if valuesL[1] == site_no:
+            for column, value in zip(tableD['columns'], valuesL):
+               if column.endswith('_md') and len(value.strip()) > 0:
+                  rowDateL.append(datetime.datetime.strptime(value.strip(), '%d-%b-%Y %H:%M:%S'))
+   rowDate     = max(rowDateL)
+
+   # Last-Modified is the newest of the rows and the lookup files
+   #
+   setLookupTimes(data_dir, datetime.datetime(1990, 1, 1))
+   wellConstructionCache.cacheClear()
+   message, content, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+   assert headerD['Last-Modified'] == httpDate(rowDate)
+
+   etag         = headerD['ETag']
+   lastModified = headerD['Last-Modified']
+
+   notModifiedL = [
+                   {'If-None-Match': etag},
+                   {'If-None-Match': 'W/' + etag},
+                   {'If-None-Match': '"other", ' + etag},
+                   {'If-None-Match': '*'},
+                   {'If-Modified-Since': lastModified},
+                   {'If-Modified-Since': httpDate(rowDate + datetime.timedelta(days=1))}
+                  ]
+   modifiedL    = [
+                   {'If-None-Match': '"other"'},
+                   {'If-None-Match': '"other"', 'If-Modified-Since': lastModified},
+                   {'If-Modified-Since': httpDate(rowDate - datetime.timedelta(seconds=1))},
+                   {'If-Modified-Since': 'not a date'}
+                  ]
+
+   for conditionD in notModifiedL:
+      assert requestSite(data_dir, site_no, conditionD=conditionD) == ('', None, headerD), conditionD
+   for conditionD in modifiedL:
+      assert requestSite(data_dir, site_no, conditionD=conditionD) == ('', content, headerD), conditionD
+
+   # Through the service, a 304 without a body
+   #
+   monkeypatch.setattr(wellConstructionService, 'data_dir', data_dir)
+
+   status, serviceHeaderD, body = serviceRequest(site_no, {'HTTP_IF_NONE_MATCH': etag})
+   assert (status, body, serviceHeaderD['ETag']) == ('304 Not Modified', '', etag)
+
+   status, serviceHeaderD, body = serviceRequest(site_no, {'HTTP_IF_MODIFIED_SINCE': lastModified})
+   assert (status, body) == ('304 Not Modified', '')
+
+   status, serviceHeaderD, body = serviceRequest(site_no, {'HTTP_IF_NONE_MATCH': '"other"'})
+   assert (status, body, serviceHeaderD['ETag'], serviceHeaderD['Last-Modified']) == ('200 OK', content, etag, lastModified)
+
+   # A newer lookup file moves Last-Modified and changes the ETag, so the
+   #  client's copy is sent again
+   #
+   lookupDate  = datetime.datetime(2031, 6, 1, 12, 30, 15)
+   setLookupTimes(data_dir, lookupDate)
+
+   message, lookupContent, lookupHeaderD = requestSite(data_dir, site_no, conditionD={'If-Modified-Since': lastModified})
+   assert message == ''
+   assert lookupContent == content
+   assert lookupHeaderD['Last-Modified'] == httpDate(lookupDate)
+   assert lookupHeaderD['ETag'] != etag
+
+   message, lookupContent, lookupHeaderD = requestSite(data_dir, site_no, conditionD={'If-None-Match': etag})
+   assert lookupContent == content
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_database.py
+#
+# Project:  wellConstruction
+# Purpose:  Rows, aquifer names and responses read from the SQLite database
+#            checked byte for byte against a scan of the tables.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import pytest
+
+import wellConstructionDatabase
+import wellConstructionCache
+import requestWellConstruction as wc
+
+from conftest import requestSite, requestSites, scanResponses
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+missing_siteL   = ['000000000000000', '999999999999999']
+
+# =============================================================================
+
+def canonicalRows (siteInfoL):
+
+   return [[wc.canonicalValue(y) for y in x.values()] for x in siteInfoL]
+
+# =============================================================================
+
+@pytest.mark.parametrize('query_sites', [7, wellConstructionDatabase.query_sites])
+def test_site_rows (monkeypatch, extractData, sourceTables, query_sites):
+
+   # Rows of the requested sites, read in one or several queries, hold the
+   #  values of the table's rows
+   #
+   monkeypatch.setattr(wellConstructionDatabase, 'query_sites', query_sites)
+
+   data_dir    = extractData['sqlite']
+   siteL       = sorted(x[1] for x in sourceTables['sitefile']['rows']) + missing_siteL
+
+   for table in wc.table_nmL:
+      message, nwisInfoD = wellConstructionDatabase.readSiteRows(data_dir, table, siteL)
+      assert message == ''
+
+      fh = open(os.path.join(data_dir, "%s_01.txt" % table), 'r')
+      message, scanD = wc.processNwisSites("site_no", siteL, fh)
+      fh.close()
+      assert message == ''
+
+      assert sorted(nwisInfoD) == sorted(scanD), table
+      for site_no in scanD:
+         assert canonicalRows(nwisInfoD[site_no]) == canonicalRows(scanD[site_no]), (table, site_no)
+
+# =============================================================================
+
+def test_aqfr_codes (extractData):
+
+   # Each code gives the name the whole lookup file gives it
+   #
+   data_dir    = extractData['sqlite']
+
+   fh = open(os.path.join(data_dir, "aqfr_cd_query.txt"), 'r')
+   message, aqfrInfoD = wc.processAqfrCodes(fh)
+   fh.close()
+   assert message == ''
+
+   for aqfr_cd in sorted(aqfrInfoD)[::37] + ['NOSUCHCODE']:
+      assert wellConstructionDatabase.readAqfrCode(data_dir, aqfr_cd) == aqfrInfoD.get(aqfr_cd), aqfr_cd
+
+# =============================================================================
+
+def test_database_responses (extractData, sourceTables):
+
+   siteL       = sorted(x[1] for x in sourceTables['sitefile']['rows'])
+   responseD   = scanResponses(extractData, siteL)
+
+   wellConstructionCache.cacheClear()
+   for site_no in siteL + missing_siteL[:1]:
+      message, content, headerD = requestSite(extractData['sqlite'], site_no, 'sqlite')
+      if site_no in responseD:
+         assert message == ''
+         assert content == responseD[site_no], site_no
+      else:
+         assert message == "Site %s missing information in table sitefile" % site_no
+
+   wellConstructionCache.cacheClear()
+   scanContent = requestSites(extractData['scan'], siteL)
+
+   wellConstructionCache.cacheClear()
+   assert requestSites(extractData['sqlite'], siteL, 'sqlite') == scanContent
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_index.py
+#
+# Project:  wellConstruction
+# Purpose:  Site blocks read through the site_no offset index checked
+#            against a scan of the table, and a stale index passed over for
+#            the scan.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, shutil
+
+import pytest
+
+import wellConstructionIndex
+import wellConstructionCache
+
+from conftest import readTable, writeTable, writeData, requestSite
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+missing_siteL   = ['000000000000000', '4', '420000000000000', '999999999999999']
+
+# =============================================================================
+
+def scanBlock (nwis_file, site_no):
+
+   # Header lines and the site's lines, as a scan of the table finds them
+   #
+   data_offset, keyIndex = wellConstructionIndex.headerInfo(nwis_file)
+
+   fh = open(nwis_file, 'rb')
+   header = fh.read(data_offset)
+   lineL  = fh.read().splitlines(True)
+   fh.close()
+
+   lineL  = [x for x in lineL if x.split(b'\t')[keyIndex] == site_no.encode('utf-8')]
+
+   return (header + b''.join(lineL)).decode('utf-8').splitlines(True)
+
+# =============================================================================
+
+def test_site_blocks (tmp_path, sourceTables):
+
+   data_dir    = str(tmp_path / "data")
+   writeData(data_dir, sourceTables)
+
+   # A table without rows has an index without entries
+   #
+   empty_file  = os.path.join(data_dir, "gw_empty_01.txt")
+   writeTable(empty_file, sourceTables['gw_cons'], [])
+
+   siteL       = sorted(x[1] for x in sourceTables['sitefile']['rows']) + missing_siteL
+
+   for nwis_file in sorted(x.path for x in os.scandir(data_dir) if x.name.endswith("_01.txt")):
+      message, siteCount = wellConstructionIndex.buildSiteIndex(nwis_file)
+      assert message == ''
+      assert siteCount == len(set(x[1] for x in readTable(nwis_file)['rows']))
+
+      for site_no in siteL:
+         message, contentL = wellConstructionIndex.readSiteBlock(nwis_file, site_no)
+         assert message == ''
+         assert contentL == scanBlock(nwis_file, site_no), (os.path.basename(nwis_file), site_no)
+
+# =============================================================================
+
+@pytest.mark.parametrize('change', ['rows', 'mtime'])
+def test_stale_index (tmp_path, sourceTables, change):
+
+   # Index built, then the table rewritten with a changed row or only
+   #  touched, and the same changed table written to a directory without
+   #  indexes
+   #
+   data_dir    = str(tmp_path / "data")
+   scan_dir    = str(tmp_path / "scan")
+   writeData(data_dir, sourceTables)
+
+   for nwis_file in sorted(x.path for x in os.scandir(data_dir) if x.name.endswith("_01.txt")):
+      message, siteCount = wellConstructionIndex.buildSiteIndex(nwis_file)
+      assert message == ''
+
+   tableD      = sourceTables['gw_open']
+   rowL        = [list(x) for x in tableD['rows']]
+   site_no     = rowL[0][1]
+   if change == 'rows':
+      bottom = tableD['columns'].index('open_bottom_va')
+      rowL[0][bottom] = "%.1f" % (float(rowL[0][bottom] or 0) + 1234.0)
+
+   nwis_file   = os.path.join(data_dir, "gw_open_01.txt")
+   statInfo    = os.stat(nwis_file)
+   writeTable(nwis_file, tableD, rowL)
+   os.utime(nwis_file, ns=(statInfo.st_atime_ns, statInfo.st_mtime_ns + 10 ** 9))
+
+   shutil.copytree(data_dir, scan_dir, ignore=shutil.ignore_patterns('*.idx'))
+
+   # The stale index is passed over and the table scanned
+   #
+   assert wellConstructionIndex.readIndexBlocks(nwis_file) == (None, None)
+   message, contentL = wellConstructionIndex.readSiteBlock(nwis_file, site_no)
+   assert message == ''
+   assert contentL is None
+
+   wellConstructionCache.cacheClear()
+   message, content, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+
+   wellConstructionCache.cacheClear()
+   message, scanContent, headerD = requestSite(scan_dir, site_no)
+   assert message == ''
+   assert content == scanContent
+
+   # Rebuilt, the index gives the changed rows
+   #
+   message, siteCount = wellConstructionIndex.buildSiteIndex(nwis_file)
+   assert message == ''
+   message, contentL = wellConstructionIndex.readSiteBlock(nwis_file, site_no)
+   assert contentL == scanBlock(nwis_file, site_no)
+
+   wellConstructionCache.cacheClear()
+   message, content, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+   assert content == scanContent
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_ingest.py
+#
+# Project:  wellConstruction
+# Purpose:  Incremental ingest checked against a clean rebuild of the tables,
+#            indexes, database and stores from the same rows.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, shutil, sqlite3
+
+import pytest
+
+import wellConstructionIngest
+import wellConstructionIndex
+import wellConstructionColumns
+import wellConstructionDatabase
+import wellConstructionIntervals
+import wellConstructionLithology
+import wellConstructionSpatial
+import wellConstructionSnapshot
+
+from conftest import lookup_fileL, readTable, writeTable, writeData, buildData
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+newer_md         = '01-JAN-2030 00:00:00'
+older_md         = '01-JAN-1990 00:00:00'
+
+# =============================================================================
+
+def extractChanges (tableD):
+
+   # Changed rows of the extract, keyed by what each one tests, and the
+   #  table rows expected after a full extract and after a delta
+   #
+   def column (table, name):
+      return tableD[table]['columns'].index(name)
+
+   openRowL    = tableD['gw_open']['rows']
+   openSiteL   = sorted(set(x[1] for x in openRowL))
+   geohSiteS   = set(x[1] for x in tableD['gw_geoh']['rows'])
+   md          = column('gw_open', 'open_md')
+
+   # Newer open interval of a site with lithology, an older one of another
+   #  site, a site removed and a site given its first open interval
+   #
+   newer_site  = [x for x in openSiteL if x in geohSiteS][0]
+   older_site  = [x for x in openSiteL if x != newer_site and len([y for y in openRowL if y[1] == x and wellConstructionIngest.modifiedDate(y[md]) is not None]) > 0][0]
+   removed_site = [x for x in openSiteL if x not in (newer_site, older_site)][-1]
+   added_site  = sorted(set(x[1] for x in tableD['sitefile']['rows']) - set(openSiteL))[0]
+
+   changeD     = {'sites': {'newer': newer_site, 'older': older_site, 'removed': removed_site, 'added': added_site}}
+
+   newerRow    = list([x for x in openRowL if x[1] == newer_site][0])
+   newerRow[column('gw_open', 'open_bottom_va')] = "%.1f" % (float(newerRow[column('gw_open', 'open_bottom_va')] or 0) + 5.0)
+   newerRow[md] = newer_md
+
+   olderRow    = list([x for x in openRowL if x[1] == older_site and wellConstructionIngest.modifiedDate(x[md]) is not None][0])
+   olderRow[column('gw_open', 'open_bottom_va')] = '12345'
+   olderRow[md] = older_md
+
+   addedRow    = list(openRowL[0])
+   addedRow[1] = added_site
+   addedRow[column('gw_open', 'cons_seq_nu')] = '1'
+   addedRow[column('gw_open', 'open_seq_nu')] = '1'
+   addedRow[column('gw_open', 'open_top_va')] = '10'
+   addedRow[column('gw_open', 'open_bottom_va')] = '40'
+   addedRow[md] = newer_md
+
+   # Land surface and lithology of the newer site, a cooperator ID changed
+   #  and one removed
+   #
+   siteRow     = list([x for x in tableD['sitefile']['rows'] if x[1] == newer_site][0])
+   siteRow[column('sitefile', 'alt_va')] = "%.1f" % (float(siteRow[column('sitefile', 'alt_va')]) + 100.0)
+   siteRow[column('sitefile', 'sitefile_md')] = newer_md
+
+   geohRowL    = []
+   for valuesL in tableD['gw_geoh']['rows']:
+      if valuesL[1] == newer_site:
+         valuesL = list(valuesL)
+         valuesL[column('gw_geoh', 'lith_unit_cd')] = 'TESTCODE'
+         valuesL[column('gw_geoh', 'geoh_md')] = newer_md
+         geohRowL.append(valuesL)
+
+   coopRowL    = tableD['gw_coop']['rows']
+   coopRow     = list(coopRowL[0])
+   coopRow[column('gw_coop', 'coop_site_no')] = 'ZZTEST1'
+   coopRow[column('gw_coop', 'coop_md')] = newer_md
+   droppedRow  = coopRowL[-1]
+   changeD['sites']['coop'] = coopRow[1]
+   changeD['sites']['dropped'] = droppedRow[1]
+
+   def replaced (table, newRowL):
+      keyIndexL = wellConstructionIngest.tableKeys(tableD[table]['columns'])
+      newD = dict((tuple(x[i] for i in keyIndexL), x) for x in newRowL)
+      return [newD.get(tuple(x[i] for i in keyIndexL), x) for x in tableD[table]['rows']]
+
+   # Delta rows, and the full extract holding every other row as it is
+   #
+   changeD['delta'] = {
+                       'gw_open'  : [newerRow, olderRow, addedRow],
+                       'sitefile' : [siteRow],
+                       'gw_geoh'  : geohRowL,
+                       'gw_coop'  : [coopRow]
+                      }
+   changeD['full']  = {
+                       'gw_open'  : [x for x in replaced('gw_open', [newerRow, olderRow]) if x[1] != removed_site] + [addedRow],
+                       'sitefile' : replaced('sitefile', [siteRow]),
+                       'gw_geoh'  : replaced('gw_geoh', geohRowL),
+                       'gw_coop'  : [x for x in replaced('gw_coop', [coopRow]) if x is not droppedRow]
+                      }
+
+   # Rows after the ingest, the older row never replaces the table's row
+   #
+   changeD['expected'] = {
+                          'delta' : {
+                                     'gw_open'  : replaced('gw_open', [newerRow]) + [addedRow],
+                                     'sitefile' : changeD['full']['sitefile'],
+                                     'gw_geoh'  : changeD['full']['gw_geoh'],
+                                     'gw_coop'  : replaced('gw_coop', [coopRow])
+                                    },
+                          'full'  : {
+                                     'gw_open'  : [x for x in replaced('gw_open', [newerRow]) if x[1] != removed_site] + [addedRow],
+                                     'sitefile' : changeD['full']['sitefile'],
+                                     'gw_geoh'  : changeD['full']['gw_geoh'],
+                                     'gw_coop'  : changeD['full']['gw_coop']
+                                    }
+                         }
+
+   return changeD
+
+# =============================================================================
+
+def arrayValues (store, nameL):
+
+   return dict((x, repr(list(store[x]))) for x in nameL)
+
+# =============================================================================
+
+def assertRebuildParity (data_dir, clean_dir, backend):
+
+   # Tables, indexes, database and stores after the ingest match a clean
+   #  build from the same tables
+   #
+   os.makedirs(clean_dir)
+   for name in os.listdir(data_dir):
+      if name.endswith("_01.txt") or name in lookup_fileL:
+         shutil.copy(os.path.join(data_dir, name), os.path.join(clean_dir, name))
+   buildData(clean_dir, backend)
+
+   for name in sorted(x for x in os.listdir(data_dir) if x.endswith("_01.txt")):
+      nwis_file  = os.path.join(data_dir, name)
+      clean_file = os.path.join(clean_dir, name)
+
+      data_offset, blockD = wellConstructionIndex.readIndexBlocks(nwis_file)
+      assert blockD is not None, name
+      assert (data_offset, blockD) == wellConstructionIndex.readIndexBlocks(clean_file), name
+
+   for keyColumn in wellConstructionIndex.coopColumnL:
+      entryS = wellConstructionIndex.readKeyEntries(os.path.join(data_dir, "gw_coop_01.txt"), keyColumn)
+      assert entryS is not None, keyColumn
+      assert entryS == wellConstructionIndex.readKeyEntries(os.path.join(clean_dir, "gw_coop_01.txt"), keyColumn), keyColumn
+
+   if backend == 'sqlite':
+      connection = sqlite3.connect(wellConstructionDatabase.databaseFileName(data_dir))
+      cleanConnection = sqlite3.connect(wellConstructionDatabase.databaseFileName(clean_dir))
+      tableL     = [x[0] for x in cleanConnection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+      for table_nm in tableL:
+         query = 'SELECT * FROM "%s"' % table_nm
+         assert sorted(connection.execute(query)) == sorted(cleanConnection.execute(query)), table_nm
+      connection.close()
+      cleanConnection.close()
+
+   for table in wellConstructionColumns.column_tableL:
+      nwis_file  = os.path.join(data_dir, "%s_01.txt" % table)
+      clean_file = os.path.join(clean_dir, "%s_01.txt" % table)
+      assert wellConstructionColumns.openColumnStore(table, data_dir, nwis_file) is not None, table
+
+      for site_no in sorted(set(x[1] for x in readTable(clean_file)['rows'])):
+         message, siteInfoL = wellConstructionColumns.readSiteColumns(table, site_no, data_dir, nwis_file)
+         assert message == ''
+         message, cleanInfoL = wellConstructionColumns.readSiteColumns(table, site_no, clean_dir, clean_file)
+         assert [list(x.values()) for x in siteInfoL] == [list(x.values()) for x in cleanInfoL], (table, site_no)
+
+   store       = wellConstructionIntervals.mapIntervalStore(data_dir, backend)
+   cleanStore  = wellConstructionIntervals.mapIntervalStore(clean_dir, backend)
+   assert store is not None
+   nameL       = ['sites', 'site', 'table', 'cons', 'seq', 'dia', 'alt', 'depth_start', 'depth_end', 'depth_max',
+                  'elev_start', 'elev_end', 'elev_max', 'elev_row']
+   assert arrayValues(store, nameL) == arrayValues(cleanStore, nameL)
+   assert (store['depth_levels'], store['elev_levels']) == (cleanStore['depth_levels'], cleanStore['elev_levels'])
+
+   store       = wellConstructionLithology.mapLithologyStore(data_dir, backend)
+   cleanStore  = wellConstructionLithology.mapLithologyStore(clean_dir, backend)
+   assert store is not None
+   assert wellConstructionLithology.storePostings(store, set()) == wellConstructionLithology.storePostings(cleanStore, set())
+
+   store       = wellConstructionSpatial.mapSpatialStore(data_dir, backend)
+   cleanStore  = wellConstructionSpatial.mapSpatialStore(clean_dir, backend)
+   assert store is not None
+   nameL       = ['sites', 'names', 'cells', 'rows', 'lat', 'lon', 'alt', 'well', 'hole']
+   assert arrayValues(store, nameL) == arrayValues(cleanStore, nameL)
+
+# =============================================================================
+
+@pytest.mark.parametrize('backend', wellConstructionIngest.backendL)
+@pytest.mark.parametrize('kind', ['full', 'delta'])
+def test_ingest (tmp_path, sourceTables, kind, backend):
+
+   data_dir    = str(tmp_path / "data")
+   extract_dir = str(tmp_path / "extract")
+
+   writeData(data_dir, sourceTables)
+   buildData(data_dir, backend)
+
+   changeD     = extractChanges(sourceTables)
+   siteD       = changeD['sites']
+
+   os.makedirs(extract_dir)
+   for table, rowL in changeD[kind].items():
+      writeTable(os.path.join(extract_dir, "%s_01.txt" % table), sourceTables[table], rowL)
+
+   message, reportD = wellConstructionIngest.ingestData(data_dir, [extract_dir], kind == 'delta')
+   assert message == ''
+
+   # The older row is skipped, the removed site stays with a delta
+   #
+   assert reportD['gw_open']['skipped'] == 1
+
+   for table, rowL in changeD['expected'][kind].items():
+      assert readTable(os.path.join(data_dir, "%s_01.txt" % table))['rows'] == sorted(rowL, key=lambda x: x[1]), table
+
+   openSiteS   = set(x[1] for x in readTable(os.path.join(data_dir, "gw_open_01.txt"))['rows'])
+   assert siteD['added'] in openSiteS
+   assert (siteD['removed'] in openSiteS) == (kind == 'delta')
+
+   # Changed sites recorded for the response cache
+   #
+   changeS     = set([siteD['newer'], siteD['added'], siteD['coop']])
+   if kind == 'full':
+      changeS |= set([siteD['removed'], siteD['dropped']])
+   assert set(wellConstructionIngest.wc.ingestManifest(data_dir)['sites']) == changeS
+
+   assertRebuildParity(data_dir, str(tmp_path / "clean"), backend)
+
+# =============================================================================
+
+@pytest.mark.parametrize('backend', wellConstructionIngest.backendL)
+def test_delta_and_full_extract (tmp_path, sourceTables, backend):
+
+   # A delta of the changed rows gives the same tables as a full extract,
+   #  apart from the rows only a full extract removes
+   #
+   changeD     = extractChanges(sourceTables)
+   siteD       = changeD['sites']
+
+   tableD      = {}
+   for kind in ['full', 'delta']:
+      data_dir    = str(tmp_path / kind / "data")
+      extract_dir = str(tmp_path / kind / "extract")
+
+      writeData(data_dir, sourceTables)
+      buildData(data_dir, backend)
+
+      os.makedirs(extract_dir)
+      for table, rowL in changeD[kind].items():
+         writeTable(os.path.join(extract_dir, "%s_01.txt" % table), sourceTables[table], rowL)
+
+      message, reportD = wellConstructionIngest.ingestData(data_dir, [extract_dir], kind == 'delta')
+      assert message == ''
+
+      tableD[kind] = dict((x, readTable(os.path.join(data_dir, "%s_01.txt" % x))['rows']) for x in changeD[kind])
+
+   for table in tableD['full']:
+      deltaL = tableD['delta'][table]
+      if table == 'gw_coop':
+         deltaL = [x for x in deltaL if x != sourceTables['gw_coop']['rows'][-1]]
+      elif table == 'gw_open':
+         deltaL = [x for x in deltaL if x[1] != siteD['removed']]
+      assert tableD['full'][table] == deltaL, table
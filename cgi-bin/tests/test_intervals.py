@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_intervals.py
+#
+# Project:  wellConstruction
+# Purpose:  Interval tree overlaps checked against a scan of every interval
+#            over random intervals and ranges.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import math, random
+
+import pytest
+
+import wellConstructionIntervals
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+countL          = [0, 1, 2, 3, 7, 8, 9, 15, 16, 17, 31, 33, 100, 255, 256, 257, 1000]
+query_count     = 200
+
+# =============================================================================
+
+def randomIntervals (rng, count):
+
+   # Intervals in the order readIntervals gives them, with repeated depths,
+   #  zero lengths and sites without an altitude
+   #
+   siteL       = ["%015d" % rng.randrange(10 ** 14, 10 ** 15) for x in range(max(1, count // 4))]
+   altD        = dict((x, math.nan if rng.random() < 0.1 else round(rng.uniform(-50.0, 5000.0), 1)) for x in siteL)
+
+   intervalL   = []
+   for i in range(count):
+      site_no = rng.choice(siteL)
+      top     = float(rng.randrange(0, 200)) if rng.random() < 0.3 else round(rng.uniform(0.0, 2000.0), 1)
+      length  = 0.0 if rng.random() < 0.1 else round(rng.expovariate(1.0 / 100.0), 1)
+      intervalL.append((top, top + length, site_no, rng.randrange(0, 3), rng.randrange(1, 3), i + 1, math.nan, altD[site_no]))
+
+   intervalL.sort()
+
+   return intervalL
+
+# =============================================================================
+
+def randomRange (rng):
+
+   top    = rng.uniform(-3000.0, 5000.0)
+   bottom = top + (0.0 if rng.random() < 0.2 else rng.expovariate(1.0 / 300.0))
+
+   return top, bottom
+
+# =============================================================================
+
+def scanOverlap (startA, endA, top, bottom):
+
+   return sorted(i for i in range(len(startA)) if startA[i] <= bottom and endA[i] >= top)
+
+# =============================================================================
+
+@pytest.mark.parametrize('count', countL)
+def test_tree_overlap (count):
+
+   rng   = random.Random(count)
+   store = wellConstructionIntervals.buildIntervals(randomIntervals(rng, count))
+
+   for mode in ['depth', 'elev']:
+      startA = store['%s_start' % mode]
+      endA   = store['%s_end' % mode]
+      maxA   = store['%s_max' % mode]
+      levels = store['%s_levels' % mode]
+
+      # Ranges at random and at the interval ends themselves
+      #
+      rangeL = [randomRange(rng) for x in range(query_count)]
+      if len(startA) > 0:
+         rangeL.extend((startA[x], startA[x]) for x in [rng.randrange(len(startA)) for y in range(20)])
+         rangeL.extend((endA[x], endA[x] + 1.0) for x in [rng.randrange(len(endA)) for y in range(20)])
+
+      for top, bottom in rangeL:
+         assert sorted(wellConstructionIntervals.treeOverlap(startA, endA, maxA, levels, top, bottom)) == scanOverlap(startA, endA, top, bottom)
+
+# =============================================================================
+
+@pytest.mark.parametrize('mode', ['depth', 'elevation'])
+def test_query_intervals (tmp_path, mode):
+
+   # Queries of a written and mapped store match a scan of the intervals
+   #
+   rng       = random.Random(mode)
+   intervalL = randomIntervals(rng, 500)
+
+   message, count = wellConstructionIntervals.writeIntervalStore(str(tmp_path), 'files', intervalL)
+   assert message == ''
+   assert count == len(intervalL)
+
+   store     = wellConstructionIntervals.mapIntervalStore(str(tmp_path), 'files')
+   assert store is not None
+
+   tableLL   = [wellConstructionIntervals.interval_tableL, ['gw_open'], ['gw_hole', 'gw_csng']]
+   for i in range(query_count):
+      top, bottom = randomRange(rng)
+      tableL      = rng.choice(tableLL)
+      tableS      = set(wellConstructionIntervals.interval_tableL.index(x) for x in tableL)
+
+      expectedD   = {}
+      for x in intervalL:
+         if mode == 'elevation':
+            if x[7] != x[7]:
+               continue
+            start, end = x[7] - x[1], x[7] - x[0]
+         else:
+            start, end = x[0], x[1]
+         if x[3] in tableS and start <= bottom and end >= top:
+            expectedD.setdefault(x[2], []).append((wellConstructionIntervals.interval_tableL[x[3]], x[4], x[5]))
+
+      siteD       = wellConstructionIntervals.queryIntervals(store, top, bottom, mode, tableL)
+
+      assert sorted(siteD) == sorted(expectedD)
+      for site_no, segmentL in siteD.items():
+         assert sorted((x['table'], x['cons_seq_nu'], x['seq_nu']) for x in segmentL) == sorted(expectedD[site_no])
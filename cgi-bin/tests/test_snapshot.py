@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_snapshot.py
+#
+# Project:  wellConstruction
+# Purpose:  Snapshots published, switched and pruned under a data directory,
+#            with the service following the current pointer and older
+#            snapshots left as they were published.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import wellConstructionSnapshot
+import wellConstructionColumns
+import wellConstructionCache
+import wellConstructionService
+import requestWellConstruction as wc
+
+from conftest import readTable, writeTable, writeData, requestSite, serviceRequest
+
+# =============================================================================
+
+def siteBody (data_dir, site_no):
+
+   wellConstructionCache.cacheClear()
+   message, content, headerD = requestSite(data_dir, site_no)
+   assert message == ''
+
+   return content
+
+# =============================================================================
+
+def test_publish_switch_prune (tmp_path, monkeypatch, sourceTables):
+
+   data_dir    = str(tmp_path / "data")
+   os.makedirs(data_dir)
+   monkeypatch.setattr(wellConstructionService, 'data_dir', data_dir)
+
+   # Extracts with a hole diameter changed between them
+   #
+   tableD      = sourceTables['gw_hole']
+   rowL        = [list(x) for x in tableD['rows']]
+   site_no     = rowL[0][1]
+   dia         = tableD['columns'].index('hole_dia_va')
+   rowL[0][dia] = "%.1f" % (float(rowL[0][dia] or 0) + 20.0)
+
+   sourceD     = {'first': str(tmp_path / "first"), 'second': str(tmp_path / "second")}
+   writeData(sourceD['first'], sourceTables)
+   writeData(sourceD['second'], dict(sourceTables, gw_hole=dict(tableD, rows=rowL)))
+
+   bodyD       = dict((x, siteBody(y, site_no)) for x, y in sourceD.items())
+   assert bodyD['first'] != bodyD['second']
+
+   assert wc.snapshotDir(data_dir) == data_dir
+
+   # Each publish builds the stores and switches requests to it, the
+   #  earlier snapshot kept
+   #
+   nameD       = {}
+   for source in ['first', 'second']:
+      message, nameD[source] = wellConstructionSnapshot.publishSnapshot(data_dir, sourceD[source])
+      assert message == ''
+
+      snapshot_dir = os.path.join(data_dir, wc.snapshot_root, nameD[source])
+      assert wc.snapshotDir(data_dir) == snapshot_dir
+      assert wellConstructionSnapshot.currentName(data_dir) == nameD[source]
+      assert wellConstructionColumns.openColumnStore('gw_hole', snapshot_dir, os.path.join(snapshot_dir, "gw_hole_01.txt")) is not None
+
+      status, headerD, content = serviceRequest(site_no)
+      assert content == bodyD[source]
+
+   assert nameD['first'] != nameD['second']
+   assert wellConstructionSnapshot.snapshotNames(data_dir) == sorted(nameD.values())
+
+   # Switched back, and a switch to an unknown snapshot refused
+   #
+   assert wellConstructionSnapshot.switchSnapshot(data_dir, nameD['first']) == ''
+   status, headerD, content = serviceRequest(site_no)
+   assert content == bodyD['first']
+
+   assert len(wellConstructionSnapshot.switchSnapshot(data_dir, 'nosuch')) > 0
+   assert wellConstructionSnapshot.currentName(data_dir) == nameD['first']
+
+   # A publish that fails leaves the current snapshot and no partial one
+   #
+   empty_dir   = str(tmp_path / "empty")
+   os.makedirs(empty_dir)
+   message, name = wellConstructionSnapshot.publishSnapshot(data_dir, empty_dir)
+   assert len(message) > 0 and name is None
+   assert wellConstructionSnapshot.currentName(data_dir) == nameD['first']
+   assert sorted(os.listdir(os.path.join(data_dir, wc.snapshot_root))) == sorted(nameD.values())
+
+   # The current snapshot is never pruned, however old
+   #
+   assert wellConstructionSnapshot.pruneSnapshots(data_dir, keep=1) == []
+
+   assert wellConstructionSnapshot.switchSnapshot(data_dir, nameD['second']) == ''
+   assert wellConstructionSnapshot.pruneSnapshots(data_dir, keep=1) == [nameD['first']]
+   assert wellConstructionSnapshot.snapshotNames(data_dir) == [nameD['second']]
+
+   status, headerD, content = serviceRequest(site_no)
+   assert content == bodyD['second']
+
+# =============================================================================
+
+def test_ingest_snapshot (tmp_path, monkeypatch, sourceTables):
+
+   data_dir    = str(tmp_path / "data")
+   source_dir  = str(tmp_path / "source")
+   extract_dir = str(tmp_path / "extract")
+   os.makedirs(data_dir)
+   monkeypatch.setattr(wellConstructionService, 'data_dir', data_dir)
+
+   writeData(source_dir, sourceTables)
+   message, first = wellConstructionSnapshot.publishSnapshot(data_dir, source_dir)
+   assert message == ''
+   first_dir   = wc.snapshotDir(data_dir)
+
+   # A changed row applied to a clone of the current snapshot
+   #
+   tableD      = sourceTables['gw_hole']
+   changedRow  = list(tableD['rows'][0])
+   site_no     = changedRow[1]
+   dia         = tableD['columns'].index('hole_dia_va')
+   md          = tableD['columns'].index('hole_md')
+   changedRow[dia] = "%.1f" % (float(changedRow[dia] or 0) + 20.0)
+   changedRow[md]  = '01-JAN-2030 00:00:00'
+
+   os.makedirs(extract_dir)
+   writeTable(os.path.join(extract_dir, "gw_hole_01.txt"), tableD, [changedRow])
+
+   firstBody   = siteBody(first_dir, site_no)
+
+   message, second, reportD = wellConstructionSnapshot.ingestSnapshot(data_dir, [extract_dir], delta=True)
+   assert message == ''
+   assert second is not None and second != first
+   second_dir  = wc.snapshotDir(data_dir)
+
+   # The new snapshot holds the change, the one it was cloned from is left
+   #  as it was published
+   #
+   assert changedRow in readTable(os.path.join(second_dir, "gw_hole_01.txt"))['rows']
+   assert readTable(os.path.join(first_dir, "gw_hole_01.txt"))['rows'] == tableD['rows']
+
+   assert siteBody(first_dir, site_no) == firstBody
+   status, headerD, content = serviceRequest(site_no)
+   assert content == siteBody(second_dir, site_no)
+   assert content != firstBody
+
+   # Nothing changed, no snapshot published
+   #
+   message, name, reportD = wellConstructionSnapshot.ingestSnapshot(data_dir, [extract_dir], delta=True)
+   assert message == ''
+   assert name is None
+   assert wellConstructionSnapshot.currentName(data_dir) == second
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_spatial.py
+#
+# Project:  wellConstruction
+# Purpose:  Map box and nearest well queries checked against a scan of every
+#            site over random sites and queries.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, random
+
+import pytest
+
+import wellConstructionSpatial
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+sitefile_columnL = ['agency_cd', 'site_no', 'station_nm', 'dec_lat_va', 'dec_long_va', 'alt_va', 'well_depth_va', 'hole_depth_va']
+
+# Sites and query points of each area as latitude and longitude ranges,
+#  several ranges spread an area across 180 degrees, with the site and
+#  query counts. Rings around the pole reach across every column, so it
+#  takes fewer queries
+#
+areaD            = {
+                    'oregon'       : ([((41.9, 46.3), (-124.6, -116.4))], ((41.0, 47.0), (-126.0, -115.0)), 500, 100),
+                    'antimeridian' : ([((51.0, 53.0), (172.0, 180.0)), ((51.0, 53.0), (-180.0, -176.0))], ((50.5, 53.5), (178.0, 180.0)), 200, 100),
+                    'pole'         : ([((88.0, 90.0), (-180.0, 180.0))], ((88.5, 90.0), (-180.0, 180.0)), 100, 25)
+                   }
+
+# =============================================================================
+
+def randomPoint (rng, areaL):
+
+   latRange, lonRange = rng.choice(areaL)
+
+   return round(rng.uniform(*latRange), 6), round(rng.uniform(*lonRange), 6)
+
+# =============================================================================
+
+def writeSitefile (data_dir, rng, areaL, count):
+
+   # Sitefile of random wells, some sharing coordinates and a few without
+   #
+   rowL        = []
+   for i in range(count):
+      if len(rowL) > 0 and rng.random() < 0.05:
+         lat, lon = rowL[-1][3:5]
+      else:
+         lat, lon = randomPoint(rng, areaL)
+      rowL.append(['USGS', "%015d" % (10 ** 14 + i * 7919), "WELL %d" % i, str(lat), str(lon), "%.1f" % rng.uniform(0.0, 3000.0), "%.0f" % rng.uniform(10.0, 900.0), ''])
+   for row in rng.sample(rowL, 3):
+      row[3] = ''
+
+   rng.shuffle(rowL)
+   rowL.sort(key=lambda x: x[1])
+
+   fh = open(os.path.join(data_dir, "sitefile_01.txt"), 'w')
+   fh.write("# sitefile\n")
+   fh.write("\t".join(sitefile_columnL) + "\n")
+   fh.write("\t".join(["5s", "15s", "50s", "11n", "12n", "8n", "8n", "8n"]) + "\n")
+   for row in rowL:
+      fh.write("\t".join(row) + "\n")
+   fh.close()
+
+   return [(x[1], float(x[3]), float(x[4])) for x in rowL if len(x[3]) > 0]
+
+# =============================================================================
+
+def openStores (data_dir):
+
+   # Store read from the sitefile, then the written and mapped store
+   #
+   message, store = wellConstructionSpatial.loadSpatialStore(data_dir, 'files')
+   assert message == ''
+   yield store
+
+   message, count = wellConstructionSpatial.writeSpatialStore(data_dir, 'files')
+   assert message == ''
+   assert wellConstructionSpatial.mapSpatialStore(data_dir, 'files') is not None
+
+   message, store = wellConstructionSpatial.loadSpatialStore(data_dir, 'files')
+   assert message == ''
+   yield store
+
+# =============================================================================
+
+@pytest.mark.parametrize('area', sorted(areaD))
+def test_query_nearest (tmp_path, area):
+
+   rng = random.Random(area)
+   areaL, queryArea, count, query_count = areaD[area]
+   siteL = writeSitefile(str(tmp_path), rng, areaL, count)
+
+   queryL = [(randomPoint(rng, [queryArea]), rng.choice([1, 2, 5, 10, 50])) for x in range(query_count)]
+   queryL.append((randomPoint(rng, [queryArea]), len(siteL) + 10))
+
+   for store in openStores(str(tmp_path)):
+      for (lat, lon), k in queryL:
+         expectedL = sorted((wellConstructionSpatial.siteDistance((lat, lon), (x[1], x[2])), x[0]) for x in siteL)[:k]
+         nearL     = wellConstructionSpatial.queryNearest(store, lat, lon, k)
+
+         assert [(x['distance'], x['site_no']) for x in nearL] == expectedL
+
+# =============================================================================
+
+@pytest.mark.parametrize('area', sorted(areaD))
+def test_query_box (tmp_path, area):
+
+   rng = random.Random(area)
+   areaL, queryArea, count, query_count = areaD[area]
+   siteL = writeSitefile(str(tmp_path), rng, areaL, count)
+
+   # Boxes around the sites, a west edge east of the east edge wrapping
+   #  across 180 degrees, and boxes on the sites themselves
+   #
+   boxL  = []
+   for i in range(query_count):
+      south, north = sorted(rng.uniform(*x[0]) for x in [rng.choice(areaL), rng.choice(areaL)])
+      west, east   = [rng.uniform(*x[1]) for x in [rng.choice(areaL), rng.choice(areaL)]]
+      boxL.append((west, south, east, north))
+   for site_no, lat, lon in rng.sample(siteL, 10):
+      boxL.append((lon, lat, lon, lat))
+
+   for store in openStores(str(tmp_path)):
+      for west, south, east, north in boxL:
+         if west <= east:
+            expectedL = sorted(x[0] for x in siteL if south <= x[1] <= north and west <= x[2] <= east)
+         else:
+            expectedL = sorted(x[0] for x in siteL if south <= x[1] <= north and (x[2] >= west or x[2] <= east))
+
+         assert [x['site_no'] for x in wellConstructionSpatial.queryBox(store, west, south, east, north)] == expectedL
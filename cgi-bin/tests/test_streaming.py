@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_streaming.py
+#
+# Project:  wellConstruction
+# Purpose:  Streamed well construction checked against the bodies the
+#            baseline script printed for the extract of conftest.py, from
+#            each backend, the script and the service.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, sys, subprocess
+
+import pytest
+
+import wellConstructionCache
+import wellConstructionService
+import requestWellConstruction as wc
+
+from conftest import serviceRequest
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+baseline_dir    = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline")
+script_file     = os.path.abspath(wc.__file__)
+
+# =============================================================================
+
+def baselineBodies ():
+
+   # Bodies printed by the baseline script, each ending in its newline
+   #
+   bodyD = {}
+   for name in sorted(os.listdir(baseline_dir)):
+      fh = open(os.path.join(baseline_dir, name), 'r')
+      bodyD[os.path.splitext(name)[0]] = fh.read()
+      fh.close()
+
+   return bodyD
+
+# =============================================================================
+
+@pytest.mark.parametrize('backend', ['scan', 'files', 'sqlite'])
+def test_streamed_chunks (monkeypatch, extractData, backend):
+
+   data_dir    = extractData[backend]
+   monkeypatch.setattr(wc, 'backend', 'sqlite' if backend == 'sqlite' else 'files')
+
+   message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(data_dir)
+   assert message == ''
+
+   for site_no, body in baselineBodies().items():
+      message, siteInfoD = wc.readSiteInfo(site_no, data_dir)
+      assert message == ''
+
+      message, chunkIter = wc.streamWellConstruction(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD)
+      assert message == ''
+
+      chunkL = list(chunkIter)
+      assert len(chunkL) > 2
+      assert "".join(chunkL) + "\n" == body, site_no
+
+# =============================================================================
+
+@pytest.mark.parametrize('backend', ['files', 'sqlite'])
+def test_script_output (extractData, backend):
+
+   # Body after the headers, as the web server passes it on
+   #
+   data_dir    = extractData[backend]
+   environ     = dict(os.environ, WELL_CONSTRUCTION_BACKEND=backend)
+
+   for site_no, body in list(baselineBodies().items())[::7]:
+      environ['QUERY_STRING'] = "site_no=%s" % site_no
+      output = subprocess.run([sys.executable, script_file], cwd=os.path.dirname(data_dir), env=environ,
+                              stdout=subprocess.PIPE, check=True).stdout.decode('utf-8')
+      assert output.split("\n\n\n", 1)[1] == body, site_no
+
+# =============================================================================
+
+def test_service_output (monkeypatch, extractData):
+
+   monkeypatch.setattr(wellConstructionService, 'data_dir', extractData['files'])
+
+   wellConstructionCache.cacheClear()
+   for site_no, body in list(baselineBodies().items())[::7]:
+      status, headerD, content = serviceRequest(site_no)
+      assert status == '200 OK'
+      assert content + "\n" == body, site_no
@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionBenchmark.py
+#
+# Project:  wellConstruction
+# Purpose:  Script generates synthetic NWIS extracts at multiples of the
+#            current data set and measures site lookups against them, writing
+#            the results to a JSON file for comparison between releases.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Each synthetic site copies the records of a site in the source gw_cons
+# table, cycling through them in order, under a new site_no. Site numbers
+# increase with the copy so every table stays sorted by site_no and keeps the
+# per-site record counts of the source extract.
+#
+# Lookups are measured for each storage mode in turn
+#
+#   files    whole-table reads (no derived files)
+#   index    site_no offset indexes
+#   columns  memory-mapped column stores
+#   sqlite   SQLite database
+#
+# Cold lookups run the CGI script in a new process. Warm lookups run in this
+# process with the lookup tables loaded and the response cache disabled.
+#
+###############################################################################
+
+import os, sys, glob, shutil
+
+import json, time, random, platform, subprocess, statistics, datetime
+
+import resource
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+import requestWellConstruction as wc
+import wellConstructionIndex
+import wellConstructionColumns
+import wellConstructionDatabase
+import wellConstructionCache
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+modeL           = ['files', 'index', 'columns', 'sqlite']
+lookupL         = ['well_construction_lookup.json', 'aqfr_cd_query.txt']
+site_base       = 100000000000000
+
+sitefile_columnL = [
+                    'agency_cd', 'site_no', 'station_nm', 'site_tp_cd',
+                    'lat_va', 'long_va', 'dec_lat_va', 'dec_long_va', 'coord_datum_cd',
+                    'alt_va', 'alt_datum_cd', 'well_depth_va', 'hole_depth_va', 'sitefile_md'
+                   ]
+sitefile_formatL = ['5s', '15s', '50s', '7s', '11s', '12s', '16n', '16n', '10s', '8s', '10s', '8s', '8s', '25d']
+
+# =============================================================================
+
+def readTemplates (nwis_file):
+
+   # Header lines and each site's data lines split into fields
+   #
+   data_offset, keyIndex = wellConstructionIndex.headerInfo(nwis_file)
+   if data_offset is None:
+      return None, None, None
+
+   fh = open(nwis_file, 'rb')
+   header = fh.read(data_offset)
+
+   blockD = {}
+   for Line in fh:
+      valuesL = Line.split(b'\t')
+      site_no = valuesL[keyIndex].decode('utf-8')
+      if site_no not in blockD:
+         blockD[site_no] = []
+      blockD[site_no].append(valuesL)
+   fh.close()
+
+   return header, keyIndex, blockD
+
+# =============================================================================
+
+def sitefileTemplates (siteL, seed):
+
+   # Sitefile rows built from the site number when the source has no sitefile
+   #
+   randomGenerator = random.Random(seed)
+
+   header = ("# RDB synthetic sitefile for benchmarking\r\n#\r\n" +
+             "\t".join(sitefile_columnL) + "\r\n" +
+             "\t".join(sitefile_formatL) + "\r\n").encode('utf-8')
+
+   blockD = {}
+   for site_no in siteL:
+      lat_va  = site_no[:6]
+      long_va = site_no[6:13]
+      try:
+         dec_lat_va  = "%.7f" % (int(lat_va[:2]) + int(lat_va[2:4]) / 60.0 + int(lat_va[4:6]) / 3600.0)
+         dec_long_va = "%.7f" % -(int(long_va[:3]) + int(long_va[3:5]) / 60.0 + int(long_va[5:7]) / 3600.0)
+      except ValueError:
+         dec_lat_va  = ''
+         dec_long_va = ''
+      valuesL = [
+                 'USGS', site_no, 'WELL %s' % site_no[-6:], 'GW',
+                 lat_va, long_va, dec_lat_va, dec_long_va, 'NAD83',
+                 "%d" % randomGenerator.randint(0, 5000), 'NGVD29',
+                 "%d" % randomGenerator.randint(10, 800), '',
+                 '01-JAN-2010 00:00:00\r\n'
+                ]
+      blockD[site_no] = [[x.encode('utf-8') for x in valuesL]]
+
+   return header, 1, blockD
+
+# =============================================================================
+
+def generateExtract (source_dir, output_dir, scale, seed=0):
+
+   message     = ''
+   fileD       = {}
+
+   # Template sites from the source well construction table
+   #
+   cons_file   = os.path.join(source_dir, "gw_cons_01.txt")
+   if not os.path.exists(cons_file):
+      message = "Can not open file %s" % cons_file
+      return message, [], fileD
+
+   header, keyIndex, consD = readTemplates(cons_file)
+   templateL   = sorted(consD.keys())
+   siteCount   = len(templateL) * scale
+
+   if not os.path.exists(output_dir):
+      os.makedirs(output_dir, exist_ok=True)
+
+   # Write each table with the synthetic sites in increasing order
+   #
+   for file in wc.table_nmL:
+      nwis_file = os.path.join(source_dir, "".join([file, "_01.txt"]))
+      if os.path.exists(nwis_file):
+         header, keyIndex, blockD = readTemplates(nwis_file)
+         if header is None:
+            message = "Missing site_no column in file %s" % nwis_file
+            return message, [], fileD
+      elif file == 'sitefile':
+         header, keyIndex, blockD = sitefileTemplates(templateL, seed)
+      else:
+         message = "Can not open file %s" % nwis_file
+         return message, [], fileD
+
+      output_file = os.path.join(output_dir, "".join([file, "_01.txt"]))
+      fh = open(output_file, 'wb', buffering=1024 * 1024)
+      fh.write(header)
+      for site in range(siteCount):
+         template = templateL[site % len(templateL)]
+         if template not in blockD:
+            continue
+         siteKey = ("%015d" % (site_base + site)).encode('utf-8')
+         for valuesL in blockD[template]:
+            valuesL[keyIndex] = siteKey
+            fh.write(b'\t'.join(valuesL))
+      fh.close()
+
+      fileD[file] = os.path.getsize(output_file)
+
+   # Lookup tables are copied unchanged
+   #
+   for lookup_file in lookupL:
+      shutil.copyfile(os.path.join(source_dir, lookup_file), os.path.join(output_dir, lookup_file))
+
+   siteL = ["%015d" % (site_base + site) for site in (0, siteCount // 2, siteCount - 1)]
+
+   return message, siteL, fileD
+
+# =============================================================================
+
+def clearStores (data_dir):
+
+   for store_file in glob.glob(os.path.join(data_dir, "*.idx")) + glob.glob(os.path.join(data_dir, "*.db")):
+      os.remove(store_file)
+   shutil.rmtree(os.path.join(data_dir, "columns"), ignore_errors=True)
+
+# =============================================================================
+
+def buildStores (data_dir, mode):
+
+   message     = ''
+
+   if mode == 'index':
+      for file in wc.table_nmL:
+         message, siteCount = wellConstructionIndex.buildSiteIndex(os.path.join(data_dir, "".join([file, "_01.txt"])))
+         if len(message) > 0:
+            break
+      if len(message) < 1:
+         message, codeCount = wellConstructionIndex.buildCodeIndex(os.path.join(data_dir, "aqfr_cd_query.txt"), 'aqfr_cd')
+
+   elif mode == 'columns':
+      for file in wellConstructionColumns.column_tableL:
+         nwis_file = os.path.join(data_dir, "".join([file, "_01.txt"]))
+         message, siteCount = wellConstructionColumns.buildColumnStore(nwis_file, wellConstructionColumns.storeDirName(data_dir, file))
+         if len(message) > 0:
+            break
+
+   elif mode == 'sqlite':
+      message, tableD = wellConstructionDatabase.importDatabase(data_dir)
+
+   return message
+
+# =============================================================================
+
+def processIo ():
+
+   # Bytes passed through read calls by this process (Linux only)
+   #
+   try:
+      fh = open('/proc/self/io', 'r')
+      ioD = dict((x.split(':')[0], int(x.split(':')[1])) for x in fh.read().splitlines())
+      fh.close()
+   except (OSError, ValueError, IndexError):
+      return None
+
+   return ioD.get('rchar')
+
+# =============================================================================
+
+def pageFaults ():
+
+   usage = resource.getrusage(resource.RUSAGE_SELF)
+
+   return usage.ru_minflt + usage.ru_majflt
+
+# =============================================================================
+
+def latencySummary (timeL):
+
+   timeL = sorted(timeL)
+
+   return {
+           'count'      : len(timeL),
+           'min_ms'     : round(timeL[0] * 1000.0, 3),
+           'median_ms'  : round(statistics.median(timeL) * 1000.0, 3),
+           'p95_ms'     : round(timeL[min(len(timeL) - 1, int(len(timeL) * 0.95))] * 1000.0, 3),
+           'max_ms'     : round(timeL[-1] * 1000.0, 3)
+          }
+
+# =============================================================================
+
+def childRequest (data_dir, site_no, backend):
+
+   import io
+
+   # Single CGI request in this process, reporting its own usage
+   #
+   os.environ['QUERY_STRING'] = "site_no=%s" % site_no
+   os.environ.pop('WELL_CONSTRUCTION_CACHE', None)
+
+   wc.data_dir = data_dir
+   wc.backend  = backend
+
+   startIo     = processIo()
+   startFaults = pageFaults()
+
+   stdout      = sys.stdout
+   sys.stdout  = io.StringIO()
+   try:
+      wc.main()
+   except SystemExit:
+      pass
+   output      = sys.stdout.getvalue()
+   sys.stdout  = stdout
+
+   endIo       = processIo()
+
+   resultD = {
+              'bytes_out'   : len(output),
+              'bytes_read'  : endIo - startIo if startIo is not None else None,
+              'page_faults' : pageFaults() - startFaults,
+              'peak_rss_kb' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              'error'       : '"message"' in output
+             }
+
+   print(json.dumps(resultD))
+
+# =============================================================================
+
+def coldLookups (data_dir, site_no, backend, repeats):
+
+   timeL       = []
+   resultL     = []
+
+   command     = [sys.executable, os.path.abspath(__file__), '--child', data_dir, site_no, backend]
+
+   for repeat in range(repeats):
+      startTime = time.perf_counter()
+      output    = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+      timeL.append(time.perf_counter() - startTime)
+      resultL.append(json.loads(output.decode('utf-8').splitlines()[-1]))
+
+   return {
+           'latency'     : latencySummary(timeL),
+           'bytes_read'  : resultL[-1]['bytes_read'],
+           'page_faults' : resultL[-1]['page_faults'],
+           'bytes_out'   : resultL[-1]['bytes_out'],
+           'peak_rss_kb' : max(x['peak_rss_kb'] for x in resultL),
+           'error'       : resultL[-1]['error']
+          }
+
+# =============================================================================
+
+def warmLookup (lookupD, data_dir, site_no):
+
+   message, chunkIter, headerL = wc.requestWellConstruction(site_no,
+                                                            lookupD['DefinitionsD'],
+                                                            lookupD['ImageInfoD'],
+                                                            lookupD['aqfrInfoD'],
+                                                            data_dir)
+   if len(message) > 0:
+      return message, 0
+
+   return message, sum(len(x) for x in chunkIter)
+
+# =============================================================================
+
+def warmLookups (data_dir, siteL, backend, repeats, throughputSiteL):
+
+   # Build every response so the cache does not hide the lookup
+   #
+   wellConstructionCache.cache_size = 0
+   wellConstructionCache.cache_dir  = ''
+   wellConstructionCache.cacheClear()
+
+   wc.backend  = backend
+
+   message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(data_dir)
+   if len(message) > 0:
+      return message, None, None
+
+   lookupD     = {
+                  'DefinitionsD' : DefinitionsD,
+                  'ImageInfoD'   : ImageInfoD,
+                  'aqfrInfoD'    : aqfrInfoD
+                 }
+
+   # Repeated lookups of each position, after one to load the stores
+   #
+   siteD       = {}
+   for site_no in siteL:
+      message, bytesOut = warmLookup(lookupD, data_dir, site_no)
+
+      timeL       = []
+      startIo     = processIo()
+      startFaults = pageFaults()
+      for repeat in range(repeats):
+         startTime = time.perf_counter()
+         message, bytesOut = warmLookup(lookupD, data_dir, site_no)
+         timeL.append(time.perf_counter() - startTime)
+      endIo       = processIo()
+
+      siteD[site_no] = {
+                        'latency'     : latencySummary(timeL),
+                        'bytes_read'  : (endIo - startIo) // repeats if startIo is not None else None,
+                        'page_faults' : (pageFaults() - startFaults) // repeats,
+                        'bytes_out'   : bytesOut,
+                        'error'       : message
+                       }
+
+   # Requests per second over a spread of sites
+   #
+   startTime   = time.perf_counter()
+   for site_no in throughputSiteL:
+      warmLookup(lookupD, data_dir, site_no)
+   elapsed     = time.perf_counter() - startTime
+
+   throughputD = {
+                  'requests'            : len(throughputSiteL),
+                  'seconds'             : round(elapsed, 3),
+                  'requests_per_second' : round(len(throughputSiteL) / elapsed, 2) if elapsed > 0 else None
+                 }
+
+   return '', siteD, throughputD
+
+# =============================================================================
+
+def benchmarkScale (source_dir, work_dir, scale, modes, repeats, requests, seed, keep):
+
+   message     = ''
+
+   data_dir    = os.path.join(work_dir, "scale_%d" % scale)
+
+   screen_logger.info("Generating %dx extract in %s" % (scale, data_dir))
+   startTime   = time.perf_counter()
+   message, siteL, fileD = generateExtract(source_dir, data_dir, scale, seed)
+   if len(message) > 0:
+      return message, None
+
+   scaleD      = {
+                  'scale'            : scale,
+                  'generate_seconds' : round(time.perf_counter() - startTime, 3),
+                  'file_bytes'       : fileD,
+                  'sites'            : dict(zip(['start', 'middle', 'end'], siteL)),
+                  'modes'            : {}
+                 }
+
+   # Spread of sites for the throughput run
+   #
+   siteCount   = int(siteL[-1]) - site_base + 1
+   randomGenerator = random.Random(seed)
+   throughputSiteL = ["%015d" % (site_base + randomGenerator.randrange(siteCount)) for x in range(requests)]
+
+   clearStores(data_dir)
+
+   for mode in [x for x in modeL if x in modes]:
+
+      screen_logger.info("Measuring %s lookups at %dx" % (mode, scale))
+
+      # Derived stores for this mode, built in the same order readSiteInfo
+      #  prefers them so each mode measures its own store
+      #
+      startTime = time.perf_counter()
+      message   = buildStores(data_dir, mode)
+      if len(message) > 0:
+         return message, None
+      buildSeconds = round(time.perf_counter() - startTime, 3)
+
+      backend   = 'sqlite' if mode == 'sqlite' else 'files'
+
+      message, warmD, throughputD = warmLookups(data_dir, siteL, backend, repeats, throughputSiteL)
+      if len(message) > 0:
+         return message, None
+
+      positionD = {}
+      for position, site_no in zip(['start', 'middle', 'end'], siteL):
+         positionD[position] = {
+                                'site_no' : site_no,
+                                'cold'    : coldLookups(data_dir, site_no, backend, repeats),
+                                'warm'    : warmD[site_no]
+                               }
+
+      scaleD['modes'][mode] = {
+                               'build_seconds' : buildSeconds,
+                               'lookups'       : positionD,
+                               'throughput'    : throughputD
+                              }
+
+   scaleD['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+   if not keep:
+      shutil.rmtree(data_dir, ignore_errors=True)
+
+   return message, scaleD
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   parser = argparse.ArgumentParser(description='Benchmark well construction lookups against synthetic NWIS extracts')
+   parser.add_argument('--data', default='data', help='Directory holding the source NWIS data files')
+   parser.add_argument('--work', default='benchmark_data', help='Directory for the synthetic extracts')
+   parser.add_argument('--output', default='benchmark_results.json', help='JSON file for the results')
+   parser.add_argument('--scale', type=int, action='append', default=[], help='Multiple of the source extract (repeatable, default 10 100 1000)')
+   parser.add_argument('--mode', action='append', default=[], choices=modeL, help='Storage mode to measure (repeatable, default all)')
+   parser.add_argument('--repeats', type=int, default=5, help='Lookups per site and measurement (default 5)')
+   parser.add_argument('--requests', type=int, default=200, help='Lookups in the throughput run (default 200)')
+   parser.add_argument('--seed', type=int, default=0, help='Random seed for synthetic values and throughput sites')
+   parser.add_argument('--keep', action='store_true', help='Keep the synthetic extracts after measuring')
+   parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+   args   = parser.parse_args()
+
+   if args.child is not None:
+      childRequest(*args.child)
+      sys.exit(0)
+
+   scaleL = args.scale if len(args.scale) > 0 else [10, 100, 1000]
+   modes  = args.mode if len(args.mode) > 0 else modeL
+
+   resultsD = {
+               'program'   : wc.program,
+               'version'   : wc.version,
+               'generated' : datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+               'python'    : platform.python_version(),
+               'platform'  : platform.platform(),
+               'repeats'   : args.repeats,
+               'requests'  : args.requests,
+               'seed'      : args.seed,
+               'scales'    : []
+              }
+
+   for scale in scaleL:
+      message, scaleD = benchmarkScale(args.data, args.work, scale, modes, args.repeats, args.requests, args.seed, args.keep)
+      if len(message) > 0:
+         screen_logger.error(message)
+         sys.exit(1)
+      resultsD['scales'].append(scaleD)
+
+      # Results so far are kept if a larger scale is interrupted
+      #
+      tmp_file = args.output + ".tmp"
+      fh = open(tmp_file, 'w')
+      json.dump(resultsD, fh, indent=1)
+      fh.close()
+      os.replace(tmp_file, args.output)
+
+   screen_logger.info("Wrote %s" % args.output)
+
+   sys.exit(0)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionCache.py
+#
+# Project:  wellConstruction
+# Purpose:  Response cache for the well construction JSON keyed by site_no
+#            and the version of the input data files. Holds an in-process
+#            LRU for service mode and an optional on-disk cache directory
+#            shared between CGI invocations. Concurrent requests for a key
+#            not cached yet wait on the first one's flight.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, glob, shutil
+
+import hashlib, threading, time
+
+import wellConstructionProfile
+
+from collections import OrderedDict
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+cache_size      = int(os.environ.get('WELL_CONSTRUCTION_CACHE_SIZE', '1000'))
+cache_dir       = os.environ.get('WELL_CONSTRUCTION_CACHE', '')
+
+flight_timeout  = float(os.environ.get('WELL_CONSTRUCTION_FLIGHT_TIMEOUT', '30'))
+coalesce        = False
+
+memoryCacheD    = OrderedDict()
+memoryVersion   = None
+cacheLock       = threading.Lock()
+
+flightD         = {}
+flightStatsD    = {'flights': 0, 'coalesced': 0, 'timeouts': 0}
+
+# =============================================================================
+
+def dataVersion (fileL, tag=''):
+
+   # Fingerprint of the input files from their size and modification time
+   #
+   versionL = [tag]
+   for file in sorted(fileL):
+      try:
+         statInfo = os.stat(file)
+         versionL.append("%s:%d:%d" % (os.path.basename(file), statInfo.st_size, statInfo.st_mtime_ns))
+      except OSError:
+         versionL.append("%s:missing" % os.path.basename(file))
+
+   return hashlib.sha1("\n".join(versionL).encode('utf-8')).hexdigest()[:16]
+
+# =============================================================================
+
+def cacheFileName (version, site_no):
+
+   return os.path.join(cache_dir, version, "%s.json" % site_no)
+
+# =============================================================================
+
+def cacheGet (version, key):
+
+   global memoryVersion
+
+   # In-process cache
+   #
+   with cacheLock:
+      if memoryVersion != version:
+         memoryCacheD.clear()
+         memoryVersion = version
+
+      if key in memoryCacheD:
+         memoryCacheD.move_to_end(key)
+         return memoryCacheD[key]
+
+   # On-disk cache
+   #
+   if len(cache_dir) > 0:
+      cache_file = cacheFileName(version, key)
+      if os.path.exists(cache_file):
+         fh = open(cache_file, 'r')
+         content = fh.read()
+         fh.close()
+
+         cachePut(version, key, content, disk=False)
+
+         return content
+
+   return None
+
+# =============================================================================
+
+def cachePut (version, key, content, disk=True):
+
+   global memoryVersion
+
+   # In-process cache
+   #
+   with cacheLock:
+      if memoryVersion != version:
+         memoryCacheD.clear()
+         memoryVersion = version
+
+      memoryCacheD[key] = content
+      memoryCacheD.move_to_end(key)
+      while len(memoryCacheD) > cache_size:
+         memoryCacheD.popitem(last=False)
+
+   # On-disk cache
+   #
+   if disk and len(cache_dir) > 0:
+      version_dir = os.path.join(cache_dir, version)
+      if not os.path.exists(version_dir):
+         os.makedirs(version_dir, exist_ok=True)
+
+         # Remove entries for earlier versions of the data
+         #
+         for old_dir in glob.glob(os.path.join(cache_dir, "*")):
+            if old_dir != version_dir and os.path.isdir(old_dir):
+               shutil.rmtree(old_dir, ignore_errors=True)
+
+      cache_file = cacheFileName(version, key)
+      tmp_file   = "%s.%d.%d.tmp" % (cache_file, os.getpid(), threading.get_ident())
+
+      fh = open(tmp_file, 'w')
+      fh.write(content)
+      fh.close()
+
+      os.replace(tmp_file, cache_file)
+
+# =============================================================================
+
+def cacheStream (version, key, chunkIter):
+
+   # Pass chunks through to the caller and cache the whole content once the
+   #  last chunk has been sent
+   #
+   chunkL = []
+   for chunk in chunkIter:
+      chunkL.append(chunk)
+      yield chunk
+
+   cachePut(version, key, "".join(chunkL))
+
+# =============================================================================
+
+def flightJoin (version, key):
+
+   # The first request for a key missing from the in-process cache leads a
+   #  flight, concurrent requests for it wait until the leader ends it and
+   #  are handed its result. Returns the leader's flight, or the result a
+   #  waiting request was handed, None when it has to build its own
+   #
+   if not coalesce:
+      return None, None
+
+   with cacheLock:
+      if memoryVersion == version and key in memoryCacheD:
+         return None, None
+
+      # A flight older than the timeout is taken over, so a leader that
+      #  never ends its flight only delays the others by the timeout
+      #
+      flightKey = (version, key)
+      event, startTime, resultL = flightD.get(flightKey, (None, 0.0, None))
+      age       = time.monotonic() - startTime
+      if event is None or age >= flight_timeout:
+         event   = threading.Event()
+         resultL = []
+         flightD[flightKey] = (event, time.monotonic(), resultL)
+         flightStatsD['flights'] += 1
+         return (flightKey, event, resultL), None
+
+      flightStatsD['coalesced'] += 1
+
+   # Waiting time recorded as the coalesce phase
+   #
+   timer = wellConstructionProfile.phaseStart('coalesce')
+   done  = event.wait(flight_timeout - age)
+   wellConstructionProfile.phaseEnd(timer, records=1 if done else 0)
+
+   if not done:
+      with cacheLock:
+         flightStatsD['timeouts'] += 1
+      return None, None
+
+   if len(resultL) < 1:
+      return None, None
+
+   return None, resultL[0]
+
+# =============================================================================
+
+def flightEnd (flight, result=None):
+
+   # Result handed to the waiting requests, which then need neither the
+   #  cache nor a build of their own
+   #
+   if flight is None:
+      return
+
+   flightKey, event, resultL = flight
+   if result is not None:
+      resultL.append(result)
+
+   with cacheLock:
+      if flightD.get(flightKey, (None,))[0] is event:
+         del flightD[flightKey]
+
+   event.set()
+
+# =============================================================================
+
+def flightStats ():
+
+   # Flights led, requests that waited on one and waits that timed out
+   #
+   with cacheLock:
+      return dict(flightStatsD)
+
+wellConstructionProfile.totalsSource('flights', flightStats)
+
+# =============================================================================
+
+def cacheClear ():
+
+   global memoryVersion
+
+   with cacheLock:
+      memoryCacheD.clear()
+      memoryVersion = None
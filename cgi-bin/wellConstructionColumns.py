@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionColumns.py
+#
+# Project:  wellConstruction
+# Purpose:  Script compiles the NWIS RDB construction tables into typed,
+#            memory-mapped column files at ingest time and reads a site's
+#            rows back from them without any text parsing.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Store layout (data/columns/<table>/<version>/, see wellConstructionStore)
+#
+#   meta.json      columns, column types, row count and source file version
+#   site_no.keys   sorted site numbers, NUL padded to 15 bytes
+#   site_no.rows   uint32 first row of each site plus the final row count
+#   <column>.d     float64 values, NaN for blanks         (*_va columns)
+#   <column>.q     int64 values                           (numeric columns)
+#   <column>.I     uint32 index into the interned strings (all other columns)
+#   <column>.off   uint32 offsets of each interned string in <column>.str
+#   <column>.str   interned strings, UTF-8
+#
+###############################################################################
+
+import os, sys
+
+import json, math
+
+from array import array
+
+from wellConstructionRecords import recordClass
+from wellConstructionRdb import rdbHeader, rdbRows
+from wellConstructionStore import mapFile, MappedKeys, writeKeys, writeArray, newStore, publishStore, readStoreMeta, openStore
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+column_tableL   = ['gw_cons', 'gw_hole', 'gw_csng', 'gw_open', 'gw_geoh']
+store_version   = 1
+key_width       = 15
+
+# =============================================================================
+
+def storeDirName (data_dir, table):
+
+   return os.path.join(data_dir, "columns", table)
+
+# =============================================================================
+
+def columnType (column, format, valuesL):
+
+   # Depths, diameters and other measured values
+   #
+   if column.endswith('_va'):
+      try:
+         for value in valuesL:
+            if len(value) > 0:
+               float(value)
+         return 'd'
+      except ValueError:
+         return 'I'
+
+   # Sequence numbers and other integer columns
+   #
+   if format.endswith('n'):
+      try:
+         for value in valuesL:
+            if len(value) < 1 or str(int(value)) != value:
+               return 'I'
+         return 'q'
+      except ValueError:
+         return 'I'
+
+   # Codes, names and dates
+   #
+   return 'I'
+
+# =============================================================================
+
+def buildColumnStore (nwis_file, store_dir, keyColumn='site_no'):
+
+   message     = ''
+
+   statInfo    = os.stat(nwis_file)
+
+   # Parse head lines
+   #
+   fh = open(nwis_file, 'r')
+
+   columnL, formatL = rdbHeader(fh)
+   if columnL is None:
+      fh.close()
+      message = "Missing header in file %s" % nwis_file
+      return message, 0
+
+   if keyColumn not in columnL:
+      fh.close()
+      message = "Missing index column " + keyColumn
+      return message, 0
+
+   # Parse data lines into columns
+   #
+   columnD     = dict((column, []) for column in columnL)
+   rowCount    = 0
+   for valuesL in rdbRows(fh):
+      if len(valuesL) != len(columnL):
+         fh.close()
+         message = "Parsing issue in file %s unable to parse %s" % (nwis_file, "\t".join(valuesL))
+         return message, 0
+
+      for column, value in zip(columnL, valuesL):
+         columnD[column].append(value)
+      rowCount += 1
+
+   fh.close()
+
+   # Site row ranges
+   #
+   siteL       = columnD[keyColumn]
+   keyL        = []
+   rowL        = array('I')
+   for row in range(rowCount):
+      if row == 0 or siteL[row] != siteL[row - 1]:
+         if len(keyL) > 0 and siteL[row] < keyL[-1]:
+            message = "File %s is not sorted by %s at site %s" % (nwis_file, keyColumn, siteL[row])
+            return message, 0
+         if len(siteL[row]) > key_width:
+            message = "Site %s is longer than %d characters in file %s" % (siteL[row], key_width, nwis_file)
+            return message, 0
+         keyL.append(siteL[row])
+         rowL.append(row)
+   rowL.append(rowCount)
+
+   # Typed columns, strings interned in order of first appearance
+   #
+   typeD       = {}
+   columnAD    = {}
+   stringD     = {}
+   for column, format in zip(columnL, formatL):
+
+      valuesL  = columnD[column]
+      typeCode = columnType(column, format, valuesL)
+      typeD[column] = typeCode
+
+      if typeCode == 'd':
+         columnAD[column] = array('d', [float(x) if len(x) > 0 else math.nan for x in valuesL])
+
+      elif typeCode == 'q':
+         columnAD[column] = array('q', [int(x) for x in valuesL])
+
+      else:
+         internD = {}
+         columnA = array('I')
+         for value in valuesL:
+            if value not in internD:
+               internD[value] = len(internD)
+            columnA.append(internD[value])
+         columnAD[column] = columnA
+         stringD[column]  = [x.encode('utf-8') for x in internD.keys()]
+
+   writeColumnStore(store_dir, statInfo, columnL, typeD, keyL, rowL, columnAD, stringD)
+
+   return message, len(keyL)
+
+# =============================================================================
+
+def writeColumnStore (store_dir, statInfo, columnL, typeD, keyL, rowL, columnAD, stringD):
+
+   # Write store into a new version of the store directory
+   #
+   tmp_dir     = newStore(store_dir)
+
+   writeKeys(os.path.join(tmp_dir, "site_no.keys"), keyL, key_width)
+   writeArray(os.path.join(tmp_dir, "site_no.rows"), rowL)
+
+   for column in columnL:
+
+      typeCode = typeD[column]
+      if typeCode == 'I':
+         stringL = stringD[column]
+         offsetA = array('I', [0])
+         for string in stringL:
+            offsetA.append(offsetA[-1] + len(string))
+
+         writeArray(os.path.join(tmp_dir, column + ".off"), offsetA)
+
+         fh = open(os.path.join(tmp_dir, column + ".str"), 'wb')
+         fh.write(b''.join(stringL))
+         fh.close()
+
+      writeArray(os.path.join(tmp_dir, column + "." + typeCode), columnAD[column])
+
+   metaD = {
+            'version'      : store_version,
+            'byteorder'    : sys.byteorder,
+            'source_size'  : statInfo.st_size,
+            'source_mtime' : statInfo.st_mtime_ns,
+            'rows'         : rowL[-1],
+            'sites'        : len(keyL),
+            'columns'      : columnL,
+            'types'        : typeD
+           }
+
+   publishStore(tmp_dir, metaD)
+
+# =============================================================================
+
+def updateColumnStore (nwis_file, store_dir, store, siteRowD):
+
+   # Store for the new version of the table spliced from the rows of the
+   #  unchanged sites in the old store and the rows of the changed sites,
+   #  an empty list of rows removing a site. Returns None when a changed
+   #  value no longer fits the type of its column so the caller rebuilds.
+   #
+   statInfo    = os.stat(nwis_file)
+
+   metaD       = store['meta']
+   columnL     = metaD['columns']
+   typeD       = metaD['types']
+   keys        = store['keys']
+   rows        = store['rows']
+
+   oldKeyL     = list(MappedKeys(keys, key_width))
+   oldD        = dict((site_no, i) for i, site_no in enumerate(oldKeyL))
+
+   # Sites of the new store in order, each with its old site position or
+   #  its changed rows
+   #
+   keyL        = []
+   rowL        = array('I')
+   partL       = []
+   rowCount    = 0
+   for site_no in sorted(set(oldKeyL) | set(siteRowD.keys())):
+      if site_no in siteRowD:
+         if len(siteRowD[site_no]) < 1:
+            continue
+         if len(site_no) > key_width:
+            return None
+         partL.append((None, siteRowD[site_no]))
+         siteRows = len(siteRowD[site_no])
+      else:
+         position  = oldD[site_no]
+         partL.append((position, None))
+         siteRows  = rows[position + 1] - rows[position]
+      keyL.append(site_no)
+      rowL.append(rowCount)
+      rowCount += siteRows
+   rowL.append(rowCount)
+
+   # Columns copied in runs of old rows with the changed rows converted
+   #
+   columnAD    = {}
+   stringD     = {}
+   for columnIndex, column in enumerate(columnL):
+
+      typeCode, values, offsets, strings = store['columns'][column]
+      columnA  = array(typeCode)
+      if typeCode == 'I':
+         stringL = [bytes(strings[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+         internD = dict((string.decode('utf-8'), i) for i, string in enumerate(stringL))
+
+      for position, siteRowL in partL:
+         if siteRowL is None:
+            columnA.frombytes(values[rows[position]:rows[position + 1]].tobytes())
+            continue
+
+         for valuesL in siteRowL:
+            value = valuesL[columnIndex]
+            if typeCode == 'd':
+               try:
+                  columnA.append(float(value) if len(value) > 0 else math.nan)
+               except ValueError:
+                  return None
+            elif typeCode == 'q':
+               try:
+                  if str(int(value)) != value:
+                     return None
+               except ValueError:
+                  return None
+               columnA.append(int(value))
+            else:
+               if value not in internD:
+                  internD[value] = len(stringL)
+                  stringL.append(value.encode('utf-8'))
+               columnA.append(internD[value])
+
+      columnAD[column] = columnA
+      if typeCode == 'I':
+         stringD[column] = stringL
+
+   writeColumnStore(store_dir, statInfo, columnL, typeD, keyL, rowL, columnAD, stringD)
+
+   return len(keyL)
+
+# =============================================================================
+
+def openColumnStore (table, data_dir, nwis_file):
+
+   if not os.path.exists(nwis_file):
+      return None
+
+   # Store kept per process for the current version of the table
+   #
+   statInfo    = os.stat(nwis_file)
+   storeKey    = (os.path.abspath(data_dir), ('columns', table), (statInfo.st_size, statInfo.st_mtime_ns))
+
+   message, store = openStore(storeKey, lambda: ('', mapColumnStore(storeDirName(data_dir, table), statInfo)))
+
+   return store
+
+# =============================================================================
+
+def mapColumnStore (store_dir, statInfo):
+
+   # Check store exists and is current with the table
+   #
+   version_dir, metaD = readStoreMeta(store_dir, {
+                                                  'version'      : store_version,
+                                                  'source_size'  : statInfo.st_size,
+                                                  'source_mtime' : statInfo.st_mtime_ns
+                                                 })
+   if version_dir is None:
+      return None
+
+   # Map column files
+   #
+   columnD     = {}
+   for column in metaD['columns']:
+      typeCode = metaD['types'][column]
+      if typeCode == 'I':
+         columnD[column] = (typeCode,
+                            mapFile(os.path.join(version_dir, column + ".I"), 'I'),
+                            mapFile(os.path.join(version_dir, column + ".off"), 'I'),
+                            mapFile(os.path.join(version_dir, column + ".str")))
+      else:
+         columnD[column] = (typeCode,
+                            mapFile(os.path.join(version_dir, column + "." + typeCode), typeCode),
+                            None,
+                            None)
+
+   store = {
+            'meta'    : metaD,
+            'keys'    : mapFile(os.path.join(version_dir, "site_no.keys")),
+            'rows'    : mapFile(os.path.join(version_dir, "site_no.rows"), 'I'),
+            'columns' : columnD
+           }
+
+   return store
+
+# =============================================================================
+
+def findSiteRows (store, site_no):
+
+   keys        = store['keys']
+   siteKey     = site_no.encode('utf-8')[:key_width].ljust(key_width, b'\0')
+
+   low         = 0
+   high        = store['meta']['sites']
+   while low < high:
+      middle   = (low + high) // 2
+      indexSite = keys[middle * key_width:(middle + 1) * key_width]
+      if indexSite < siteKey:
+         low  = middle + 1
+      elif indexSite > siteKey:
+         high = middle
+      else:
+         return store['rows'][middle], store['rows'][middle + 1]
+
+   return 0, 0
+
+# =============================================================================
+
+def readSiteColumns (table, site_no, data_dir, nwis_file):
+
+   message     = ''
+
+   if table not in column_tableL:
+      return message, None
+
+   store = openColumnStore(table, data_dir, nwis_file)
+   if store is None:
+      return message, None
+
+   firstRow, lastRow = findSiteRows(store, site_no)
+
+   # Records for the site read straight from the mapped columns
+   #
+   siteInfoL   = []
+   columnD     = store['columns']
+   columnL     = store['meta']['columns']
+   Record      = recordClass(columnL, table)
+   for row in range(firstRow, lastRow):
+
+      valuesL  = []
+      for column in columnL:
+         typeCode, values, offsets, strings = columnD[column]
+         if typeCode == 'I':
+            index = values[row]
+            valuesL.append(strings[offsets[index]:offsets[index + 1]].decode('utf-8'))
+         elif typeCode == 'd':
+            value = values[row]
+            if math.isnan(value):
+               valuesL.append('')
+            else:
+               valuesL.append(value)
+         else:
+            valuesL.append(values[row])
+
+      siteInfoL.append(Record(valuesL))
+
+   return message, siteInfoL
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   screen_logger = logging.getLogger()
+   formatter     = logging.Formatter(fmt='%(message)s')
+   console       = logging.StreamHandler()
+   console.setFormatter(formatter)
+   screen_logger.addHandler(console)
+   screen_logger.setLevel(logging.INFO)
+
+   parser = argparse.ArgumentParser(description='Compile NWIS construction tables into memory-mapped column stores')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   parser.add_argument('tables', nargs='*', help='Tables to compile (default %s)' % ' '.join(column_tableL))
+   args   = parser.parse_args()
+
+   tableL = args.tables
+   if len(tableL) < 1:
+      tableL = column_tableL
+
+   status = 0
+   for table in tableL:
+      nwis_file = os.path.join(args.data, "".join([table, "_01.txt"]))
+      message, siteCount = buildColumnStore(nwis_file, storeDirName(args.data, table))
+      if len(message) > 0:
+         screen_logger.error(message)
+         status = 1
+      else:
+         screen_logger.info("Compiled %d sites from %s" % (siteCount, nwis_file))
+
+   sys.exit(status)
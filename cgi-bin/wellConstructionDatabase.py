@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionDatabase.py
+#
+# Project:  wellConstruction
+# Purpose:  Script imports the NWIS RDB tables into a single SQLite database
+#            with site_no indexes and reads a site's rows back over a pooled
+#            read-only connection.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Each RDB file becomes one table named after the file without the _01
+# suffix (gw_cons_01.txt -> gw_cons). Values are kept as the original text
+# so records match those read from the flat files, and rows keep file order
+# through the rowid.
+#
+###############################################################################
+
+import os, sys, glob
+
+import sqlite3, threading
+
+from wellConstructionRecords import recordClass
+from wellConstructionRdb import rdbHeader, rdbRows
+from wellConstructionIndex import coopKey, coopColumnL
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+database_name   = "well_construction.db"
+query_sites     = 500
+
+connectionPool  = threading.local()
+
+# =============================================================================
+
+def databaseFileName (data_dir):
+
+   return os.path.join(data_dir, database_name)
+
+# =============================================================================
+
+def tableName (nwis_file):
+
+   table_nm = os.path.splitext(os.path.basename(nwis_file))[0]
+   if table_nm.endswith('_01'):
+      table_nm = table_nm[:-3]
+
+   return table_nm
+
+# =============================================================================
+
+def importRdbFile (connection, nwis_file):
+
+   message     = ''
+   table_nm    = tableName(nwis_file)
+
+   fh = open(nwis_file, 'r')
+
+   # Parse head lines
+   #
+   columnL, formatL = rdbHeader(fh)
+   if columnL is None:
+      fh.close()
+      message = "Missing header in file %s" % nwis_file
+      return message, 0
+
+   columns     = ", ".join(['"%s" TEXT' % column for column in columnL])
+   connection.execute('DROP TABLE IF EXISTS "%s"' % table_nm)
+   connection.execute('CREATE TABLE "%s" (%s)' % (table_nm, columns))
+
+   # Parse data lines
+   #
+   rowL        = []
+   for valuesL in rdbRows(fh):
+      if len(valuesL) != len(columnL):
+         fh.close()
+         message = "Parsing issue in file %s unable to parse %s" % (nwis_file, "\t".join(valuesL))
+         return message, 0
+      rowL.append(valuesL)
+
+   fh.close()
+
+   insert      = 'INSERT INTO "%s" VALUES (%s)' % (table_nm, ", ".join(["?"] * len(columnL)))
+   connection.executemany(insert, rowL)
+
+   # Indexes on site number and sequence numbers
+   #
+   if 'site_no' in columnL:
+      keyL = ['site_no'] + [x for x in columnL if x == 'cons_seq_nu'] + [x for x in columnL if x.endswith('_seq_nu') and x != 'cons_seq_nu']
+      connection.execute('CREATE INDEX "%s_site_no" ON "%s" (%s)' % (table_nm, table_nm, ", ".join(['"%s"' % x for x in keyL])))
+
+   if 'aqfr_cd' in columnL:
+      connection.execute('CREATE INDEX "%s_aqfr_cd" ON "%s" ("aqfr_cd")' % (table_nm, table_nm))
+
+   if 'column_nm' in columnL:
+      connection.execute('CREATE INDEX "%s_column_nm" ON "%s" ("column_nm")' % (table_nm, table_nm))
+
+   return message, len(rowL)
+
+# =============================================================================
+
+def importKeyTable (connection, siteL=None):
+
+   # Normalised cooperator identifiers of each site, or of the given sites
+   #  in an existing table
+   #
+   if siteL is None:
+      connection.execute('DROP TABLE IF EXISTS "gw_coop_keys"')
+      connection.execute('CREATE TABLE "gw_coop_keys" ("column_nm" TEXT, "coop_key" TEXT, "site_no" TEXT)')
+      chunkLL = [None]
+   else:
+      chunkLL = [siteL[x:x + query_sites] for x in range(0, len(siteL), query_sites)]
+
+   rowS        = set()
+   columnL     = [x[1] for x in connection.execute('PRAGMA table_info("gw_coop")')]
+   for chunkL in chunkLL:
+      if chunkL is None:
+         where = ''
+      else:
+         where = ' WHERE site_no IN (%s)' % ", ".join(["?"] * len(chunkL))
+         connection.execute('DELETE FROM "gw_coop_keys"' + where, chunkL)
+
+      for column_nm in [x for x in coopColumnL if x in columnL]:
+         for row in connection.execute('SELECT "%s", site_no FROM gw_coop%s' % (column_nm, where), chunkL or []):
+            key = coopKey(row[0])
+            if len(key) > 0:
+               rowS.add((column_nm, key, row[1]))
+
+   connection.executemany('INSERT INTO "gw_coop_keys" VALUES (?, ?, ?)', sorted(rowS))
+   if siteL is None:
+      connection.execute('CREATE INDEX "gw_coop_keys_coop_key" ON "gw_coop_keys" ("column_nm", "coop_key")')
+
+   return len(rowS)
+
+# =============================================================================
+
+def importDatabase (data_dir):
+
+   message     = ''
+
+   nwis_fileL  = sorted(glob.glob(os.path.join(data_dir, "*_01.txt")))
+   nwis_fileL += [os.path.join(data_dir, "gw_gwdd.txt"), os.path.join(data_dir, "aqfr_cd_query.txt")]
+
+   # Build into a temporary file so readers keep a consistent snapshot
+   #
+   db_file     = databaseFileName(data_dir)
+   tmp_file    = db_file + ".tmp"
+   if os.path.exists(tmp_file):
+      os.remove(tmp_file)
+
+   connection  = sqlite3.connect(tmp_file)
+
+   tableD      = {}
+   for nwis_file in nwis_fileL:
+      if not os.path.exists(nwis_file):
+         continue
+
+      message, rowCount = importRdbFile(connection, nwis_file)
+      if len(message) > 0:
+         connection.close()
+         os.remove(tmp_file)
+         return message, tableD
+
+      tableD[tableName(nwis_file)] = rowCount
+
+   if 'gw_coop' in tableD:
+      tableD['gw_coop_keys'] = importKeyTable(connection)
+
+   connection.commit()
+   connection.execute('ANALYZE')
+   connection.close()
+
+   os.replace(tmp_file, db_file)
+
+   return message, tableD
+
+# =============================================================================
+
+def updateDatabase (data_dir, tableRowD):
+
+   # Rows of the changed sites replaced in one transaction, each table given
+   #  as {site_no: rows} with an empty list removing the site
+   #
+   message     = ''
+   rowCount    = 0
+
+   db_file     = databaseFileName(data_dir)
+   if not os.path.exists(db_file):
+      return message, rowCount
+
+   connection  = sqlite3.connect(db_file)
+   tableD      = dict((x[0], True) for x in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+
+   try:
+      for table_nm in sorted(tableRowD.keys()):
+         if table_nm not in tableD:
+            continue
+
+         siteRowD = tableRowD[table_nm]
+         siteL    = sorted(siteRowD.keys())
+         width    = len(list(connection.execute('PRAGMA table_info("%s")' % table_nm)))
+         for start in range(0, len(siteL), query_sites):
+            chunkL = siteL[start:start + query_sites]
+            connection.execute('DELETE FROM "%s" WHERE site_no IN (%s)' % (table_nm, ", ".join(["?"] * len(chunkL))), chunkL)
+
+         rowL     = [valuesL for site_no in siteL for valuesL in siteRowD[site_no]]
+         if len([x for x in rowL if len(x) != width]) > 0:
+            message = "Rows do not match the columns of table %s in database %s" % (table_nm, db_file)
+            connection.rollback()
+            connection.close()
+            return message, 0
+
+         connection.executemany('INSERT INTO "%s" VALUES (%s)' % (table_nm, ", ".join(["?"] * width)), rowL)
+         rowCount += len(rowL)
+
+      if 'gw_coop' in tableRowD and 'gw_coop_keys' in tableD:
+         importKeyTable(connection, sorted(tableRowD['gw_coop'].keys()))
+
+      connection.commit()
+
+   except sqlite3.Error as e:
+      connection.rollback()
+      message = "Unable to update database %s: %s" % (db_file, e)
+      rowCount = 0
+
+   connection.close()
+
+   return message, rowCount
+
+# =============================================================================
+
+def getConnection (db_file):
+
+   # One read-only connection per thread, reopened when the database is replaced
+   #
+   statInfo    = os.stat(db_file)
+   version     = (db_file, statInfo.st_ino, statInfo.st_mtime_ns)
+
+   if getattr(connectionPool, 'version', None) != version:
+      if getattr(connectionPool, 'connection', None) is not None:
+         connectionPool.connection.close()
+
+      connection = sqlite3.connect("file:%s?mode=ro" % db_file, uri=True)
+      connection.row_factory = sqlite3.Row
+
+      connectionPool.connection = connection
+      connectionPool.version    = version
+      connectionPool.tableD     = dict((x[0], True) for x in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+
+   return connectionPool.connection
+
+# =============================================================================
+
+def readSiteRows (data_dir, table_nm, siteL):
+
+   message     = ''
+   siteInfoD   = {}
+
+   db_file     = databaseFileName(data_dir)
+   if not os.path.exists(db_file):
+      message = "Can not open database %s" % database_name
+      return message, siteInfoD
+
+   connection  = getConnection(db_file)
+   if table_nm not in connectionPool.tableD:
+      message = "Missing table %s in database %s" % (table_nm, database_name)
+      return message, siteInfoD
+
+   # Indexed query for the requested sites in file order
+   #
+   for start in range(0, len(siteL), query_sites):
+      chunkL = siteL[start:start + query_sites]
+      query  = 'SELECT * FROM "%s" WHERE site_no IN (%s) ORDER BY rowid' % (table_nm, ", ".join(["?"] * len(chunkL)))
+      cursor = connection.execute(query, chunkL)
+      Record = recordClass([x[0] for x in cursor.description], table_nm)
+      for row in cursor:
+         record = Record(list(row))
+         if record['site_no'] not in siteInfoD:
+            siteInfoD[record['site_no']] = []
+         siteInfoD[record['site_no']].append(record)
+
+   return message, siteInfoD
+
+# =============================================================================
+
+def readTableRows (data_dir, table_nm):
+
+   # Column names and rows of a whole table in file order
+   #
+   db_file     = databaseFileName(data_dir)
+   if not os.path.exists(db_file):
+      return "Can not open database %s" % database_name, [], []
+
+   connection  = getConnection(db_file)
+   if table_nm not in connectionPool.tableD:
+      return "Missing table %s in database %s" % (table_nm, database_name), [], []
+
+   cursor      = connection.execute('SELECT * FROM "%s" ORDER BY rowid' % table_nm)
+
+   return '', [x[0] for x in cursor.description], [list(row) for row in cursor]
+
+# =============================================================================
+
+def readAqfrCodes (data_dir):
+
+   message     = ''
+   aqfrInfoD   = {}
+
+   db_file     = databaseFileName(data_dir)
+   if not os.path.exists(db_file):
+      message = "Can not open database %s" % database_name
+      return message, aqfrInfoD
+
+   connection  = getConnection(db_file)
+   if 'aqfr_cd_query' not in connectionPool.tableD:
+      message = "Missing table %s in database %s" % ('aqfr_cd_query', database_name)
+      return message, aqfrInfoD
+
+   for row in connection.execute('SELECT aqfr_cd, aqfr_nm FROM aqfr_cd_query ORDER BY rowid'):
+      aqfrInfoD[row['aqfr_cd']] = row['aqfr_nm']
+
+   return message, aqfrInfoD
+
+# =============================================================================
+
+def readAqfrCode (data_dir, aqfr_cd):
+
+   # Single aquifer name, the last row wins as in readAqfrCodes
+   #
+   db_file     = databaseFileName(data_dir)
+   if not os.path.exists(db_file):
+      return None
+
+   connection  = getConnection(db_file)
+   if 'aqfr_cd_query' not in connectionPool.tableD:
+      return None
+
+   row = connection.execute('SELECT aqfr_nm FROM aqfr_cd_query WHERE aqfr_cd = ? ORDER BY rowid DESC LIMIT 1', (aqfr_cd,)).fetchone()
+   if row is None:
+      return None
+
+   return row['aqfr_nm']
+
+# =============================================================================
+
+def readKeySites (data_dir, key, keyColumn):
+
+   # Sites holding a cooperator identifier, None without the key table
+   #
+   db_file     = databaseFileName(data_dir)
+   if not os.path.exists(db_file):
+      return None
+
+   connection  = getConnection(db_file)
+   if 'gw_coop_keys' not in connectionPool.tableD:
+      return None
+
+   cursor = connection.execute('SELECT site_no FROM gw_coop_keys WHERE column_nm = ? AND coop_key = ? ORDER BY site_no', (keyColumn, coopKey(key)))
+
+   return [row['site_no'] for row in cursor]
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   screen_logger = logging.getLogger()
+   formatter     = logging.Formatter(fmt='%(message)s')
+   console       = logging.StreamHandler()
+   console.setFormatter(formatter)
+   screen_logger.addHandler(console)
+   screen_logger.setLevel(logging.INFO)
+
+   parser = argparse.ArgumentParser(description='Import the NWIS RDB tables into a SQLite database')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   args   = parser.parse_args()
+
+   message, tableD = importDatabase(args.data)
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   for table_nm in sorted(tableD.keys()):
+      screen_logger.info("Imported %d rows into %s" % (tableD[table_nm], table_nm))
+   screen_logger.info("Wrote %s" % databaseFileName(args.data))
+
+   sys.exit(0)
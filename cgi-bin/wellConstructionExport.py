@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionExport.py
+#
+# Project:  wellConstruction
+# Purpose:  Script exports a pre-rendered well construction JSON file for
+#            every site in gw_cons plus a manifest, so the graph data can be
+#            served from a static file server or CDN.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Every table is sorted by site_no, so the export walks gw_cons site by site
+# and advances a cursor over each of the other tables in step with it. Each
+# table is read once from start to finish.
+#
+###############################################################################
+
+import os, sys
+
+import json, gzip, hashlib, datetime
+
+import multiprocessing
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+import requestWellConstruction as wc
+import wellConstructionIndex
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+compressionL    = ['gzip', 'brotli']
+shards_per_worker = 4
+
+# =============================================================================
+
+def openCursor (nwis_file, siteRange=None):
+
+   # Whole table or only the byte range holding the shard's sites
+   #
+   if siteRange is None:
+      fh = open(nwis_file, 'r')
+   else:
+      startOffset = wellConstructionIndex.findSiteOffset(nwis_file, siteRange[0]) if siteRange[0] is not None else 0
+      endOffset   = wellConstructionIndex.findSiteOffset(nwis_file, siteRange[1]) if siteRange[1] is not None else None
+      if startOffset == 0:
+         startOffset = wellConstructionIndex.headerInfo(nwis_file)[0]
+      fh = wellConstructionIndex.readRangeLines(nwis_file, startOffset, endOffset)
+
+   groupIter = wc.processNwisGroups("site_no", fh)
+
+   return {
+           'file'    : fh,
+           'groups'  : groupIter,
+           'current' : next(groupIter, None)
+          }
+
+# =============================================================================
+
+def cursorRecords (cursor, site_no):
+
+   # Advance past sites before this one in the sorted table
+   #
+   while cursor['current'] is not None and cursor['current'][0] < site_no:
+      cursor['current'] = next(cursor['groups'], None)
+
+   if cursor['current'] is not None and cursor['current'][0] == site_no:
+      return cursor['current'][1]
+
+   return None
+
+# =============================================================================
+
+def writeSiteFile (output_dir, site_no, jsonText, compressL):
+
+   content = jsonText.encode('utf-8')
+   site_file = os.path.join(output_dir, "%s.json" % site_no)
+
+   fh = open(site_file, 'wb')
+   fh.write(content)
+   fh.close()
+
+   fileD = {
+            'file'  : os.path.basename(site_file),
+            'bytes' : len(content),
+            'etag'  : '"%s"' % hashlib.sha1(content).hexdigest()
+           }
+
+   # Pre-compressed copies for static servers
+   #
+   if 'gzip' in compressL:
+      fh = open(site_file + ".gz", 'wb')
+      fh.write(gzip.compress(content, mtime=0))
+      fh.close()
+
+   if 'brotli' in compressL:
+      import brotli
+      fh = open(site_file + ".br", 'wb')
+      fh.write(brotli.compress(content))
+      fh.close()
+
+   return fileD
+
+# =============================================================================
+
+def exportSites (data_dir, output_dir, compressL=[], siteRange=None):
+
+   message     = ''
+   siteD       = {}
+   skippedD    = {}
+
+   # Lookup tables
+   #
+   message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(data_dir)
+   if len(message) > 0:
+      return message, siteD, skippedD
+
+   # Open a cursor on every table
+   #
+   cursorD     = {}
+   for file in wc.table_nmL:
+      nwis_file = os.path.join(data_dir, "".join([file, "_01.txt"]))
+      if not os.path.exists(nwis_file):
+         message = "Can not open file %s" % nwis_file
+         break
+      cursorD[file] = openCursor(nwis_file, siteRange)
+
+   if len(message) > 0:
+      for cursor in cursorD.values():
+         cursor['file'].close()
+      return message, siteD, skippedD
+
+   if not os.path.exists(output_dir):
+      os.makedirs(output_dir, exist_ok=True)
+
+   # Walk the well construction sites
+   #
+   consCursor  = cursorD['gw_cons']
+   while consCursor['current'] is not None:
+
+      site_no, consL = consCursor['current']
+      consCursor['current'] = next(consCursor['groups'], None)
+
+      siteInfoD = {'gw_cons': consL}
+      for file in wc.table_nmL:
+         if file == 'gw_cons':
+            continue
+         siteInfoL = cursorRecords(cursorD[file], site_no)
+         if siteInfoL is not None:
+            siteInfoD[file] = siteInfoL
+
+      if 'sitefile' not in siteInfoD:
+         skippedD[site_no] = "Site %s missing information in %s file" % (site_no, os.path.join(data_dir, "sitefile_01.txt"))
+         continue
+
+      # Assemble well construction
+      #
+      try:
+         message, jsonText = wc.buildWellConstruction(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD)
+      except Exception as error:
+         message = "Site %s unable to build well construction %s" % (site_no, error)
+
+      if len(message) > 0:
+         skippedD[site_no] = message
+         message = ''
+         continue
+
+      siteD[site_no] = writeSiteFile(output_dir, site_no, jsonText, compressL)
+
+   for cursor in cursorD.values():
+      cursor['file'].close()
+
+   return message, siteD, skippedD
+
+# =============================================================================
+
+def exportShard (shardArgs):
+
+   data_dir, output_dir, compressL, siteRange = shardArgs
+
+   return exportSites(data_dir, output_dir, compressL, siteRange)
+
+# =============================================================================
+
+def exportSitesParallel (data_dir, output_dir, compressL=[], workers=1):
+
+   message     = ''
+   siteD       = {}
+   skippedD    = {}
+
+   if workers < 2:
+      return exportSites(data_dir, output_dir, compressL)
+
+   # Split the sorted site_no key space into shards, several per worker so
+   #  an expensive range does not hold up the whole run
+   #
+   cons_file   = os.path.join(data_dir, "gw_cons_01.txt")
+   if not os.path.exists(cons_file):
+      message = "Can not open file %s" % cons_file
+      return message, siteD, skippedD
+
+   boundaryL   = wellConstructionIndex.shardSites(cons_file, workers * shards_per_worker)
+   boundaryL   = [None] + boundaryL + [None]
+   shardL      = [(data_dir, output_dir, compressL, (boundaryL[i], boundaryL[i + 1])) for i in range(len(boundaryL) - 1)]
+
+   # Export shards and merge the results in shard order
+   #
+   pool = multiprocessing.Pool(workers)
+   try:
+      for shardMessage, shardSiteD, shardSkippedD in pool.imap(exportShard, shardL):
+         if len(shardMessage) > 0:
+            message = shardMessage
+            break
+         siteD.update(shardSiteD)
+         skippedD.update(shardSkippedD)
+   finally:
+      pool.terminate()
+      pool.join()
+
+   return message, siteD, skippedD
+
+# =============================================================================
+
+def writeManifest (data_dir, output_dir, siteD, skippedD, compressL):
+
+   manifestD = {
+                'program'      : wc.program,
+                'version'      : wc.version,
+                'generated'    : datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'data_version' : wc.dataVersion(data_dir),
+                'compression'  : compressL,
+                'site_count'   : len(siteD),
+                'sites'        : dict((x, siteD[x]) for x in sorted(siteD.keys())),
+                'skipped'      : dict((x, skippedD[x]) for x in sorted(skippedD.keys()))
+               }
+
+   manifest_file = os.path.join(output_dir, "manifest.json")
+   tmp_file      = manifest_file + ".tmp"
+
+   fh = open(tmp_file, 'w')
+   json.dump(manifestD, fh, indent=1)
+   fh.close()
+
+   os.replace(tmp_file, manifest_file)
+
+   return manifest_file
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   parser = argparse.ArgumentParser(description='Export well construction JSON for every site for static hosting')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   parser.add_argument('--output', required=True, help='Directory for the exported site files and manifest')
+   parser.add_argument('--compress', action='append', default=[], choices=compressionL, help='Also write compressed copies (repeatable)')
+   parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default 1)')
+   args   = parser.parse_args()
+
+   if 'brotli' in args.compress:
+      try:
+         import brotli
+      except ImportError:
+         screen_logger.error("Brotli compression requires the brotli module")
+         sys.exit(1)
+
+   message, siteD, skippedD = exportSitesParallel(args.data, args.output, args.compress, args.workers)
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   manifest_file = writeManifest(args.data, args.output, siteD, skippedD, args.compress)
+
+   screen_logger.info("Exported %d sites, skipped %d, manifest %s" % (len(siteD), len(skippedD), manifest_file))
+
+   sys.exit(0)
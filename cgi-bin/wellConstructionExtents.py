@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionExtents.py
+#
+# Project:  wellConstruction
+# Purpose:  Depth and diameter extents of the well construction graph computed
+#            from the depth and diameter columns of every table at once, for
+#            one site or grouped for many sites, plus the axis intervals.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Blank or unparsable values become NaN and drop out of the reductions. Hole,
+# casing and open interval rows only count when their diameter, top and
+# bottom all parse, matching the rows drawn on the graph.
+#
+###############################################################################
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+nan             = float('nan')
+
+extentColumnD   = {
+                   'sitefile' : {'depth': ['well_depth_va', 'hole_depth_va'], 'dia': [],              'valid': []},
+                   'gw_geoh'  : {'depth': ['lith_top_va', 'lith_bottom_va'],  'dia': [],              'valid': []},
+                   'gw_cons'  : {'depth': ['seal_depth_va'],                  'dia': [],              'valid': []},
+                   'gw_hole'  : {'depth': ['hole_top_va', 'hole_bottom_va'],  'dia': ['hole_dia_va'], 'valid': ['hole_dia_va', 'hole_top_va', 'hole_bottom_va']},
+                   'gw_csng'  : {'depth': ['csng_bottom_va'],                 'dia': ['csng_dia_va'], 'valid': ['csng_dia_va', 'csng_top_va', 'csng_bottom_va']},
+                   'gw_open'  : {'depth': ['open_bottom_va'],                 'dia': ['open_dia_va'], 'valid': ['open_dia_va', 'open_top_va', 'open_bottom_va']}
+                  }
+
+# =============================================================================
+
+def toFloat (value):
+
+   try:
+      return float(value)
+   except (TypeError, ValueError):
+      return nan
+
+# =============================================================================
+
+def nanMax (valueL):
+
+   return max([x for x in valueL if x == x], default=nan)
+
+# =============================================================================
+
+def tableColumns (table, recordL):
+
+   # Depth and diameter columns of the table as floats, invalid rows as NaN
+   #
+   columnD  = extentColumnD[table]
+
+   floatD   = {}
+   for column in set(columnD['depth'] + columnD['dia'] + columnD['valid']):
+      floatD[column] = [toFloat(record[column]) for record in recordL]
+
+   if len(columnD['valid']) > 0:
+      validL = [all(x == x for x in row) for row in zip(*[floatD[x] for x in columnD['valid']])]
+      for column in floatD:
+         floatD[column] = [x if valid else nan for x, valid in zip(floatD[column], validL)]
+
+   return floatD
+
+# =============================================================================
+
+def extentValue (value):
+
+   if value != value:
+      return None
+
+   return value
+
+# =============================================================================
+
+def wellExtents (siteInfoD):
+
+   # Land surface is the top of the graph, the deepest value the bottom
+   #
+   depthL   = []
+   diaL     = []
+   for table in extentColumnD:
+      if table not in siteInfoD:
+         continue
+      floatD = tableColumns(table, siteInfoD[table])
+      depthL.extend([nanMax(floatD[x]) for x in extentColumnD[table]['depth']])
+      diaL.extend([nanMax(floatD[x]) for x in extentColumnD[table]['dia']])
+
+   return extentValue(nanMax(depthL)), 0.0, extentValue(nanMax(diaL))
+
+# =============================================================================
+
+def sitesExtents (sitesInfoD):
+
+   # Grouped reductions, one pass over each table's column for all sites
+   #
+   depthD   = dict((x, []) for x in sitesInfoD)
+   diaD     = dict((x, []) for x in sitesInfoD)
+   for table in extentColumnD:
+      siteL   = [x for x in sitesInfoD if table in sitesInfoD[x]]
+      recordL = [record for site_no in siteL for record in sitesInfoD[site_no][table]]
+      floatD  = tableColumns(table, recordL)
+
+      start   = 0
+      for site_no in siteL:
+         end = start + len(sitesInfoD[site_no][table])
+         depthD[site_no].extend([nanMax(floatD[x][start:end]) for x in extentColumnD[table]['depth']])
+         diaD[site_no].extend([nanMax(floatD[x][start:end]) for x in extentColumnD[table]['dia']])
+         start = end
+
+   extentD  = {}
+   for site_no in sitesInfoD:
+      extentD[site_no] = (extentValue(nanMax(depthD[site_no])), 0.0, extentValue(nanMax(diaD[site_no])))
+
+   return extentD
+
+# =============================================================================
+
+def extentAxes (extent):
+
+   # Axis minimum, maximum and tick interval as drawn by the graph
+   #
+   depth_max, depth_min, dia_max = extent
+
+   axisD = {'y': None, 'x': None}
+   if depth_max is not None:
+      y_min, y_max, y_interval = get_max_min(depth_min, depth_max)
+      axisD['y'] = (max(y_min, 0.0), y_max, y_interval)
+   if dia_max is not None:
+      axisD['x'] = get_max_min(0.0, dia_max)
+
+   return axisD
+
+# =============================================================================
+
+def get_max_min(min_value, max_value):
+
+    factor         = 0.01
+    interval_shift = 0.67;
+    delta          = max_value - min_value
+
+    interval       = factor;
+    delta          = delta / 5.0;
+
+    # Determine interval
+    #
+    while delta > factor:
+        if delta <= (factor * 1):
+            interval = factor * 1
+        elif (delta <= (factor * 2)):
+            interval = factor * 2
+        elif (delta <= (factor * 2.5)):
+            if (factor < 10.0):
+                interval = factor * 2
+            else :
+                interval = factor * 2.5
+        elif (delta <= (factor * 5)):
+            interval = factor * 5
+        else:
+            interval = factor * 10
+        factor = factor * 10
+
+    # Maximum
+    #
+    factor = int(max_value / interval)
+    value  = factor * interval
+    if(max_value > value ):
+        value = (factor + 1) * interval;
+
+    if(abs(max_value - value) <= interval_shift * interval):
+       max_value = value + interval
+    else:
+       max_value = value
+
+    # Minimum
+    #
+    factor = int(min_value / interval)
+    value  = int(factor * interval)
+    if(min_value < value ):
+        value = (factor - 1) * interval;
+
+    if(abs(min_value - value) <= interval_shift * interval):
+       min_value = value - interval
+    else:
+       min_value = value
+
+    return min_value,max_value,interval
@@ -0,0 +1,719 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionIndex.py
+#
+# Project:  wellConstruction
+# Purpose:  Script builds and reads the site_no offset indexes for the NWIS
+#            RDB tables so a site lookup seeks straight to its block of
+#            records instead of scanning the whole file.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, sys, glob, re
+
+import mmap, struct
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+#
+# Index file layout
+#
+#   header  magic, source size, source mtime (ns), header bytes, entry count
+#   entries site_no (NUL padded), byte offset, byte length; sorted by site_no
+#
+index_magic     = b'WCIDX001'
+index_header    = struct.Struct('<8sQQQQ')
+index_entry     = struct.Struct('<15sQI')
+key_width       = 15
+
+#
+# Key index file layout, for identifiers that are not the sort order of the
+#  table and may name more than one site
+#
+#   header  magic, source size, source mtime (ns), header bytes, entry count
+#   entries key (NUL padded), site_no (NUL padded); sorted by key then site_no
+#
+key_magic       = b'WCKEY001'
+key_entry       = struct.Struct('<15s15s')
+
+coopIdRe        = re.compile(r'^([A-Z]+)0*(\d+)$')
+coopColumnL     = ['coop_site_no', 'registration_no_va']
+
+# =============================================================================
+
+def indexFileName (nwis_file, keyColumn='site_no'):
+
+   if keyColumn == 'site_no':
+      return os.path.splitext(nwis_file)[0] + ".idx"
+
+   return os.path.splitext(nwis_file)[0] + "." + keyColumn + ".idx"
+
+# =============================================================================
+
+def writeIndex (index_file, statInfo, data_offset, blockD):
+
+   # Write index to a temporary file and move into place
+   #
+   tmp_file    = index_file + ".tmp"
+
+   fh = open(tmp_file, 'wb')
+   fh.write(index_header.pack(index_magic,
+                              statInfo.st_size,
+                              statInfo.st_mtime_ns,
+                              data_offset,
+                              len(blockD)))
+   for indexKey in sorted(blockD.keys()):
+      blockStart, blockLength = blockD[indexKey]
+      fh.write(index_entry.pack(indexKey, blockStart, blockLength))
+   fh.close()
+
+   os.replace(tmp_file, index_file)
+
+# =============================================================================
+
+def scanSiteBlocks (nwis_file, keyColumn='site_no'):
+
+   message     = ''
+   blockD      = {}
+
+   fh = open(nwis_file, 'rb')
+
+   # Parse head lines
+   #
+   columnL     = None
+   offset      = 0
+   while True:
+
+      Line    = fh.readline()
+      if len(Line) < 1:
+         break
+      offset += len(Line)
+
+      # Grab column names in header
+      #
+      if Line[:1] != b'#':
+         columnL = Line.decode('utf-8').strip("\n|\r").split('\t')
+         break
+
+   if columnL is None:
+      fh.close()
+      message = "Missing header in file %s" % nwis_file
+      return message, 0, blockD
+
+   # Format line in header section
+   #
+   offset     += len(fh.readline())
+   data_offset = offset
+
+   # Check column names
+   #
+   if keyColumn not in columnL:
+      fh.close()
+      message = "Missing index column " + keyColumn
+      return message, 0, blockD
+
+   keyIndex    = columnL.index(keyColumn)
+
+   # Parse data lines recording the start and length of each site block
+   #
+   indexSite   = None
+   blockStart  = offset
+   for Line in fh:
+
+      valuesL  = Line.split(b'\t')
+      if len(valuesL) > keyIndex:
+         lineSite = valuesL[keyIndex].strip()
+      else:
+         lineSite = b''
+
+      if lineSite != indexSite:
+         if indexSite is not None:
+            blockD[indexSite] = (blockStart, offset - blockStart)
+
+         if lineSite in blockD:
+            fh.close()
+            message = "Records for site %s are not contiguous in file %s" % (lineSite.decode('utf-8'), nwis_file)
+            return message, 0, {}
+
+         if len(lineSite) > key_width:
+            fh.close()
+            message = "Site %s is longer than %d characters in file %s" % (lineSite.decode('utf-8'), key_width, nwis_file)
+            return message, 0, {}
+
+         indexSite  = lineSite
+         blockStart = offset
+
+      offset += len(Line)
+
+   if indexSite is not None:
+      blockD[indexSite] = (blockStart, offset - blockStart)
+
+   fh.close()
+
+   return message, data_offset, blockD
+
+# =============================================================================
+
+def buildSiteIndex (nwis_file, keyColumn='site_no'):
+
+   # Source version
+   #
+   statInfo    = os.stat(nwis_file)
+
+   message, data_offset, blockD = scanSiteBlocks(nwis_file, keyColumn)
+   if len(message) > 0:
+      return message, 0
+
+   writeIndex(indexFileName(nwis_file, keyColumn), statInfo, data_offset, blockD)
+
+   return message, len(blockD)
+
+# =============================================================================
+
+def readIndexBlocks (nwis_file, keyColumn='site_no'):
+
+   # Header length and every block of a current index, None when the index
+   #  is missing or out of date
+   #
+   index_file  = indexFileName(nwis_file, keyColumn)
+   if not os.path.exists(index_file) or not os.path.exists(nwis_file):
+      return None, None
+
+   statInfo    = os.stat(nwis_file)
+
+   fh = open(index_file, 'rb')
+   content = fh.read()
+   fh.close()
+
+   if len(content) < index_header.size:
+      return None, None
+
+   magic, source_size, source_mtime, data_offset, entryCount = index_header.unpack_from(content, 0)
+   if magic != index_magic or source_size != statInfo.st_size or source_mtime != statInfo.st_mtime_ns:
+      return None, None
+
+   blockD      = {}
+   for indexSite, offset, length in index_entry.iter_unpack(content[index_header.size:index_header.size + entryCount * index_entry.size]):
+      blockD[indexSite.rstrip(b'\0')] = (offset, length)
+
+   return data_offset, blockD
+
+# =============================================================================
+
+def buildCodeIndex (nwis_file, keyColumn):
+
+   message     = ''
+   blockD      = {}
+
+   # Lookup tables are not sorted by code so each code points at the last
+   #  line holding it, matching a dictionary built from the whole file
+   #
+   data_offset, keyIndex = headerInfo(nwis_file, keyColumn)
+   if data_offset is None:
+      message = "Missing index column %s in file %s" % (keyColumn, nwis_file)
+      return message, 0
+
+   statInfo    = os.stat(nwis_file)
+
+   fh = open(nwis_file, 'rb')
+   fh.seek(data_offset)
+
+   offset      = data_offset
+   for Line in fh:
+      valuesL  = Line.split(b'\t')
+      if len(valuesL) > keyIndex:
+         indexKey = valuesL[keyIndex].strip()
+         if len(indexKey) > key_width:
+            fh.close()
+            message = "Code %s is longer than %d characters in file %s" % (indexKey.decode('utf-8'), key_width, nwis_file)
+            return message, 0
+         blockD[indexKey] = (offset, len(Line))
+      offset  += len(Line)
+
+   fh.close()
+
+   writeIndex(indexFileName(nwis_file, keyColumn), statInfo, data_offset, blockD)
+
+   return message, len(blockD)
+
+# =============================================================================
+
+def coopKey (value):
+
+   # Cooperator identifiers match regardless of case, spacing and the zero
+   #  padding of the well number, so CDWR 49906 and cdwr0049906 are the same
+   #
+   key   = re.sub(r'[\s\\]', '', str(value)).upper()
+   match = coopIdRe.match(key)
+   if match is not None:
+      key = match.group(1) + match.group(2)
+
+   return key
+
+# =============================================================================
+
+def keyEntries (rowL, keyIndex, siteIndex):
+
+   # Normalised key and site of each row holding a key
+   #
+   message     = ''
+   entryS      = set()
+
+   for valuesL in rowL:
+      if len(valuesL) <= max(keyIndex, siteIndex):
+         continue
+      indexKey = coopKey(valuesL[keyIndex]).encode('utf-8')
+      if len(indexKey) < 1:
+         continue
+      if len(indexKey) > key_width:
+         message = "Key %s is longer than %d characters" % (indexKey.decode('utf-8'), key_width)
+         return message, entryS
+      entryS.add((indexKey, valuesL[siteIndex].strip().encode('utf-8')))
+
+   return message, entryS
+
+# =============================================================================
+
+def writeKeyIndex (nwis_file, keyColumn, statInfo, data_offset, entryS):
+
+   # Write index to a temporary file and move into place
+   #
+   index_file  = indexFileName(nwis_file, keyColumn)
+   tmp_file    = index_file + ".tmp"
+
+   fh = open(tmp_file, 'wb')
+   fh.write(index_header.pack(key_magic,
+                              statInfo.st_size,
+                              statInfo.st_mtime_ns,
+                              data_offset,
+                              len(entryS)))
+   for indexKey, site_no in sorted(entryS):
+      fh.write(key_entry.pack(indexKey, site_no))
+   fh.close()
+
+   os.replace(tmp_file, index_file)
+
+# =============================================================================
+
+def buildKeyIndex (nwis_file, keyColumn):
+
+   data_offset, keyIndex = headerInfo(nwis_file, keyColumn)
+   if data_offset is None:
+      message = "Missing index column %s in file %s" % (keyColumn, nwis_file)
+      return message, 0
+
+   data_offset, siteIndex = headerInfo(nwis_file, 'site_no')
+   if data_offset is None:
+      message = "Missing index column %s in file %s" % ('site_no', nwis_file)
+      return message, 0
+
+   statInfo    = os.stat(nwis_file)
+
+   fh = open(nwis_file, 'rb')
+   fh.seek(data_offset)
+
+   message, entryS = keyEntries((Line.decode('utf-8').strip("\n|\r").split('\t') for Line in fh), keyIndex, siteIndex)
+   fh.close()
+   if len(message) > 0:
+      message = "%s in file %s" % (message, nwis_file)
+      return message, 0
+
+   writeKeyIndex(nwis_file, keyColumn, statInfo, data_offset, entryS)
+
+   return message, len(set(x[0] for x in entryS))
+
+# =============================================================================
+
+def readKeyEntries (nwis_file, keyColumn):
+
+   # Every key and site of a current key index, None when the index is
+   #  missing or out of date
+   #
+   index_file  = indexFileName(nwis_file, keyColumn)
+   if not os.path.exists(index_file) or not os.path.exists(nwis_file):
+      return None
+
+   statInfo    = os.stat(nwis_file)
+
+   fh = open(index_file, 'rb')
+   content = fh.read()
+   fh.close()
+
+   if len(content) < index_header.size:
+      return None
+
+   magic, source_size, source_mtime, data_offset, entryCount = index_header.unpack_from(content, 0)
+   if magic != key_magic or source_size != statInfo.st_size or source_mtime != statInfo.st_mtime_ns:
+      return None
+
+   return set((indexKey.rstrip(b'\0'), site_no.rstrip(b'\0')) for indexKey, site_no in key_entry.iter_unpack(content[index_header.size:index_header.size + entryCount * key_entry.size]))
+
+# =============================================================================
+
+def readKeySites (nwis_file, key, keyColumn):
+
+   # Sites holding the key, None when the index is missing or out of date
+   #
+   index_file  = indexFileName(nwis_file, keyColumn)
+   if not os.path.exists(index_file) or not os.path.exists(nwis_file):
+      return None
+
+   statInfo    = os.stat(nwis_file)
+
+   fh = open(index_file, 'rb')
+   try:
+      indexMap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+   except ValueError:
+      fh.close()
+      return None
+   fh.close()
+
+   if len(indexMap) < index_header.size:
+      indexMap.close()
+      return None
+
+   magic, source_size, source_mtime, data_offset, entryCount = index_header.unpack_from(indexMap, 0)
+   if magic != key_magic or source_size != statInfo.st_size or source_mtime != statInfo.st_mtime_ns:
+      indexMap.close()
+      return None
+
+   # Binary search for the first entry of the key
+   #
+   indexKey    = coopKey(key).encode('utf-8')[:key_width].ljust(key_width, b'\0')
+   low         = 0
+   high        = entryCount
+   while low < high:
+      middle = (low + high) // 2
+      entryKey, site_no = key_entry.unpack_from(indexMap, index_header.size + middle * key_entry.size)
+      if entryKey < indexKey:
+         low  = middle + 1
+      else:
+         high = middle
+
+   siteL       = []
+   while low < entryCount:
+      entryKey, site_no = key_entry.unpack_from(indexMap, index_header.size + low * key_entry.size)
+      if entryKey != indexKey:
+         break
+      siteL.append(site_no.rstrip(b'\0').decode('utf-8'))
+      low += 1
+
+   indexMap.close()
+
+   return siteL
+
+# =============================================================================
+
+def readSiteBlock (nwis_file, site_no, keyColumn='site_no'):
+
+   message     = ''
+   contentL    = None
+
+   # Check index exists and is current with the table
+   #
+   index_file  = indexFileName(nwis_file, keyColumn)
+   if not os.path.exists(index_file):
+      return message, contentL
+
+   statInfo    = os.stat(nwis_file)
+
+   fh = open(index_file, 'rb')
+   try:
+      indexMap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+   except ValueError:
+      fh.close()
+      return message, contentL
+   fh.close()
+
+   if len(indexMap) < index_header.size:
+      indexMap.close()
+      return message, contentL
+
+   magic, source_size, source_mtime, data_offset, entryCount = index_header.unpack_from(indexMap, 0)
+   if magic != index_magic or source_size != statInfo.st_size or source_mtime != statInfo.st_mtime_ns:
+      indexMap.close()
+      return message, contentL
+
+   # Binary search for the site
+   #
+   siteKey     = site_no.encode('utf-8')[:key_width].ljust(key_width, b'\0')
+   blockStart  = None
+   blockLength = 0
+   low         = 0
+   high        = entryCount
+   while low < high:
+      middle = (low + high) // 2
+      indexSite, offset, length = index_entry.unpack_from(indexMap, index_header.size + middle * index_entry.size)
+      if indexSite < siteKey:
+         low  = middle + 1
+      elif indexSite > siteKey:
+         high = middle
+      else:
+         blockStart  = offset
+         blockLength = length
+         break
+
+   indexMap.close()
+
+   # Read header lines plus the site block
+   #
+   fh = open(nwis_file, 'rb')
+   content = fh.read(data_offset)
+   if blockStart is not None:
+      fh.seek(blockStart)
+      content += fh.read(blockLength)
+   fh.close()
+
+   contentL = content.decode('utf-8').splitlines(True)
+
+   return message, contentL
+
+# =============================================================================
+
+def headerInfo (nwis_file, keyColumn='site_no'):
+
+   # Byte length of the comment, column and format lines plus key position
+   #
+   fh = open(nwis_file, 'rb')
+
+   columnL     = None
+   offset      = 0
+   for Line in fh:
+      offset += len(Line)
+      if Line[:1] != b'#':
+         columnL = Line.decode('utf-8').strip("\n|\r").split('\t')
+         break
+
+   offset     += len(fh.readline())
+   fh.close()
+
+   if columnL is None or keyColumn not in columnL:
+      return None, None
+
+   return offset, columnL.index(keyColumn)
+
+# =============================================================================
+
+def lineStart (fh, position, data_offset):
+
+   # First line starting at or after position
+   #
+   if position <= data_offset:
+      fh.seek(data_offset)
+   else:
+      fh.seek(position - 1)
+      fh.readline()
+
+   return fh.tell()
+
+# =============================================================================
+
+def findSiteOffset (nwis_file, site_no, keyColumn='site_no'):
+
+   # Byte offset of the first line whose site is not before site_no found by
+   #  bisecting over byte positions of the sorted file
+   #
+   data_offset, keyIndex = headerInfo(nwis_file, keyColumn)
+   if data_offset is None:
+      return None
+
+   fileSize    = os.path.getsize(nwis_file)
+   siteKey     = site_no.encode('utf-8')
+
+   fh = open(nwis_file, 'rb')
+
+   low         = data_offset
+   high        = fileSize
+   while low < high:
+      middle = (low + high) // 2
+      start  = lineStart(fh, middle, data_offset)
+      Line   = fh.readline()
+      if len(Line) > 0 and Line.split(b'\t')[keyIndex] < siteKey:
+         low  = middle + 1
+      else:
+         high = middle
+
+   offset = lineStart(fh, low, data_offset)
+   fh.close()
+
+   return offset
+
+# =============================================================================
+
+def shardSites (nwis_file, shardCount, keyColumn='site_no'):
+
+   # Site numbers splitting the sorted file into roughly equal byte ranges
+   #
+   data_offset, keyIndex = headerInfo(nwis_file, keyColumn)
+   if data_offset is None:
+      return []
+
+   fileSize    = os.path.getsize(nwis_file)
+   boundaryL   = []
+
+   fh = open(nwis_file, 'rb')
+   for shard in range(1, shardCount):
+      lineStart(fh, data_offset + (fileSize - data_offset) * shard // shardCount, data_offset)
+      Line = fh.readline()
+      if len(Line) < 1:
+         break
+      site_no = Line.split(b'\t')[keyIndex].decode('utf-8')
+      if len(boundaryL) < 1 or site_no > boundaryL[-1]:
+         boundaryL.append(site_no)
+   fh.close()
+
+   return boundaryL
+
+# =============================================================================
+
+def readRangeLines (nwis_file, startOffset, endOffset):
+
+   # Header lines followed by the data lines between two byte offsets
+   #
+   fh = open(nwis_file, 'rb')
+
+   header = b''
+   for Line in fh:
+      header += Line
+      if Line[:1] != b'#':
+         break
+   header += fh.readline()
+
+   for Line in header.decode('utf-8').splitlines(True):
+      yield Line
+
+   fh.seek(startOffset)
+   position = startOffset
+   for Line in fh:
+      if endOffset is not None and position >= endOffset:
+         break
+      position += len(Line)
+      yield Line.decode('utf-8')
+
+   fh.close()
+
+# =============================================================================
+
+class LazyCodes:
+
+   # Read-only code lookup that resolves each code on first use and keeps it,
+   #  so codes a request never touches are never loaded. Codes not found
+   #  are kept as well, so they are not searched for again
+   #
+   def __init__ (self, resolveCode):
+
+      self.resolveCode = resolveCode
+      self.codeD       = {}
+
+   def __getitem__ (self, code):
+
+      if code not in self.codeD:
+         self.codeD[code] = self.resolveCode(code)
+
+      value = self.codeD[code]
+      if value is None:
+         raise KeyError(code)
+
+      return value
+
+   def __contains__ (self, code):
+
+      try:
+         self[code]
+      except KeyError:
+         return False
+
+      return True
+
+   def get (self, code, default=None):
+
+      try:
+         return self[code]
+      except KeyError:
+         return default
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   screen_logger = logging.getLogger()
+   formatter     = logging.Formatter(fmt='%(message)s')
+   console       = logging.StreamHandler()
+   console.setFormatter(formatter)
+   screen_logger.addHandler(console)
+   screen_logger.setLevel(logging.INFO)
+
+   parser = argparse.ArgumentParser(description='Build site_no offset indexes for the NWIS RDB tables')
+   parser.add_argument('files', nargs='*', help='NWIS RDB files to index (default data/*_01.txt)')
+   args   = parser.parse_args()
+
+   nwis_fileL = args.files
+   status     = 0
+   if len(nwis_fileL) < 1:
+      nwis_fileL = sorted(glob.glob(os.path.join("data", "*_01.txt")))
+
+      # Aquifer code lookup
+      #
+      aqfr_file = os.path.join("data", "aqfr_cd_query.txt")
+      if os.path.exists(aqfr_file):
+         message, codeCount = buildCodeIndex(aqfr_file, 'aqfr_cd')
+         if len(message) > 0:
+            screen_logger.error(message)
+            status = 1
+         else:
+            screen_logger.info("Indexed %d codes in %s" % (codeCount, aqfr_file))
+
+      # Cooperator well log and registration numbers
+      #
+      coop_file = os.path.join("data", "gw_coop_01.txt")
+      if os.path.exists(coop_file):
+         for keyColumn in coopColumnL:
+            message, keyCount = buildKeyIndex(coop_file, keyColumn)
+            if len(message) > 0:
+               screen_logger.error(message)
+               status = 1
+            else:
+               screen_logger.info("Indexed %d %s keys in %s" % (keyCount, keyColumn, coop_file))
+
+   for nwis_file in nwis_fileL:
+      message, siteCount = buildSiteIndex(nwis_file)
+      if len(message) > 0:
+         screen_logger.error(message)
+         status = 1
+      else:
+         screen_logger.info("Indexed %d sites in %s" % (siteCount, nwis_file))
+
+   sys.exit(status)
@@ -0,0 +1,730 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionIngest.py
+#
+# Project:  wellConstruction
+# Purpose:  Script applies a newer NWIS extract or a delta of changed rows to
+#            the data directory, rewriting only the changed site blocks of
+#            each table and updating the indexes, database, stores and
+#            caches for just the sites that changed.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Rows are keyed by site_no plus the table's *_seq_nu columns. An incoming
+# row replaces the row with the same key only when its *_md modification
+# date is newer; rows without a date replace the row when they differ. A
+# full extract (the default) also drops the rows and sites it no longer
+# holds, while a delta (--delta) only adds and replaces rows.
+#
+# Each table is rewritten by copying the unchanged runs of site blocks as
+# bytes and writing only the changed blocks, and its site_no index is
+# written from the new block positions. The cooperator key indexes, the
+# SQLite database and the column, interval and lithology stores are
+# updated for the changed sites when they were current before the ingest,
+# and a current spatial store is built again when the sitefile changed.
+#
+# The manifest data/ingest.json keeps the cache version the data had before
+# the first ingest and gives every changed site a new generation, so cached
+# responses of the other sites stay valid.
+#
+# Usage
+#
+#   python wellConstructionIngest.py --data data extract_dir
+#   python wellConstructionIngest.py --data data --delta gw_open_01.txt
+#
+###############################################################################
+
+import os, sys, glob
+
+import json, datetime
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+import requestWellConstruction as wc
+import wellConstructionIndex
+import wellConstructionColumns
+import wellConstructionDatabase
+import wellConstructionCache
+import wellConstructionIntervals
+import wellConstructionLithology
+import wellConstructionSpatial
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+backendL        = ['files', 'sqlite']
+modified_format = '%d-%b-%Y %H:%M:%S'
+copy_size       = 1 << 20
+
+# =============================================================================
+
+def readHeader (nwis_file):
+
+   # Comment, column and format lines as bytes, the column names and the
+   #  line ending of the file
+   #
+   fh = open(nwis_file, 'rb')
+
+   header      = b''
+   columnL     = None
+   for Line in fh:
+      header += Line
+      if Line[:1] != b'#':
+         columnL = Line.decode('utf-8').rstrip("\r\n").split('\t')
+         lineEnd = b'\r\n' if Line.endswith(b'\r\n') else b'\n'
+         break
+
+   if columnL is None:
+      fh.close()
+      return "Missing header in file %s" % nwis_file, None, None, None
+
+   header     += fh.readline()
+   fh.close()
+
+   return '', header, columnL, lineEnd
+
+# =============================================================================
+
+def splitRows (content, columnL, nwis_file):
+
+   message     = ''
+   rowL        = []
+
+   for Line in content.decode('utf-8').split('\n'):
+      Line = Line.rstrip('\r')
+      if len(Line) < 1:
+         continue
+      valuesL = Line.split('\t')
+      if len(valuesL) != len(columnL):
+         message = "Parsing issue in file %s unable to parse %s" % (nwis_file, Line)
+         return message, []
+      rowL.append(valuesL)
+
+   return message, rowL
+
+# =============================================================================
+
+def tableKeys (columnL):
+
+   # Positions of site_no and the sequence numbers identifying a row
+   #
+   keyL = ['site_no'] + [x for x in columnL if x == 'cons_seq_nu'] + [x for x in columnL if x.endswith('_seq_nu') and x != 'cons_seq_nu']
+
+   return [columnL.index(x) for x in keyL]
+
+# =============================================================================
+
+def modifiedDate (value):
+
+   try:
+      return datetime.datetime.strptime(value.strip(), modified_format)
+   except ValueError:
+      return None
+
+# =============================================================================
+
+def rowKey (valuesL):
+
+   # Sequence numbers ordered as numbers
+   #
+   return [(0, int(x), '') if x.strip().isdigit() else (1, 0, x) for x in valuesL]
+
+# =============================================================================
+
+def mergeRows (oldRowL, newRowL, keyIndexL, mdIndex, complete=True):
+
+   # Rows of a site once the incoming rows are applied, with the counts of
+   #  rows applied and skipped as no newer than the row they would replace
+   #
+   oldD        = dict((tuple(x[i] for i in keyIndexL), x) for x in oldRowL)
+   if complete:
+      mergedD  = {}
+   else:
+      mergedD  = dict(oldD)
+
+   applied     = 0
+   skipped     = 0
+   for valuesL in newRowL:
+      rowId  = tuple(valuesL[i] for i in keyIndexL)
+      oldRow = oldD.get(rowId)
+
+      newer  = oldRow is None or valuesL != oldRow
+      if newer and oldRow is not None and mdIndex is not None:
+         oldDate = modifiedDate(oldRow[mdIndex])
+         newDate = modifiedDate(valuesL[mdIndex])
+         if oldDate is not None and newDate is not None:
+            newer = newDate > oldDate
+
+      if newer:
+         mergedD[rowId] = valuesL
+         applied += 1
+      else:
+         if valuesL != oldRow:
+            skipped += 1
+         mergedD[rowId] = oldRow
+
+   mergedL     = list(mergedD.values())
+   if not complete and len(mergedL) > len(oldRowL):
+      mergedL.sort(key=lambda x: rowKey([x[i] for i in keyIndexL[1:]]))
+
+   return mergedL, applied, skipped
+
+# =============================================================================
+
+def tableBlocks (nwis_file):
+
+   # Site blocks from a current index, or found by scanning the file
+   #
+   data_offset, blockD = wellConstructionIndex.readIndexBlocks(nwis_file)
+   if blockD is not None:
+      return '', data_offset, blockD
+
+   return wellConstructionIndex.scanSiteBlocks(nwis_file)
+
+# =============================================================================
+
+def readBlock (fh, blockD, site_no):
+
+   if site_no not in blockD:
+      return b''
+
+   blockStart, blockLength = blockD[site_no]
+   fh.seek(blockStart)
+
+   return fh.read(blockLength)
+
+# =============================================================================
+
+def tableChanges (nwis_file, source_file, delta=False):
+
+   # Changed sites of the table with their rows after the ingest, an empty
+   #  list removing the site
+   #
+   siteRowD    = {}
+   countD      = {'rows': 0, 'skipped': 0}
+
+   message, header, columnL, lineEnd = readHeader(nwis_file)
+   if len(message) > 0:
+      return message, siteRowD, countD
+
+   message, sourceHeader, sourceColumnL, sourceEnd = readHeader(source_file)
+   if len(message) > 0:
+      return message, siteRowD, countD
+
+   if sourceColumnL != columnL:
+      message = "Columns of %s do not match %s" % (source_file, nwis_file)
+      return message, siteRowD, countD
+
+   if 'site_no' not in columnL:
+      message = "Missing index column site_no in file %s" % nwis_file
+      return message, siteRowD, countD
+
+   keyIndexL   = tableKeys(columnL)
+   mdIndexL    = [i for i, x in enumerate(columnL) if x.endswith('_md')]
+   mdIndex     = mdIndexL[0] if len(mdIndexL) > 0 else None
+
+   message, data_offset, blockD = tableBlocks(nwis_file)
+   if len(message) > 0:
+      return message, siteRowD, countD
+
+   # Incoming rows of each site, a delta in any order and an extract as
+   #  the site blocks of the sorted file
+   #
+   if delta:
+      fh = open(source_file, 'rb')
+      fh.seek(len(sourceHeader))
+      message, rowL = splitRows(fh.read(), columnL, source_file)
+      fh.close()
+      if len(message) > 0:
+         return message, siteRowD, countD
+
+      sourceD  = {}
+      for valuesL in rowL:
+         site_no = valuesL[keyIndexL[0]].strip().encode('utf-8')
+         if site_no not in sourceD:
+            sourceD[site_no] = []
+         sourceD[site_no].append(valuesL)
+      siteL    = sorted(sourceD.keys())
+
+   else:
+      message, source_offset, sourceBlockD = wellConstructionIndex.scanSiteBlocks(source_file)
+      if len(message) > 0:
+         return message, siteRowD, countD
+      siteL    = sorted(set(blockD.keys()) | set(sourceBlockD.keys()))
+      sourceFh = open(source_file, 'rb')
+
+   # Compare each site's rows with the table
+   #
+   fh = open(nwis_file, 'rb')
+   for site_no in siteL:
+
+      oldBlock = readBlock(fh, blockD, site_no)
+
+      if delta:
+         newRowL = sourceD[site_no]
+      else:
+         newBlock = readBlock(sourceFh, sourceBlockD, site_no)
+         if newBlock.replace(sourceEnd, lineEnd) == oldBlock:
+            continue
+         message, newRowL = splitRows(newBlock, columnL, source_file)
+         if len(message) > 0:
+            break
+
+      message, oldRowL = splitRows(oldBlock, columnL, nwis_file)
+      if len(message) > 0:
+         break
+
+      mergedL, applied, skipped = mergeRows(oldRowL, newRowL, keyIndexL, mdIndex, not delta)
+      countD['skipped'] += skipped
+      if mergedL != oldRowL:
+         siteRowD[site_no.decode('utf-8')] = mergedL
+         countD['rows'] += applied
+
+   fh.close()
+   if not delta:
+      sourceFh.close()
+
+   return message, siteRowD, countD
+
+# =============================================================================
+
+def copyRange (inFh, outFh, start, end):
+
+   inFh.seek(start)
+   while start < end:
+      chunk  = inFh.read(min(copy_size, end - start))
+      outFh.write(chunk)
+      start += len(chunk)
+
+# =============================================================================
+
+def writeTable (nwis_file, siteRowD):
+
+   # Table rewritten to a temporary file, unchanged runs of site blocks
+   #  copied as bytes, with the new block of every site for its index
+   #
+   message, header, columnL, lineEnd = readHeader(nwis_file)
+   if len(message) > 0:
+      return message, None, 0, {}
+
+   message, data_offset, blockD = tableBlocks(nwis_file)
+   if len(message) > 0:
+      return message, None, 0, {}
+
+   changeD     = dict((x.encode('utf-8'), siteRowD[x]) for x in siteRowD)
+   oldL        = sorted(blockD.items(), key=lambda x: x[1][0])
+   addL        = sorted([x for x in changeD if x not in blockD])
+
+   tmp_file    = nwis_file + ".tmp"
+   newBlockD   = {}
+
+   inFh  = open(nwis_file, 'rb')
+   outFh = open(tmp_file, 'wb')
+   outFh.write(inFh.read(data_offset))
+
+   runL        = []
+
+   def flushRun ():
+      if len(runL) > 0:
+         runStart = runL[0][1]
+         runEnd   = runL[-1][1] + runL[-1][2]
+         shift    = outFh.tell() - runStart
+         copyRange(inFh, outFh, runStart, runEnd)
+         for site_no, blockStart, blockLength in runL:
+            newBlockD[site_no] = (blockStart + shift, blockLength)
+         del runL[:]
+
+   def writeSite (site_no):
+      if len(changeD[site_no]) > 0:
+         blockStart = outFh.tell()
+         outFh.write(b''.join(['\t'.join(x).encode('utf-8') + lineEnd for x in changeD[site_no]]))
+         newBlockD[site_no] = (blockStart, outFh.tell() - blockStart)
+
+   # Old blocks in file order with the new sites placed before the first
+   #  site that sorts after them
+   #
+   for site_no, (blockStart, blockLength) in oldL:
+      while len(addL) > 0 and addL[0] < site_no:
+         flushRun()
+         writeSite(addL.pop(0))
+
+      if site_no in changeD:
+         flushRun()
+         writeSite(site_no)
+      else:
+         if len(runL) > 0 and runL[-1][1] + runL[-1][2] != blockStart:
+            flushRun()
+         runL.append((site_no, blockStart, blockLength))
+
+   flushRun()
+   for site_no in addL:
+      writeSite(site_no)
+
+   outFh.close()
+   inFh.close()
+
+   return message, tmp_file, data_offset, newBlockD
+
+# =============================================================================
+
+def readSitesRows (data_dir, table, siteL, backend='files'):
+
+   # Column names and rows of the given sites
+   #
+   if backend == 'sqlite':
+      message, siteInfoD = wellConstructionDatabase.readSiteRows(data_dir, table, siteL)
+      if len(message) > 0:
+         return message, [], []
+      connection = wellConstructionDatabase.getConnection(wellConstructionDatabase.databaseFileName(data_dir))
+      columnL  = [x[1] for x in connection.execute('PRAGMA table_info("%s")' % table)]
+      recordL  = [x for site_no in siteL for x in siteInfoD.get(site_no, [])]
+      return message, columnL, [list(x.values()) for x in recordL]
+
+   nwis_file = os.path.join(data_dir, "".join([table, "_01.txt"]))
+   if not os.path.exists(nwis_file):
+      return "Can not open file %s" % nwis_file, [], []
+
+   message, header, columnL, lineEnd = readHeader(nwis_file)
+   if len(message) > 0:
+      return message, [], []
+
+   message, data_offset, blockD = tableBlocks(nwis_file)
+   if len(message) > 0:
+      return message, [], []
+
+   fh = open(nwis_file, 'rb')
+   content = b''.join([readBlock(fh, blockD, x.encode('utf-8')) for x in siteL])
+   fh.close()
+
+   message, rowL = splitRows(content, columnL, nwis_file)
+
+   return message, columnL, rowL
+
+# =============================================================================
+
+def updateIntervals (data_dir, store, backend, siteL):
+
+   # Intervals of the changed sites read again and merged with the rest
+   #
+   intervalL   = wellConstructionIntervals.storeIntervals(store, set(siteL))
+
+   message, columnL, rowL = readSitesRows(data_dir, 'sitefile', siteL, backend)
+   if len(message) > 0:
+      return message, 0
+
+   altD        = wellConstructionIntervals.siteAltitudes(columnL, rowL)
+
+   for table in wellConstructionIntervals.interval_tableL:
+      message, columnL, rowL = readSitesRows(data_dir, table, siteL, backend)
+      if len(message) > 0:
+         return message, 0
+      intervalL.extend(wellConstructionIntervals.tableIntervals(table, columnL, rowL, altD))
+
+   intervalL.sort()
+
+   return wellConstructionIntervals.writeIntervalStore(data_dir, backend, intervalL)
+
+# =============================================================================
+
+def updateLithology (data_dir, store, backend, siteL):
+
+   # Postings of the changed sites read again and merged with the rest
+   #
+   summaryD    = wellConstructionLithology.storePostings(store, set(siteL))
+   postingD    = dict((x, {}) for x in wellConstructionLithology.lith_columnL)
+
+   message, columnL, rowL = readSitesRows(data_dir, 'gw_open', siteL, backend)
+   if len(message) > 0:
+      return message, {}
+
+   openD       = wellConstructionLithology.openSegments(columnL, rowL)
+
+   message, columnL, rowL = readSitesRows(data_dir, 'gw_geoh', siteL, backend)
+   if len(message) > 0:
+      return message, {}
+
+   message     = wellConstructionLithology.layerPostings(columnL, rowL, openD, postingD)
+   if len(message) > 0:
+      return message, {}
+
+   for column, codeD in wellConstructionLithology.summarizePostings(postingD).items():
+      for code, siteD in codeD.items():
+         summaryD[column].setdefault(code, {}).update(siteD)
+
+   return wellConstructionLithology.writeLithologyStore(data_dir, backend, summaryD)
+
+# =============================================================================
+
+def removeCacheEntries (version, siteL):
+
+   # Disk cache entries of the changed sites, no longer reachable under
+   #  their old keys
+   #
+   if len(wellConstructionCache.cache_dir) < 1:
+      return 0
+
+   count = 0
+   for site_no in siteL:
+      for cache_file in glob.glob(wellConstructionCache.cacheFileName(version, glob.escape(site_no))) + \
+                        glob.glob(wellConstructionCache.cacheFileName(version, glob.escape(site_no) + ".*")):
+         try:
+            os.remove(cache_file)
+            count += 1
+         except OSError:
+            pass
+
+   return count
+
+# =============================================================================
+
+def writeIngestManifest (data_dir, cacheD, siteL):
+
+   # Cache version kept for each backend with the generation of every site
+   #  changed since that version
+   #
+   manifestD   = wc.ingestManifest(data_dir)
+   generation  = manifestD.get('generation', 0) + 1
+
+   siteD       = dict(manifestD.get('sites', {}))
+   for site_no in siteL:
+      siteD[site_no] = generation
+
+   versionD    = {}
+   for backend in backendL:
+      versionD[backend] = {
+                           'cache' : cacheD[backend],
+                           'data'  : wellConstructionCache.dataVersion(wc.inputFileList(data_dir, backend), backend)
+                          }
+
+   content     = {
+                  'generation' : generation,
+                  'ingested'   : datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                  'versions'   : versionD,
+                  'sites'      : dict((x, siteD[x]) for x in sorted(siteD.keys()))
+                 }
+
+   manifest_file = os.path.join(data_dir, wc.ingest_manifest)
+   tmp_file      = manifest_file + ".tmp"
+
+   fh = open(tmp_file, 'w')
+   json.dump(content, fh, indent=1)
+   fh.close()
+
+   os.replace(tmp_file, manifest_file)
+
+   return generation
+
+# =============================================================================
+
+def sourceFiles (sourceL):
+
+   # Table files named like data/<table>_01.txt, or every such file in a
+   #  directory
+   #
+   fileL = []
+   for source in sourceL:
+      if os.path.isdir(source):
+         fileL.extend(sorted(glob.glob(os.path.join(source, "*_01.txt"))))
+      else:
+         fileL.append(source)
+
+   return fileL
+
+# =============================================================================
+
+def ingestData (data_dir, sourceL, delta=False):
+
+   message     = ''
+   reportD     = {}
+
+   # Changed sites of each table, found before anything is written
+   #
+   tableRowD   = {}
+   for source_file in sourceFiles(sourceL):
+      table     = wellConstructionDatabase.tableName(source_file)
+      nwis_file = os.path.join(data_dir, "".join([table, "_01.txt"]))
+      if not os.path.exists(nwis_file):
+         message = "No table %s in %s for %s" % (table, data_dir, source_file)
+         return message, reportD
+
+      message, siteRowD, countD = tableChanges(nwis_file, source_file, delta)
+      if len(message) > 0:
+         return message, reportD
+
+      countD['sites'] = len(siteRowD)
+      reportD[table]  = countD
+      if len(siteRowD) > 0:
+         tableRowD[table] = siteRowD
+
+   siteL       = sorted(set(site_no for siteRowD in tableRowD.values() for site_no in siteRowD))
+   if len(siteL) < 1:
+      return message, reportD
+
+   # Cache version of the data before the ingest and the derived stores
+   #  current with it
+   #
+   cacheD      = {}
+   manifestD   = wc.ingestManifest(data_dir)
+   for backend in backendL:
+      version  = wellConstructionCache.dataVersion(wc.inputFileList(data_dir, backend), backend)
+      versionD = manifestD.get('versions', {}).get(backend, {})
+      cacheD[backend] = versionD['cache'] if versionD.get('data') == version else version
+
+   columnStoreD = {}
+   for table in tableRowD:
+      if table in wellConstructionColumns.column_tableL:
+         store = wellConstructionColumns.openColumnStore(table, data_dir, os.path.join(data_dir, "".join([table, "_01.txt"])))
+         if store is not None:
+            columnStoreD[table] = store
+
+   intervalStore = None
+   lithologyStore = None
+   spatialBackend = None
+   for backend in backendL:
+      store = wellConstructionIntervals.mapIntervalStore(data_dir, backend)
+      if store is not None:
+         intervalStore = (backend, store)
+      store = wellConstructionLithology.mapLithologyStore(data_dir, backend)
+      if store is not None:
+         lithologyStore = (backend, store)
+      if wellConstructionSpatial.mapSpatialStore(data_dir, backend) is not None:
+         spatialBackend = backend
+
+   coop_file   = os.path.join(data_dir, "gw_coop_01.txt")
+   keyEntryD   = {}
+   if 'gw_coop' in tableRowD:
+      for keyColumn in wellConstructionIndex.coopColumnL:
+         entryS = wellConstructionIndex.readKeyEntries(coop_file, keyColumn)
+         if entryS is not None:
+            keyEntryD[keyColumn] = entryS
+
+   # Tables and their site_no indexes
+   #
+   for table, siteRowD in tableRowD.items():
+      nwis_file = os.path.join(data_dir, "".join([table, "_01.txt"]))
+      message, tmp_file, data_offset, blockD = writeTable(nwis_file, siteRowD)
+      if len(message) > 0:
+         return message, reportD
+
+      os.replace(tmp_file, nwis_file)
+      wellConstructionIndex.writeIndex(wellConstructionIndex.indexFileName(nwis_file), os.stat(nwis_file), data_offset, blockD)
+
+   # Cooperator key indexes
+   #
+   if len(keyEntryD) > 0:
+      message, header, columnL, lineEnd = readHeader(coop_file)
+      siteS       = set(x.encode('utf-8') for x in tableRowD['gw_coop'])
+      rowL        = [x for siteRowL in tableRowD['gw_coop'].values() for x in siteRowL]
+      for keyColumn, entryS in keyEntryD.items():
+         message, newS = wellConstructionIndex.keyEntries(rowL, columnL.index(keyColumn), columnL.index('site_no'))
+         if len(message) > 0:
+            message = "%s in file %s" % (message, coop_file)
+            return message, reportD
+         entryS = set(x for x in entryS if x[1] not in siteS) | newS
+         wellConstructionIndex.writeKeyIndex(coop_file, keyColumn, os.stat(coop_file), len(header), entryS)
+
+   # Database
+   #
+   message, rowCount = wellConstructionDatabase.updateDatabase(data_dir, tableRowD)
+   if len(message) > 0:
+      return message, reportD
+
+   # Column stores, compiled again when a changed value no longer fits
+   #
+   for table, store in columnStoreD.items():
+      nwis_file = os.path.join(data_dir, "".join([table, "_01.txt"]))
+      store_dir = wellConstructionColumns.storeDirName(data_dir, table)
+      if wellConstructionColumns.updateColumnStore(nwis_file, store_dir, store, tableRowD[table]) is None:
+         message, siteCount = wellConstructionColumns.buildColumnStore(nwis_file, store_dir)
+         if len(message) > 0:
+            return message, reportD
+
+   # Interval and lithology stores
+   #
+   if intervalStore is not None:
+      backend, store = intervalStore
+      changeL = sorted(set(x for table in ['sitefile'] + wellConstructionIntervals.interval_tableL for x in tableRowD.get(table, {})))
+      if len(changeL) > 0:
+         message, count = updateIntervals(data_dir, store, backend, changeL)
+         if len(message) > 0:
+            return message, reportD
+
+   if lithologyStore is not None:
+      backend, store = lithologyStore
+      changeL = sorted(set(x for table in wellConstructionLithology.lith_tableL for x in tableRowD.get(table, {})))
+      if len(changeL) > 0:
+         message, countD = updateLithology(data_dir, store, backend, changeL)
+         if len(message) > 0:
+            return message, reportD
+
+   # Spatial store, built again as it holds only the sitefile
+   #
+   if spatialBackend is not None and 'sitefile' in tableRowD:
+      message, count = wellConstructionSpatial.writeSpatialStore(data_dir, spatialBackend)
+      if len(message) > 0:
+         return message, reportD
+
+   # Changed sites cached under new keys
+   #
+   writeIngestManifest(data_dir, cacheD, siteL)
+   for version in set(cacheD.values()):
+      removeCacheEntries(version, siteL)
+
+   return message, reportD
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   parser = argparse.ArgumentParser(description='Apply a newer NWIS extract or a delta of changed rows to the data directory')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   parser.add_argument('--delta', action='store_true', help='Sources only add and replace rows, rows missing from them are kept')
+   parser.add_argument('sources', nargs='+', help='Table files named <table>_01.txt or directories holding them')
+   args   = parser.parse_args()
+
+   # Published snapshots are never changed in place
+   #
+   if wc.snapshotDir(args.data) != args.data:
+      screen_logger.error("%s serves snapshots, apply the extract with wellConstructionSnapshot.py ingest" % args.data)
+      sys.exit(1)
+
+   message, reportD = ingestData(args.data, args.sources, args.delta)
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   for table in sorted(reportD.keys()):
+      countD = reportD[table]
+      screen_logger.info("Applied %d rows for %d sites to %s, skipped %d rows not newer than the table" % (countD['rows'], countD['sites'], table, countD['skipped']))
+
+   sys.exit(0)
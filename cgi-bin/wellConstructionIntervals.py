@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionIntervals.py
+#
+# Project:  wellConstruction
+# Purpose:  Interval index over the hole, casing and open interval depths of
+#            every site, answering which wells have segments overlapping a
+#            depth range or, through sitefile alt_va, an elevation range.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Each ordering (depth and elevation) is an implicit interval tree: the
+# intervals are sorted by their start and every element also holds the
+# largest end within the subtree it roots, where the subtree of element i at
+# level k (k trailing one bits of i) spans i - 2**k + 1 to i + 2**k - 1. A
+# query walks only the subtrees that can overlap, so its cost grows with the
+# number of matches rather than the number of intervals.
+#
+# Store layout (data/intervals/<version>/, see wellConstructionStore)
+#
+#   meta.json      interval count, tree levels and source file versions
+#   site_no.keys   site numbers, NUL padded to 15 bytes
+#   site.I         uint32 site of each interval, in depth order
+#   table.B        uint8 table of each interval (see interval_tableL)
+#   cons.I seq.I   uint32 cons_seq_nu and table sequence number
+#   dia.d alt.d    float64 diameter and land surface altitude, NaN for blanks
+#   depth_*.d      float64 start (top), end (bottom) and subtree maximum end
+#   elev_*.d       float64 start (bottom elevation), end (top elevation) and
+#                   subtree maximum end of the intervals with an altitude
+#   elev_row.I     uint32 interval of each element of the elevation ordering
+#
+# Usage
+#
+#   python wellConstructionIntervals.py --data data
+#
+###############################################################################
+
+import os, sys
+
+import json, math
+
+from array import array
+
+import wellConstructionDatabase
+from wellConstructionStore import sourceVersion, mapFile, MappedKeys, writeKeys, writeArray, newStore, publishStore, readStoreMeta, openStore
+from wellConstructionRdb import rdbHeader, rdbRows
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+store_version   = 1
+key_width       = 15
+scan_level      = 3
+
+interval_tableL = ['gw_hole', 'gw_csng', 'gw_open']
+intervalColumnD = {
+                   'gw_hole' : ('hole_seq_nu', 'hole_top_va', 'hole_bottom_va', 'hole_dia_va'),
+                   'gw_csng' : ('csng_seq_nu', 'csng_top_va', 'csng_bottom_va', 'csng_dia_va'),
+                   'gw_open' : ('open_seq_nu', 'open_top_va', 'open_bottom_va', 'open_dia_va')
+                  }
+
+# =============================================================================
+
+def storeDirName (data_dir):
+
+   return os.path.join(data_dir, "intervals")
+
+# =============================================================================
+
+def sourceFileList (data_dir, backend='files'):
+
+   if backend == 'sqlite':
+      return [wellConstructionDatabase.databaseFileName(data_dir)]
+
+   return [os.path.join(data_dir, "".join([x, "_01.txt"])) for x in ['sitefile'] + interval_tableL]
+
+# =============================================================================
+
+def readTableRows (table, data_dir, backend='files'):
+
+   # Column names and rows of a whole table
+   #
+   if backend == 'sqlite':
+      return wellConstructionDatabase.readTableRows(data_dir, table)
+
+   nwis_file = os.path.join(data_dir, "".join([table, "_01.txt"]))
+   if not os.path.exists(nwis_file):
+      return "Can not open table %s" % table, [], []
+
+   fh = open(nwis_file, 'r')
+   columnL, formatL = rdbHeader(fh)
+   if columnL is None:
+      fh.close()
+      return "Missing header in table %s" % table, [], []
+
+   rowL      = [x for x in rdbRows(fh) if len(x) == len(columnL)]
+   fh.close()
+
+   return '', columnL, rowL
+
+# =============================================================================
+
+def toFloat (value):
+
+   try:
+      return float(value)
+   except (TypeError, ValueError):
+      return math.nan
+
+# =============================================================================
+
+def treeIndex (startA, endA):
+
+   # Subtree maximum end of each element of a start-sorted implicit tree
+   #
+   count    = len(startA)
+   maxA     = array('d', endA)
+   if count < 1:
+      return maxA, 0
+
+   last_i   = 0
+   last     = maxA[0]
+   for i in range(0, count, 2):
+      last_i = i
+      last   = maxA[i]
+
+   level    = 1
+   while (1 << level) <= count:
+      x    = 1 << (level - 1)
+      step = x << 2
+      for i in range((x << 1) - 1, count, step):
+         left  = maxA[i - x]
+         right = maxA[i + x] if i + x < count else last
+         maxA[i] = max(maxA[i], left, right)
+      if (last_i >> level) & 1:
+         last_i -= x
+      else:
+         last_i += x
+      if last_i < count and maxA[last_i] > last:
+         last = maxA[last_i]
+      level += 1
+
+   return maxA, level - 1
+
+# =============================================================================
+
+def treeOverlap (startA, endA, maxA, levels, top, bottom):
+
+   # Elements whose closed interval overlaps top to bottom
+   #
+   count    = len(startA)
+   matchL   = []
+   if count < 1:
+      return matchL
+
+   stackL   = [(levels, (1 << levels) - 1, False)]
+   while len(stackL) > 0:
+      level, x, leftDone = stackL.pop()
+
+      # Small subtree scanned in order
+      #
+      if level <= scan_level:
+         first = x >> level << level
+         for i in range(first, min(first + (1 << (level + 1)) - 1, count)):
+            if startA[i] > bottom:
+               break
+            if endA[i] >= top:
+               matchL.append(i)
+
+      # Left subtree first, when its ends can reach the range
+      #
+      elif not leftDone:
+         y = x - (1 << (level - 1))
+         stackL.append((level, x, True))
+         if y >= count or maxA[y] >= top:
+            stackL.append((level - 1, y, False))
+
+      # Node itself and right subtree, when its start is within the range
+      #
+      elif x < count and startA[x] <= bottom:
+         if endA[x] >= top:
+            matchL.append(x)
+         stackL.append((level - 1, x + (1 << (level - 1)), False))
+
+   return matchL
+
+# =============================================================================
+
+def siteAltitudes (columnL, rowL):
+
+   # Land surface altitude of each site
+   #
+   siteIndex   = columnL.index('site_no')
+   altIndex    = columnL.index('alt_va')
+
+   return dict((x[siteIndex], toFloat(x[altIndex])) for x in rowL)
+
+# =============================================================================
+
+def tableIntervals (table, columnL, rowL, altD):
+
+   # Intervals with a top and bottom depth
+   #
+   intervalL   = []
+   tableCode   = interval_tableL.index(table)
+
+   positionL   = [columnL.index(x) for x in ('site_no', 'cons_seq_nu') + intervalColumnD[table]]
+   for valuesL in rowL:
+      site_no, cons_seq_nu, seq_nu, top, bottom, dia = [valuesL[x] for x in positionL]
+      top    = toFloat(top)
+      bottom = toFloat(bottom)
+      if top != top or bottom != bottom:
+         continue
+      intervalL.append((min(top, bottom), max(top, bottom), site_no, tableCode, int(cons_seq_nu), int(seq_nu), toFloat(dia), altD.get(site_no, math.nan)))
+
+   return intervalL
+
+# =============================================================================
+
+def readIntervals (data_dir, backend='files'):
+
+   message     = ''
+   intervalL   = []
+
+   message, columnL, rowL = readTableRows('sitefile', data_dir, backend)
+   if len(message) > 0:
+      return message, intervalL
+
+   altD        = siteAltitudes(columnL, rowL)
+
+   for table in interval_tableL:
+      message, columnL, rowL = readTableRows(table, data_dir, backend)
+      if len(message) > 0:
+         return message, intervalL
+
+      intervalL.extend(tableIntervals(table, columnL, rowL, altD))
+
+   intervalL.sort()
+
+   return message, intervalL
+
+# =============================================================================
+
+def storeIntervals (store, siteS):
+
+   # Intervals of a store outside the given sites, in depth order
+   #
+   siteL       = store['sites']
+   intervalL   = []
+   for row in range(len(store['site'])):
+      site_no = siteL[store['site'][row]]
+      if site_no in siteS:
+         continue
+      intervalL.append((store['depth_start'][row], store['depth_end'][row], site_no, store['table'][row], store['cons'][row], store['seq'][row], store['dia'][row], store['alt'][row]))
+
+   return intervalL
+
+# =============================================================================
+
+def buildIntervals (intervalL):
+
+   # Depth ordering with the interval attributes
+   #
+   siteL       = sorted(set(x[2] for x in intervalL))
+   siteD       = dict((site_no, i) for i, site_no in enumerate(siteL))
+
+   store = {
+            'sites'     : siteL,
+            'site'      : array('I', [siteD[x[2]] for x in intervalL]),
+            'table'     : array('B', [x[3] for x in intervalL]),
+            'cons'      : array('I', [x[4] for x in intervalL]),
+            'seq'       : array('I', [x[5] for x in intervalL]),
+            'dia'       : array('d', [x[6] for x in intervalL]),
+            'alt'       : array('d', [x[7] for x in intervalL]),
+            'depth_start' : array('d', [x[0] for x in intervalL]),
+            'depth_end'   : array('d', [x[1] for x in intervalL])
+           }
+   store['depth_max'], store['depth_levels'] = treeIndex(store['depth_start'], store['depth_end'])
+
+   # Elevation ordering of the intervals with a land surface altitude
+   #
+   elevationL  = sorted((x[7] - x[1], x[7] - x[0], row) for row, x in enumerate(intervalL) if x[7] == x[7])
+
+   store['elev_start'] = array('d', [x[0] for x in elevationL])
+   store['elev_end']   = array('d', [x[1] for x in elevationL])
+   store['elev_row']   = array('I', [x[2] for x in elevationL])
+   store['elev_max'], store['elev_levels'] = treeIndex(store['elev_start'], store['elev_end'])
+
+   return store
+
+# =============================================================================
+
+def writeIntervalStore (data_dir, backend='files', intervalL=None):
+
+   message     = ''
+
+   versionD    = sourceVersion(sourceFileList(data_dir, backend))
+
+   if intervalL is None:
+      message, intervalL = readIntervals(data_dir, backend)
+      if len(message) > 0:
+         return message, 0
+
+   store       = buildIntervals(intervalL)
+
+   # Write store into a new version of the store directory
+   #
+   tmp_dir     = newStore(storeDirName(data_dir))
+
+   writeKeys(os.path.join(tmp_dir, "site_no.keys"), store['sites'], key_width)
+
+   for name in ['site', 'table', 'cons', 'seq', 'dia', 'alt', 'depth_start', 'depth_end', 'depth_max', 'elev_start', 'elev_end', 'elev_max', 'elev_row']:
+      writeArray(os.path.join(tmp_dir, "%s.%s" % (name, store[name].typecode)), store[name])
+
+   metaD = {
+            'version'      : store_version,
+            'byteorder'    : sys.byteorder,
+            'backend'      : backend,
+            'sources'      : versionD,
+            'intervals'    : len(store['site']),
+            'sites'        : len(store['sites']),
+            'depth_levels' : store['depth_levels'],
+            'elev_levels'  : store['elev_levels']
+           }
+
+   publishStore(tmp_dir, metaD)
+
+   return message, metaD['intervals']
+
+# =============================================================================
+
+def mapIntervalStore (data_dir, backend='files'):
+
+   # Mapped store files, None without a store current with the sources
+   #
+   version_dir, metaD = readStoreMeta(storeDirName(data_dir), {
+                                                               'version' : store_version,
+                                                               'backend' : backend,
+                                                               'sources' : sourceVersion(sourceFileList(data_dir, backend))
+                                                              })
+   if version_dir is None:
+      return None
+
+   store = {
+            'sites'        : MappedKeys(mapFile(os.path.join(version_dir, "site_no.keys")), key_width),
+            'depth_levels' : metaD['depth_levels'],
+            'elev_levels'  : metaD['elev_levels']
+           }
+   for name, typeCode in [('site', 'I'), ('table', 'B'), ('cons', 'I'), ('seq', 'I'), ('dia', 'd'), ('alt', 'd'),
+                          ('depth_start', 'd'), ('depth_end', 'd'), ('depth_max', 'd'),
+                          ('elev_start', 'd'), ('elev_end', 'd'), ('elev_max', 'd'), ('elev_row', 'I')]:
+      store[name] = mapFile(os.path.join(version_dir, "%s.%s" % (name, typeCode)), typeCode)
+
+   return store
+
+# =============================================================================
+
+def loadIntervalStore (data_dir, backend='files'):
+
+   # Mapped store files, or intervals read from the tables without a current store
+   #
+   store       = mapIntervalStore(data_dir, backend)
+   if store is None:
+      message, intervalL = readIntervals(data_dir, backend)
+      if len(message) > 0:
+         return message, None
+      store = buildIntervals(intervalL)
+
+   return '', store
+
+# =============================================================================
+
+def openIntervalStore (data_dir, backend='files'):
+
+   # Store kept per process for the current version of the sources
+   #
+   versionD    = sourceVersion(sourceFileList(data_dir, backend))
+   storeKey    = (os.path.abspath(data_dir), ('intervals', backend), json.dumps(versionD, sort_keys=True))
+
+   return openStore(storeKey, lambda: loadIntervalStore(data_dir, backend))
+
+# =============================================================================
+
+def queryIntervals (store, top, bottom, mode='depth', tableL=interval_tableL):
+
+   # Segments overlapping the range, grouped by site in site_no order
+   #
+   top, bottom = min(top, bottom), max(top, bottom)
+
+   if mode == 'elevation':
+      matchL = [store['elev_row'][x] for x in treeOverlap(store['elev_start'], store['elev_end'], store['elev_max'], store['elev_levels'], top, bottom)]
+   else:
+      matchL = treeOverlap(store['depth_start'], store['depth_end'], store['depth_max'], store['depth_levels'], top, bottom)
+
+   # Segments of the requested tables only
+   #
+   tableS = set(interval_tableL.index(x) for x in tableL)
+   matchL = [x for x in matchL if store['table'][x] in tableS]
+
+   siteD = {}
+   for row in sorted(matchL, key=lambda x: (store['site'][x], store['table'][x], store['cons'][x], store['seq'][x])):
+      table = interval_tableL[store['table'][row]]
+
+      depth_top    = store['depth_start'][row]
+      depth_bottom = store['depth_end'][row]
+      alt_va       = store['alt'][row]
+
+      segmentD = {
+                  'table'       : table,
+                  'cons_seq_nu' : store['cons'][row],
+                  'seq_nu'      : store['seq'][row],
+                  'top_va'      : depth_top,
+                  'bottom_va'   : depth_bottom,
+                  'dia_va'      : None if store['dia'][row] != store['dia'][row] else store['dia'][row],
+                  'top_elev'    : None,
+                  'bottom_elev' : None
+                 }
+      if alt_va == alt_va:
+         segmentD['top_elev']    = alt_va - depth_top
+         segmentD['bottom_elev'] = alt_va - depth_bottom
+
+      # Part of the segment within the range
+      #
+      if mode == 'elevation':
+         segmentD['overlap_top_elev']    = min(segmentD['top_elev'], bottom)
+         segmentD['overlap_bottom_elev'] = max(segmentD['bottom_elev'], top)
+      else:
+         segmentD['overlap_top_va']      = max(depth_top, top)
+         segmentD['overlap_bottom_va']   = min(depth_bottom, bottom)
+
+      site_no = store['sites'][store['site'][row]]
+      if site_no not in siteD:
+         siteD[site_no] = []
+      siteD[site_no].append(segmentD)
+
+   return siteD
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   screen_logger = logging.getLogger()
+   formatter     = logging.Formatter(fmt='%(message)s')
+   console       = logging.StreamHandler()
+   console.setFormatter(formatter)
+   screen_logger.addHandler(console)
+   screen_logger.setLevel(logging.INFO)
+
+   parser = argparse.ArgumentParser(description='Build the depth and elevation interval index of the hole, casing and open intervals')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   parser.add_argument('--backend', default=os.environ.get('WELL_CONSTRUCTION_BACKEND', 'files'), choices=['files', 'sqlite'], help='Read the tables from the flat files or the SQLite database')
+   args   = parser.parse_args()
+
+   message, intervalCount = writeIntervalStore(args.data, args.backend)
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   screen_logger.info("Indexed %d intervals in %s" % (intervalCount, storeDirName(args.data)))
+
+   sys.exit(0)
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionLithology.py
+#
+# Project:  wellConstruction
+# Purpose:  Inverted index from aquifer (lith_unit_cd) and lithology (lith_cd)
+#            codes to the sites whose open intervals intersect a logged layer
+#            of that code, with the open footage within those layers.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# A layer without a bottom depth extends below the deepest open interval, as
+# it is drawn to the bottom of the graph. Open footage is the length of the
+# union of the open intervals within the layers of a code, so overlapping
+# layers or intervals are not counted twice.
+#
+# Store layout (data/lithology/<version>/, see wellConstructionStore)
+#
+#   meta.json             posting counts and source file versions
+#   site_no.keys          site numbers, NUL padded to 15 bytes
+#   <column>.keys         sorted codes, NUL padded to 15 bytes
+#   <column>.rows         uint32 first posting of each code plus the final count
+#   <column>.site.I       uint32 site of each posting, in site_no order per code
+#   <column>.feet.d       float64 open footage within the code's layers
+#   <column>.top.d        float64 shallowest open depth within the layers
+#   <column>.bottom.d     float64 deepest open depth within the layers
+#
+# Usage
+#
+#   python wellConstructionLithology.py --data data
+#
+###############################################################################
+
+import os, sys
+
+import json, math
+
+from array import array
+
+import wellConstructionDatabase
+from wellConstructionStore import sourceVersion, mapFile, MappedKeys, writeKeys, writeArray, newStore, publishStore, readStoreMeta, openStore
+from wellConstructionIntervals import readTableRows, toFloat
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+store_version   = 1
+key_width       = 15
+
+lith_columnL    = ['lith_unit_cd', 'lith_cd']
+lith_tableL     = ['gw_geoh', 'gw_open']
+
+# =============================================================================
+
+def storeDirName (data_dir):
+
+   return os.path.join(data_dir, "lithology")
+
+# =============================================================================
+
+def sourceFileList (data_dir, backend='files'):
+
+   if backend == 'sqlite':
+      return [wellConstructionDatabase.databaseFileName(data_dir)]
+
+   return [os.path.join(data_dir, "".join([x, "_01.txt"])) for x in lith_tableL]
+
+# =============================================================================
+
+def mergeSegments (segmentL):
+
+   # Union of depth segments, sorted
+   #
+   mergedL = []
+   for top, bottom in sorted(segmentL):
+      if len(mergedL) > 0 and top <= mergedL[-1][1]:
+         mergedL[-1][1] = max(mergedL[-1][1], bottom)
+      else:
+         mergedL.append([top, bottom])
+
+   return mergedL
+
+# =============================================================================
+
+def openSegments (columnL, rowL):
+
+   # Open intervals of each site
+   #
+   positionL   = [columnL.index(x) for x in ('site_no', 'open_top_va', 'open_bottom_va')]
+   openD       = {}
+   for valuesL in rowL:
+      site_no, top, bottom = [valuesL[x] for x in positionL]
+      top    = toFloat(top)
+      bottom = toFloat(bottom)
+      if top != top or bottom != bottom:
+         continue
+      if site_no not in openD:
+         openD[site_no] = []
+      openD[site_no].append((min(top, bottom), max(top, bottom)))
+
+   return openD
+
+# =============================================================================
+
+def layerPostings (columnL, rowL, openD, postingD):
+
+   # Open segments within each logged layer, collected by code and site
+   #
+   message     = ''
+
+   positionL   = [columnL.index(x) for x in ['site_no', 'lith_top_va', 'lith_bottom_va'] + lith_columnL]
+   for valuesL in rowL:
+      site_no, top, bottom = [valuesL[x] for x in positionL[:3]]
+      if site_no not in openD:
+         continue
+      top    = toFloat(top)
+      bottom = toFloat(bottom)
+      if top != top:
+         continue
+      if bottom != bottom:
+         bottom = math.inf
+
+      segmentL = []
+      for open_top, open_bottom in openD[site_no]:
+         if open_top < bottom and open_bottom > top:
+            segmentL.append((max(open_top, top), min(open_bottom, bottom)))
+      if len(segmentL) < 1:
+         continue
+
+      for column, position in zip(lith_columnL, positionL[3:]):
+         code = valuesL[position].strip()
+         if len(code) < 1:
+            continue
+         if len(code.encode('utf-8')) > key_width:
+            message = "Code %s is longer than %d characters in %s" % (code, key_width, column)
+            return message
+         if code not in postingD[column]:
+            postingD[column][code] = {}
+         if site_no not in postingD[column][code]:
+            postingD[column][code][site_no] = []
+         postingD[column][code][site_no].extend(segmentL)
+
+   return message
+
+# =============================================================================
+
+def readPostings (data_dir, backend='files'):
+
+   message     = ''
+   postingD    = dict((x, {}) for x in lith_columnL)
+
+   message, columnL, rowL = readTableRows('gw_open', data_dir, backend)
+   if len(message) > 0:
+      return message, postingD
+
+   openD       = openSegments(columnL, rowL)
+
+   message, columnL, rowL = readTableRows('gw_geoh', data_dir, backend)
+   if len(message) > 0:
+      return message, postingD
+
+   message     = layerPostings(columnL, rowL, openD, postingD)
+
+   return message, postingD
+
+# =============================================================================
+
+def summarizePostings (postingD):
+
+   # Footage of the union of each site's segments with its shallowest and
+   #  deepest open depth
+   #
+   summaryD    = dict((x, {}) for x in lith_columnL)
+   for column in postingD:
+      for code in postingD[column]:
+         summaryD[column][code] = {}
+         for site_no, segmentL in postingD[column][code].items():
+            mergedL = mergeSegments(segmentL)
+            summaryD[column][code][site_no] = (sum(x[1] - x[0] for x in mergedL), mergedL[0][0], mergedL[-1][1])
+
+   return summaryD
+
+# =============================================================================
+
+def storePostings (store, siteS):
+
+   # Posting summaries of a store outside the given sites
+   #
+   summaryD    = dict((x, {}) for x in lith_columnL)
+   for column, indexD in store['columns'].items():
+      for position, code in enumerate(indexD['codes']):
+         for row in range(indexD['rows'][position], indexD['rows'][position + 1]):
+            site_no = store['sites'][indexD['site'][row]]
+            if site_no in siteS:
+               continue
+            if code not in summaryD[column]:
+               summaryD[column][code] = {}
+            summaryD[column][code][site_no] = (indexD['feet'][row], indexD['top'][row], indexD['bottom'][row])
+
+   return summaryD
+
+# =============================================================================
+
+def buildPostings (summaryD):
+
+   # Postings of each code in site_no order
+   #
+   siteL       = sorted(set(site_no for column in summaryD for code in summaryD[column] for site_no in summaryD[column][code]))
+   siteD       = dict((site_no, i) for i, site_no in enumerate(siteL))
+
+   store       = {'sites': siteL, 'columns': {}}
+   for column in lith_columnL:
+      codeL    = sorted([x for x in summaryD[column] if len(summaryD[column][x]) > 0])
+      indexD   = {
+                  'codes'  : codeL,
+                  'rows'   : array('I'),
+                  'site'   : array('I'),
+                  'feet'   : array('d'),
+                  'top'    : array('d'),
+                  'bottom' : array('d')
+                 }
+      for code in codeL:
+         indexD['rows'].append(len(indexD['site']))
+         for site_no in sorted(summaryD[column][code].keys()):
+            feet, top, bottom = summaryD[column][code][site_no]
+            indexD['site'].append(siteD[site_no])
+            indexD['feet'].append(feet)
+            indexD['top'].append(top)
+            indexD['bottom'].append(bottom)
+      indexD['rows'].append(len(indexD['site']))
+      store['columns'][column] = indexD
+
+   return store
+
+# =============================================================================
+
+def writeLithologyStore (data_dir, backend='files', summaryD=None):
+
+   message     = ''
+
+   versionD    = sourceVersion(sourceFileList(data_dir, backend))
+
+   if summaryD is None:
+      message, postingD = readPostings(data_dir, backend)
+      if len(message) > 0:
+         return message, 0
+      summaryD = summarizePostings(postingD)
+
+   store       = buildPostings(summaryD)
+
+   # Write store into a new version of the store directory
+   #
+   tmp_dir     = newStore(storeDirName(data_dir))
+
+   writeKeys(os.path.join(tmp_dir, "site_no.keys"), store['sites'], key_width)
+
+   countD      = {}
+   for column, indexD in store['columns'].items():
+      writeKeys(os.path.join(tmp_dir, column + ".keys"), indexD['codes'], key_width)
+      writeArray(os.path.join(tmp_dir, column + ".rows"), indexD['rows'])
+
+      for name in ['site', 'feet', 'top', 'bottom']:
+         writeArray(os.path.join(tmp_dir, "%s.%s.%s" % (column, name, indexD[name].typecode)), indexD[name])
+
+      countD[column] = {'codes': len(indexD['codes']), 'postings': len(indexD['site'])}
+
+   metaD = {
+            'version'   : store_version,
+            'byteorder' : sys.byteorder,
+            'backend'   : backend,
+            'sources'   : versionD,
+            'sites'     : len(store['sites']),
+            'columns'   : countD
+           }
+
+   publishStore(tmp_dir, metaD)
+
+   return message, countD
+
+# =============================================================================
+
+def mapLithologyStore (data_dir, backend='files'):
+
+   # Mapped store files, None without a store current with the sources
+   #
+   version_dir, metaD = readStoreMeta(storeDirName(data_dir), {
+                                                               'version' : store_version,
+                                                               'backend' : backend,
+                                                               'sources' : sourceVersion(sourceFileList(data_dir, backend))
+                                                              })
+   if version_dir is None:
+      return None
+
+   store = {
+            'sites'   : MappedKeys(mapFile(os.path.join(version_dir, "site_no.keys")), key_width),
+            'columns' : {}
+           }
+   for column in lith_columnL:
+      indexD = {
+                'codes' : list(MappedKeys(mapFile(os.path.join(version_dir, column + ".keys")), key_width)),
+                'rows'  : mapFile(os.path.join(version_dir, column + ".rows"), 'I')
+               }
+      for name, typeCode in [('site', 'I'), ('feet', 'd'), ('top', 'd'), ('bottom', 'd')]:
+         indexD[name] = mapFile(os.path.join(version_dir, "%s.%s.%s" % (column, name, typeCode)), typeCode)
+      store['columns'][column] = indexD
+
+   return store
+
+# =============================================================================
+
+def loadLithologyStore (data_dir, backend='files'):
+
+   # Mapped store files, or postings read from the tables without a current store
+   #
+   store       = mapLithologyStore(data_dir, backend)
+   if store is None:
+      message, postingD = readPostings(data_dir, backend)
+      if len(message) > 0:
+         return message, None
+      store = buildPostings(summarizePostings(postingD))
+
+   # Code positions for lookups
+   #
+   for indexD in store['columns'].values():
+      indexD['position'] = dict((code, i) for i, code in enumerate(indexD['codes']))
+
+   return '', store
+
+# =============================================================================
+
+def openLithologyStore (data_dir, backend='files'):
+
+   # Store kept per process for the current version of the sources
+   #
+   versionD    = sourceVersion(sourceFileList(data_dir, backend))
+   storeKey    = (os.path.abspath(data_dir), ('lithology', backend), json.dumps(versionD, sort_keys=True))
+
+   return openStore(storeKey, lambda: loadLithologyStore(data_dir, backend))
+
+# =============================================================================
+
+def querySites (store, column, code):
+
+   # Sites open to the code with the footage and depths within its layers
+   #
+   indexD   = store['columns'][column]
+   siteL    = []
+   if code not in indexD['position']:
+      return siteL
+
+   position = indexD['position'][code]
+   for row in range(indexD['rows'][position], indexD['rows'][position + 1]):
+      siteL.append({
+                    'site_no'   : store['sites'][indexD['site'][row]],
+                    'open_ft'   : indexD['feet'][row],
+                    'top_va'    : indexD['top'][row],
+                    'bottom_va' : indexD['bottom'][row]
+                   })
+
+   return siteL
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   screen_logger = logging.getLogger()
+   formatter     = logging.Formatter(fmt='%(message)s')
+   console       = logging.StreamHandler()
+   console.setFormatter(formatter)
+   screen_logger.addHandler(console)
+   screen_logger.setLevel(logging.INFO)
+
+   parser = argparse.ArgumentParser(description='Build the inverted index from aquifer and lithology codes to the sites open to them')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   parser.add_argument('--backend', default=os.environ.get('WELL_CONSTRUCTION_BACKEND', 'files'), choices=['files', 'sqlite'], help='Read the tables from the flat files or the SQLite database')
+   args   = parser.parse_args()
+
+   message, countD = writeLithologyStore(args.data, args.backend)
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   for column in lith_columnL:
+      screen_logger.info("Indexed %d sites under %d %s codes in %s" % (countD[column]['postings'], countD[column]['codes'], column, storeDirName(args.data)))
+
+   sys.exit(0)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionProfile.py
+#
+# Project:  wellConstruction
+# Purpose:  Per-request timing and I/O counters for each phase of building
+#            the well construction JSON, reported as a Server-Timing header,
+#            an optional profile block in the response and a periodic log of
+#            the totals across requests.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Phases are recorded against the profile started for the request in the
+# current thread, so the reading and assembly functions need no extra
+# arguments. Each phase keeps its wall time, number of calls, lines scanned,
+# bytes read and records matched.
+#
+###############################################################################
+
+import os
+
+import time, threading
+
+from collections import OrderedDict
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+profile_log_interval = float(os.environ.get('WELL_CONSTRUCTION_PROFILE_LOG', '300'))
+
+counterL        = ['lines', 'bytes', 'records']
+
+currentProfile  = threading.local()
+
+aggregateD      = OrderedDict()
+aggregateState  = {'requests': 0, 'ms': 0.0, 'start': time.monotonic()}
+aggregateLock   = threading.Lock()
+
+totalsD         = OrderedDict()
+
+# =============================================================================
+
+def startProfile ():
+
+   profile = {
+              'start'  : time.perf_counter(),
+              'phases' : OrderedDict()
+             }
+
+   currentProfile.profile = profile
+
+   return profile
+
+# =============================================================================
+
+def phaseStart (name):
+
+   return (name, time.perf_counter())
+
+# =============================================================================
+
+def phaseEnd (timer, lines=0, bytes=0, records=0, profile=None):
+
+   name, startTime = timer
+
+   phaseAdd(name, (time.perf_counter() - startTime) * 1000.0, lines, bytes, records, profile)
+
+# =============================================================================
+
+def phaseAdd (name, ms, lines=0, bytes=0, records=0, profile=None):
+
+   if profile is None:
+      profile = getattr(currentProfile, 'profile', None)
+      if profile is None:
+         return
+
+   if name not in profile['phases']:
+      profile['phases'][name] = {'ms': 0.0, 'count': 0, 'lines': 0, 'bytes': 0, 'records': 0}
+
+   phaseD = profile['phases'][name]
+   phaseD['ms']      += ms
+   phaseD['count']   += 1
+   phaseD['lines']   += lines
+   phaseD['bytes']   += bytes
+   phaseD['records'] += records
+
+# =============================================================================
+
+def profileChunks (profile, chunkIter, name='serialize'):
+
+   # Time spent producing the chunks, the caller's time sending them excluded
+   #
+   elapsed   = 0.0
+   byteCount = 0
+
+   chunkIter = iter(chunkIter)
+   while True:
+      startTime = time.perf_counter()
+      try:
+         chunk = next(chunkIter)
+      except StopIteration:
+         break
+      elapsed   += time.perf_counter() - startTime
+      byteCount += len(chunk)
+      yield chunk
+
+   phaseAdd(name, elapsed * 1000.0, bytes=byteCount, profile=profile)
+
+# =============================================================================
+
+def serverTiming (profile):
+
+   # Server-Timing header value for the phases finished so far
+   #
+   timingL = []
+   for name, phaseD in profile['phases'].items():
+      timingL.append('%s;dur=%.3f' % (name, phaseD['ms']))
+   timingL.append('total;dur=%.3f' % ((time.perf_counter() - profile['start']) * 1000.0))
+
+   return ', '.join(timingL)
+
+# =============================================================================
+
+def profileReport (profile):
+
+   phaseD = OrderedDict()
+   for name, countD in profile['phases'].items():
+      phaseD[name] = dict(countD)
+      phaseD[name]['ms'] = round(countD['ms'], 3)
+
+   return {
+           'total_ms' : round((time.perf_counter() - profile['start']) * 1000.0, 3),
+           'phases'   : phaseD
+          }
+
+# =============================================================================
+
+def totalsSource (name, function):
+
+   # Counters of another module logged with the totals, function returning
+   #  a dictionary of counts
+   #
+   totalsD[name] = function
+
+# =============================================================================
+
+def finishProfile (profile, debug=False, label=''):
+
+   if getattr(currentProfile, 'profile', None) is profile:
+      currentProfile.profile = None
+
+   totalMs = (time.perf_counter() - profile['start']) * 1000.0
+
+   if debug:
+      screen_logger.info("Profile %s %.3f ms %s" % (label, totalMs, formatPhases(profile['phases'])))
+
+   # Totals across requests, logged and reset after each interval
+   #
+   with aggregateLock:
+      aggregateState['requests'] += 1
+      aggregateState['ms']       += totalMs
+      for name, countD in profile['phases'].items():
+         if name not in aggregateD:
+            aggregateD[name] = {'ms': 0.0, 'count': 0, 'lines': 0, 'bytes': 0, 'records': 0}
+         for counter in countD:
+            aggregateD[name][counter] += countD[counter]
+
+      if time.monotonic() - aggregateState['start'] < profile_log_interval:
+         return
+
+      screen_logger.info("Profile totals %d requests %.3f ms %s" % (aggregateState['requests'], aggregateState['ms'], formatPhases(aggregateD)))
+      for name, function in totalsD.items():
+         screen_logger.info("Profile totals %s %s" % (name, " ".join(["%s=%d" % x for x in function().items()])))
+
+      aggregateD.clear()
+      aggregateState['requests'] = 0
+      aggregateState['ms']       = 0.0
+      aggregateState['start']    = time.monotonic()
+
+# =============================================================================
+
+def formatPhases (phaseD):
+
+   phaseL = []
+   for name, countD in phaseD.items():
+      counters = " ".join(["%s=%d" % (x, countD[x]) for x in counterL if countD[x] > 0])
+      phaseL.append(("%s %.3f ms x%d %s" % (name, countD['ms'], countD['count'], counters)).strip())
+
+   return "; ".join(phaseL)
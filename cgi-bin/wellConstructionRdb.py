@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionRdb.py
+#
+# Project:  wellConstruction
+# Purpose:  Streaming reader for the NWIS RDB tables. Rows are split lazily
+#            from a file handle or list of lines, so a scan holds one line at
+#            a time and ends as soon as the rows it needs have been read.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# An RDB file is a block of # comment lines, a tab separated line of column
+# names, a line of column formats (5s, 15s, 9n, ...) and the data lines. The
+# reader takes any iterator of text lines: rdbHeader consumes the head lines
+# and the row generators continue from where it stopped.
+#
+###############################################################################
+
+# =============================================================================
+
+def rdbHeader (lineIter):
+
+   # Column names and formats, None without a column line
+   #
+   for Line in lineIter:
+      Line = Line.strip("\n|\r")
+
+      # Grab column names in header
+      #
+      if Line[:1] != '#':
+         columnL = Line.split('\t')
+         formatL = next(lineIter, '').strip("\n|\r").split('\t')
+         return columnL, formatL
+
+   return None, None
+
+# =============================================================================
+
+def rdbRows (lineIter):
+
+   # Split values of each data line
+   #
+   for Line in lineIter:
+      yield Line.strip("\n|\r").split('\t')
+
+# =============================================================================
+
+def rdbSiteRows (lineIter, keyIndex, site_no):
+
+   # Rows of one site from a table sorted by the key, ending at the first
+   #  row past the site
+   #
+   for valuesL in rdbRows(lineIter):
+      indexSite = valuesL[keyIndex]
+      if indexSite == site_no:
+         yield valuesL
+      elif indexSite > site_no:
+         break
+
+# =============================================================================
+
+def rdbLines (lineIter, countD):
+
+   # Lines passed through with a count of the lines and characters read
+   #
+   for Line in lineIter:
+      countD['lines'] += 1
+      countD['bytes'] += len(Line)
+      yield Line
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionRecords.py
+#
+# Project:  wellConstruction
+# Purpose:  Compact record types for rows of the NWIS RDB tables. A record
+#            keeps the row's split values and reads them by column name
+#            through positions resolved once for each table layout.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Records read like the per-row dictionaries they replace (record['site_no'],
+# keys(), items(), dict(record)), so the assembly code is unchanged, but hold
+# only a reference to the list produced by splitting the line.
+#
+###############################################################################
+
+import threading
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+recordClassD    = {}
+recordLock      = threading.Lock()
+
+# =============================================================================
+
+class Record:
+
+   __slots__ = ('valuesL',)
+
+   columnL   = ()
+   positionD = {}
+
+   def __init__ (self, valuesL):
+
+      self.valuesL = valuesL
+
+   def __getitem__ (self, column):
+
+      return self.valuesL[self.positionD[column]]
+
+   def __contains__ (self, column):
+
+      return column in self.positionD
+
+   def __iter__ (self):
+
+      return iter(self.columnL)
+
+   def __len__ (self):
+
+      return len(self.columnL)
+
+   def get (self, column, default=None):
+
+      if column in self.positionD:
+         return self.valuesL[self.positionD[column]]
+
+      return default
+
+   def keys (self):
+
+      return self.columnL
+
+   def values (self):
+
+      return self.valuesL
+
+   def items (self):
+
+      return zip(self.columnL, self.valuesL)
+
+   def __repr__ (self):
+
+      return "%s(%r)" % (self.__class__.__name__, dict(self.items()))
+
+# =============================================================================
+
+def recordClass (columnL, table='nwis'):
+
+   # One record type per table layout, shared by every file with that header
+   #
+   key = tuple(columnL)
+
+   with recordLock:
+      if key not in recordClassD:
+         recordClassD[key] = type("%sRecord" % table.title().replace('_', ''),
+                                  (Record,),
+                                  {
+                                   '__slots__' : (),
+                                   'columnL'   : tuple(columnL),
+                                   'positionD' : dict((column, position) for position, column in enumerate(columnL))
+                                  })
+
+   return recordClassD[key]
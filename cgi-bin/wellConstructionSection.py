@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionSection.py
+#
+# Project:  wellConstruction
+# Purpose:  Cross section of an ordered list of wells. The lithology, casing
+#            and open intervals of every well are converted to elevations
+#            from the sitefile alt_va and share one set of axis extents.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The section datum is the alt_datum_cd shared by most of the wells. No datum
+# shift is applied, so a well whose land surface is referenced to another
+# datum, or has no finite alt_va, is listed with a message instead of a profile.
+#
+# The rows of each table are gathered for all wells in section order and
+# converted as whole columns, elevation = alt_va - depth. The y axis comes
+# from get_max_min over the highest land surface and the lowest bottom of the
+# set, so every profile is drawn against the same scale. Distances are
+# great circle distances in feet from the first well along the section.
+#
+###############################################################################
+
+import math
+
+from collections import Counter
+
+from wellConstructionExtents import tableColumns, extentColumnD, toFloat, nanMax, extentValue, get_max_min
+from wellConstructionSpatial import siteDistance
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+section_tableL  = ['gw_geoh', 'gw_csng', 'gw_open']
+sectionColumnD  = {
+                   'gw_geoh' : ('lith_top_va', 'lith_bottom_va'),
+                   'gw_csng' : ('csng_top_va', 'csng_bottom_va'),
+                   'gw_open' : ('open_top_va', 'open_bottom_va')
+                  }
+
+# =============================================================================
+
+def nanMin (valueL):
+
+   return min([x for x in valueL if x == x], default=float('nan'))
+
+# =============================================================================
+
+def codeText (DefinitionsD, column, code):
+
+   if len(code) < 1:
+      return ''
+
+   return DefinitionsD.get(column, {}).get('Codes', {}).get(code, '')
+
+# =============================================================================
+
+def codeImage (ImageInfoD, column, code):
+
+   if len(code) < 1:
+      return ''
+
+   return ImageInfoD.get(column, {}).get(code, '')
+
+# =============================================================================
+
+def sectionRecord (table, record, DefinitionsD, ImageInfoD, aqfrInfoD):
+
+   # Descriptive columns of one row as in the single well response
+   #
+   if table == 'gw_geoh':
+      lith_cd      = record['lith_cd']
+      lith_unit_cd = record['lith_unit_cd']
+      recordD      = {
+                      'geoh_seq_nu'  : int(record['geoh_seq_nu']),
+                      'lith_cd'      : lith_cd,
+                      'lith_ds'      : codeText(DefinitionsD, 'lith_cd', lith_cd),
+                      'lith_unit_cd' : lith_unit_cd,
+                      'lith_unit_ds' : aqfrInfoD.get(lith_unit_cd, '') if len(lith_unit_cd) > 0 else '',
+                      'image'        : codeImage(ImageInfoD, 'lith_cd', lith_cd)
+                     }
+      if len(lith_unit_cd) > 0 and len(recordD['image']) < 1:
+         recordD['image'] = '000.svg'
+
+   elif table == 'gw_csng':
+      csng_material_cd = record['csng_material_cd']
+      recordD      = {
+                      'cons_seq_nu'      : int(record['cons_seq_nu']),
+                      'csng_seq_nu'      : int(record['csng_seq_nu']),
+                      'csng_dia_va'      : toFloat(record['csng_dia_va']),
+                      'csng_material_cd' : csng_material_cd,
+                      'csng_material_ds' : codeText(DefinitionsD, 'csng_material_cd', csng_material_cd),
+                      'csng_material_cl' : codeImage(ImageInfoD, 'csng_material_cd', csng_material_cd)
+                     }
+
+   else:
+      open_cd      = record['open_cd']
+      recordD      = {
+                      'cons_seq_nu'      : int(record['cons_seq_nu']),
+                      'open_seq_nu'      : int(record['open_seq_nu']),
+                      'open_dia_va'      : toFloat(record['open_dia_va']),
+                      'open_material_cd' : record['open_material_cd'],
+                      'open_cd'          : open_cd,
+                      'open_ds'          : codeText(DefinitionsD, 'open_cd', open_cd),
+                      'image'            : codeImage(ImageInfoD, 'open_cd', open_cd)
+                     }
+
+   return recordD
+
+# =============================================================================
+
+def sectionDatum (siteL, sitesInfoD):
+
+   # Land surface and datum of each site, and the datum shared by most sites
+   #
+   altD     = {}
+   datumD   = {}
+   for site_no in siteL:
+      record = sitesInfoD[site_no]['sitefile'][-1]
+      alt_va = toFloat(record['alt_va'])
+      if math.isfinite(alt_va):
+         altD[site_no]   = alt_va
+         datumD[site_no] = record['alt_datum_cd']
+
+   datumL   = Counter(datumD.values()).most_common(1)
+   if len(datumL) < 1:
+      return altD, datumD, None
+
+   return altD, datumD, datumL[0][0]
+
+# =============================================================================
+
+def sectionProfiles (siteL, sitesInfoD, siteMessageD, DefinitionsD, ImageInfoD, aqfrInfoD):
+
+   # Sites that can be placed on the section datum
+   #
+   messageD = dict(siteMessageD)
+   readL    = [x for x in siteL if x not in messageD]
+
+   altD, datumD, alt_datum_cd = sectionDatum(readL, sitesInfoD)
+
+   placeL   = []
+   for site_no in readL:
+      if site_no not in altD:
+         messageD[site_no] = "Site %s has no land surface altitude" % site_no
+      elif datumD[site_no] != alt_datum_cd:
+         messageD[site_no] = "Site %s land surface altitude is referenced to %s, not %s" % (site_no, datumD[site_no], alt_datum_cd)
+      else:
+         placeL.append(site_no)
+
+   # Well headers and distance along the section
+   #
+   profileD = {}
+   lastL    = None
+   distance = 0.0
+   for site_no in placeL:
+      record   = sitesInfoD[site_no]['sitefile'][-1]
+      latlonL  = [toFloat(record['dec_lat_va']), toFloat(record['dec_long_va'])]
+      if all(math.isfinite(x) for x in latlonL):
+         if lastL is not None:
+            distance += siteDistance(lastL, latlonL)
+         lastL = latlonL
+         site_distance = distance
+      else:
+         site_distance = None
+
+      profileD[site_no] = {
+                           'site_no'      : site_no,
+                           'station_nm'   : record['station_nm'],
+                           'dec_lat_va'   : extentValue(latlonL[0]),
+                           'dec_long_va'  : extentValue(latlonL[1]),
+                           'land_surface' : altD[site_no],
+                           'distance'     : site_distance
+                          }
+      for table in section_tableL:
+         profileD[site_no][table] = []
+
+   # Elevations of every table's rows for all sites at once
+   #
+   bottomL  = []
+   diaL     = []
+   for table in ['sitefile'] + section_tableL:
+      ownerL  = []
+      recordL = []
+      for site_no in placeL:
+         siteRecordL = sitesInfoD[site_no].get(table, [])
+         ownerL.extend([site_no] * len(siteRecordL))
+         recordL.extend(siteRecordL)
+
+      floatD  = tableColumns(table, recordL)
+      altL    = [altD[x] for x in ownerL]
+
+      if table == 'sitefile':
+         for column in extentColumnD[table]['depth']:
+            bottomL.append(nanMin([x - y for x, y in zip(altL, floatD[column])]))
+         continue
+
+      diaL.extend([nanMax(floatD[x]) for x in extentColumnD[table]['dia']])
+
+      top_column, bottom_column = sectionColumnD[table]
+      topL    = floatD[top_column]
+      depthL  = floatD[bottom_column]
+
+      top_elevationL    = [x - y for x, y in zip(altL, topL)]
+      bottom_elevationL = [x - y for x, y in zip(altL, depthL)]
+      bottomL.append(nanMin(bottom_elevationL))
+
+      for site_no, record, top_va, bottom_va, top_elevation, bottom_elevation in zip(ownerL, recordL, topL, depthL, top_elevationL, bottom_elevationL):
+
+         # Rows the single well graph would not draw
+         #
+         if table != 'gw_geoh' and bottom_va != bottom_va:
+            continue
+
+         recordD = sectionRecord(table, record, DefinitionsD, ImageInfoD, aqfrInfoD)
+         recordD[top_column]         = extentValue(top_va)
+         recordD[bottom_column]      = extentValue(bottom_va)
+         recordD['top_elevation']    = extentValue(top_elevation)
+         recordD['bottom_elevation'] = extentValue(bottom_elevation)
+         profileD[site_no][table].append(recordD)
+
+   # Shared axis extents
+   #
+   sectionD = {
+               'alt_datum_cd' : alt_datum_cd,
+               'sites'        : [],
+               'y_max'        : None,
+               'y_min'        : None,
+               'y_interval'   : None,
+               'dia_max'      : extentValue(nanMax(diaL))
+              }
+
+   elevation_max = nanMax([altD[x] for x in placeL])
+   elevation_min = nanMin(bottomL + [elevation_max])
+   if elevation_max == elevation_max:
+      sectionD['y_min'], sectionD['y_max'], sectionD['y_interval'] = get_max_min(elevation_min, elevation_max)
+
+   for site_no in siteL:
+      if site_no in profileD:
+         sectionD['sites'].append(profileD[site_no])
+      else:
+         sectionD['sites'].append({'site_no': site_no, 'message': messageD[site_no]})
+
+   return sectionD
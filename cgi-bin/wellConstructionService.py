@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionService.py
+#
+# Project:  wellConstruction
+# Purpose:  WSGI application that serves the well construction JSON from a
+#            long-running process. The lookup tables are loaded once per data
+#            snapshot and kept in memory across requests instead of on every
+#            CGI invocation.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Usage
+#
+#   Development server
+#      python wellConstructionService.py --port 8080
+#
+#   Production (any WSGI server)
+#      gunicorn --chdir cgi-bin wellConstructionService:application
+#
+###############################################################################
+
+import os, sys
+
+import threading
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+import requestWellConstruction as wc
+import wellConstructionProfile
+import wellConstructionCache
+import wellConstructionStore
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+data_dir        = os.environ.get('WELL_CONSTRUCTION_DATA',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+lookupsD        = {}
+lookupLock      = threading.Lock()
+
+# Concurrent requests for a site share one build in the service, the CGI
+#  script streams its single response instead
+#
+wellConstructionCache.coalesce = True
+
+# =============================================================================
+
+def getLookups (snapshot_dir=None):
+
+   if snapshot_dir is None:
+      snapshot_dir = wc.snapshotDir(data_dir)
+
+   # Load lookup tables once per process and data snapshot
+   #
+   with lookupLock:
+      if snapshot_dir not in lookupsD:
+         message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(snapshot_dir)
+         if len(message) > 0:
+            return message, None
+
+         releaseSnapshots(snapshot_dir)
+
+         lookupsD[snapshot_dir] = {
+                                   'DefinitionsD' : DefinitionsD,
+                                   'ImageInfoD'   : ImageInfoD,
+                                   'aqfrInfoD'    : aqfrInfoD
+                                  }
+
+      lookupD = lookupsD[snapshot_dir]
+
+   return '', lookupD
+
+# =============================================================================
+
+def releaseSnapshots (snapshot_dir):
+
+   # Lookups and mapped stores of earlier snapshots dropped once a newer
+   #  snapshot is in use, requests still on them keep their own references
+   #
+   root_dir = os.path.abspath(os.path.join(data_dir, wc.snapshot_root))
+   keep_dir = os.path.abspath(snapshot_dir)
+
+   def released (path):
+      path = os.path.abspath(path)
+      return path.startswith(root_dir + os.sep) and path != keep_dir and not path.startswith(keep_dir + os.sep)
+
+   for old_dir in [x for x in lookupsD if released(x)]:
+      del lookupsD[old_dir]
+
+   wellConstructionStore.releaseStores(released)
+
+   for oldKey in [x for x in list(wc.manifestD) if released(x[0])]:
+      wc.manifestD.pop(oldKey, None)
+
+# =============================================================================
+
+def jsonResponse (start_response, content, headerL=[], contentType='application/json'):
+
+   # Not modified since the client's copy
+   #
+   if content is None:
+      start_response('304 Not Modified', list(headerL))
+      return []
+
+   # Whole response, including one already held in the cache
+   #
+   if isinstance(content, list):
+      content = "".join(content)
+
+   if isinstance(content, str):
+      body = content.encode('utf-8')
+
+      start_response('200 OK', [
+                                ('Content-Type', contentType),
+                                ('Content-Length', str(len(body)))
+                               ] + list(headerL))
+
+      return [body]
+
+   # Streamed response, chunks are encoded as the server sends them
+   #
+   start_response('200 OK', [
+                             ('Content-Type', contentType)
+                            ] + list(headerL))
+
+   return (chunk.encode('utf-8') for chunk in content)
+
+# =============================================================================
+
+def application (environ, start_response):
+
+   # Parse the Query String
+   #
+   params = wc.parseQueryString(environ.get('QUERY_STRING', ''))
+
+   profile = wellConstructionProfile.startProfile()
+
+   # Data snapshot current when the request started, a newer one is
+   #  picked up by the next request
+   #
+   snapshot_dir = wc.snapshotDir(data_dir)
+
+   message, site_no = wc.requestSiteNumbers(params, snapshot_dir)
+   if len(message) > 0:
+      wellConstructionProfile.finishProfile(profile, wc.debug, 'sites')
+      return jsonResponse(start_response, wc.jsonMessage(message))
+
+   # Wells with segments overlapping a depth or elevation range
+   #
+   if len(site_no) < 1 and (len(params.get('depth', '')) > 0 or len(params.get('elevation', '')) > 0):
+      message, jsonText = wc.requestIntervals(params, snapshot_dir)
+      if len(message) > 0:
+         jsonText = wc.jsonMessage(message)
+      headerL = [('Server-Timing', wellConstructionProfile.serverTiming(profile))]
+      wellConstructionProfile.finishProfile(profile, wc.debug, 'intervals')
+      return jsonResponse(start_response, jsonText, headerL)
+
+   # Wells open to aquifer or lithology codes
+   #
+   if len(site_no) < 1 and (len(params.get('lith_unit_cd', '')) > 0 or len(params.get('lith_cd', '')) > 0):
+      message, lookupD = getLookups(snapshot_dir)
+      if len(message) < 1:
+         message, jsonText = wc.requestLithology(params, lookupD['DefinitionsD'], lookupD['aqfrInfoD'], snapshot_dir)
+      if len(message) > 0:
+         jsonText = wc.jsonMessage(message)
+      headerL = [('Server-Timing', wellConstructionProfile.serverTiming(profile))]
+      wellConstructionProfile.finishProfile(profile, wc.debug, 'lithology')
+      return jsonResponse(start_response, jsonText, headerL)
+
+   # Wells within a map box or nearest to a point
+   #
+   if len(site_no) < 1 and (len(params.get('bbox', '')) > 0 or len(params.get('near', '')) > 0):
+      message, jsonText = wc.requestSpatial(params, snapshot_dir)
+      if len(message) > 0:
+         jsonText = wc.jsonMessage(message)
+      headerL = [('Server-Timing', wellConstructionProfile.serverTiming(profile))]
+      wellConstructionProfile.finishProfile(profile, wc.debug, 'spatial')
+      return jsonResponse(start_response, jsonText, headerL)
+
+   if len(site_no) < 1:
+      message = "Requires a NWIS site number"
+      wellConstructionProfile.finishProfile(profile, wc.debug, 'sites')
+      return jsonResponse(start_response, wc.jsonMessage(message))
+
+   # Lookup tables
+   #
+   message, lookupD = getLookups(snapshot_dir)
+   if len(message) > 0:
+      wellConstructionProfile.finishProfile(profile, wc.debug, site_no)
+      return jsonResponse(start_response, wc.jsonMessage(message))
+
+   # Cross section of the wells in the order requested
+   #
+   if params.get('format', '') == 'section':
+      message, jsonText = wc.requestCrossSection(site_no.split(','),
+                                                 lookupD['DefinitionsD'],
+                                                 lookupD['ImageInfoD'],
+                                                 lookupD['aqfrInfoD'],
+                                                 snapshot_dir)
+      if len(message) > 0:
+         jsonText = wc.jsonMessage(message)
+      headerL = [('Server-Timing', wellConstructionProfile.serverTiming(profile))]
+      wellConstructionProfile.finishProfile(profile, wc.debug, 'section')
+      return jsonResponse(start_response, jsonText, headerL)
+
+   # Diagram rendered on the server
+   #
+   if params.get('format', '') == 'svg':
+      if ',' in site_no:
+         message = "SVG diagram requires a single NWIS site number"
+         wellConstructionProfile.finishProfile(profile, wc.debug, site_no)
+         return jsonResponse(start_response, wc.jsonMessage(message))
+
+      conditionD = {
+                    'If-None-Match'     : environ.get('HTTP_IF_NONE_MATCH', ''),
+                    'If-Modified-Since' : environ.get('HTTP_IF_MODIFIED_SINCE', '')
+                   }
+      message, content, headerL = wc.requestWellConstructionSvg(site_no,
+                                                               lookupD['DefinitionsD'],
+                                                               lookupD['ImageInfoD'],
+                                                               lookupD['aqfrInfoD'],
+                                                               snapshot_dir,
+                                                               conditionD)
+      headerL = headerL + [('Server-Timing', wellConstructionProfile.serverTiming(profile))]
+      wellConstructionProfile.finishProfile(profile, wc.debug, site_no)
+      if len(message) > 0:
+         return jsonResponse(start_response, wc.jsonMessage(message))
+
+      return jsonResponse(start_response, content, headerL, 'image/svg+xml')
+
+   # Build well construction for site
+   #
+   if ',' in site_no:
+      message, chunkIter = wc.requestWellConstructionSites(site_no.split(','),
+                                                          lookupD['DefinitionsD'],
+                                                          lookupD['ImageInfoD'],
+                                                          lookupD['aqfrInfoD'],
+                                                          snapshot_dir)
+      headerL = []
+   else:
+      conditionD = {
+                    'If-None-Match'     : environ.get('HTTP_IF_NONE_MATCH', ''),
+                    'If-Modified-Since' : environ.get('HTTP_IF_MODIFIED_SINCE', '')
+                   }
+      message, chunkIter, headerL = wc.requestWellConstruction(site_no,
+                                                              lookupD['DefinitionsD'],
+                                                              lookupD['ImageInfoD'],
+                                                              lookupD['aqfrInfoD'],
+                                                              snapshot_dir,
+                                                              conditionD)
+   if len(message) > 0:
+      wellConstructionProfile.finishProfile(profile, wc.debug, site_no)
+      return jsonResponse(start_response, wc.jsonMessage(message))
+
+   headerL = headerL + [('Server-Timing', wellConstructionProfile.serverTiming(profile))]
+
+   # Cached or not modified responses are complete already
+   #
+   profileBlock = params.get('profile', '') == '1'
+   if chunkIter is None or (isinstance(chunkIter, list) and not profileBlock):
+      wellConstructionProfile.finishProfile(profile, wc.debug, site_no)
+      return jsonResponse(start_response, chunkIter, headerL)
+
+   return jsonResponse(start_response, wc.profiledResponse(profile, chunkIter, profileBlock, site_no), headerL)
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   from socketserver import ThreadingMixIn
+   from wsgiref.simple_server import make_server, WSGIServer
+
+   class ThreadingWSGIServer (ThreadingMixIn, WSGIServer):
+      daemon_threads = True
+
+   parser = argparse.ArgumentParser(description='Serve well construction information over HTTP')
+   parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+   parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+   parser.add_argument('--data', default=data_dir, help='Directory holding the NWIS data files')
+   parser.add_argument('--backend', default=wc.backend, choices=['files', 'sqlite'], help='Read site records from the flat files or the SQLite database')
+   args   = parser.parse_args()
+
+   data_dir   = args.data
+   wc.backend = args.backend
+
+   # Load lookups before taking requests
+   #
+   message, lookupD = getLookups()
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   httpd = make_server(args.host, args.port, application, server_class=ThreadingWSGIServer)
+   screen_logger.info("Serving well construction on http://%s:%d/" % (args.host, args.port))
+   httpd.serve_forever()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionSnapshot.py
+#
+# Project:  wellConstruction
+# Purpose:  Script publishes the NWIS tables, lookups and derived indexes as
+#            an immutable, versioned snapshot of the data directory and
+#            switches the requests over to it with one atomic rename.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Snapshots live in data/snapshots/<name>, each a complete data directory
+# holding the tables, the lookup files and every index and store built from
+# them. The file data/current names the snapshot requests read. It is
+# replaced with a rename, so a request sees either the old or the new name,
+# and a request keeps the snapshot it started with to the end. A snapshot is
+# never changed once published; older ones are pruned, keeping the previous
+# snapshots for requests still reading them.
+#
+# An ingest clones the current snapshot with hard links and applies the
+# extract to the clone. Tables, indexes and stores are always written to a
+# new file and renamed into place, so the links are never written through;
+# the SQLite database, which the ingest updates in place, is copied.
+#
+# Without data/current requests read the data directory itself.
+#
+# Usage
+#
+#   python wellConstructionSnapshot.py --data data publish ../extract
+#   python wellConstructionSnapshot.py --data data ingest --delta ../delta
+#   python wellConstructionSnapshot.py --data data switch 20260110T120000
+#   python wellConstructionSnapshot.py --data data list
+#   python wellConstructionSnapshot.py --data data prune --keep 3
+#
+###############################################################################
+
+import os, sys, glob, shutil
+
+import time
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+import requestWellConstruction as wc
+import wellConstructionIndex
+import wellConstructionColumns
+import wellConstructionDatabase
+import wellConstructionIntervals
+import wellConstructionLithology
+import wellConstructionSpatial
+import wellConstructionIngest
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+snapshot_keep   = 3
+name_format     = '%Y%m%dT%H%M%S'
+
+# =============================================================================
+
+def snapshotRoot (data_dir):
+
+   return os.path.join(data_dir, wc.snapshot_root)
+
+# =============================================================================
+
+def currentName (data_dir):
+
+   # Snapshot named by the pointer file, None without one
+   #
+   snapshot_dir = wc.snapshotDir(data_dir)
+   if snapshot_dir == data_dir:
+      return None
+
+   return os.path.basename(snapshot_dir)
+
+# =============================================================================
+
+def snapshotNames (data_dir):
+
+   # Published snapshots, oldest first
+   #
+   root_dir = snapshotRoot(data_dir)
+   if not os.path.isdir(root_dir):
+      return []
+
+   return sorted([x for x in os.listdir(root_dir) if not x.endswith('.tmp') and os.path.isdir(os.path.join(root_dir, x))])
+
+# =============================================================================
+
+def newSnapshotName (data_dir):
+
+   # Time of publication, suffixed when several are published in a second
+   #
+   name     = time.strftime(name_format, time.gmtime())
+   nameL    = snapshotNames(data_dir)
+   snapshot = name
+   count    = 1
+   while snapshot in nameL or os.path.exists(os.path.join(snapshotRoot(data_dir), snapshot + '.tmp')):
+      snapshot = "%s.%d" % (name, count)
+      count   += 1
+
+   return snapshot
+
+# =============================================================================
+
+def switchSnapshot (data_dir, name):
+
+   # Pointer written to a temporary file and renamed over the old one
+   #
+   if name not in snapshotNames(data_dir):
+      message = "No snapshot %s in %s" % (name, snapshotRoot(data_dir))
+      return message
+
+   pointer_file = os.path.join(data_dir, wc.snapshot_pointer)
+   tmp_file     = "%s.%d.tmp" % (pointer_file, os.getpid())
+
+   fh = open(tmp_file, 'w')
+   fh.write(name + "\n")
+   fh.flush()
+   os.fsync(fh.fileno())
+   fh.close()
+
+   os.replace(tmp_file, pointer_file)
+
+   return ''
+
+# =============================================================================
+
+def copySources (source_dir, snapshot_dir):
+
+   # Tables and lookup files, derived files are built again
+   #
+   fileL = []
+   for source_file in sorted(glob.glob(os.path.join(source_dir, "*.txt")) + glob.glob(os.path.join(source_dir, "*.json"))):
+      if os.path.basename(source_file) == wc.ingest_manifest:
+         continue
+      shutil.copy2(source_file, os.path.join(snapshot_dir, os.path.basename(source_file)))
+      fileL.append(source_file)
+
+   return fileL
+
+# =============================================================================
+
+def cloneFile (source_file, target_file):
+
+   # Hard link, or a copy for the database the ingest updates in place
+   #
+   if source_file.endswith('.db'):
+      shutil.copy2(source_file, target_file)
+   else:
+      os.link(source_file, target_file)
+
+# =============================================================================
+
+def cloneSnapshot (current_dir, snapshot_dir):
+
+   # Files of the current snapshot and its store directories
+   #
+   shutil.copytree(current_dir, snapshot_dir, copy_function=cloneFile, dirs_exist_ok=True,
+                   ignore=shutil.ignore_patterns('*.tmp', '*.old', '*-journal'))
+
+# =============================================================================
+
+def buildStores (snapshot_dir, backend='files'):
+
+   message     = ''
+
+   # Site_no, aquifer code and cooperator key indexes
+   #
+   for nwis_file in sorted(glob.glob(os.path.join(snapshot_dir, "*_01.txt"))):
+      message, siteCount = wellConstructionIndex.buildSiteIndex(nwis_file)
+      if len(message) > 0:
+         return message
+
+   aqfr_file = os.path.join(snapshot_dir, "aqfr_cd_query.txt")
+   if os.path.exists(aqfr_file):
+      message, codeCount = wellConstructionIndex.buildCodeIndex(aqfr_file, 'aqfr_cd')
+      if len(message) > 0:
+         return message
+
+   coop_file = os.path.join(snapshot_dir, "gw_coop_01.txt")
+   if os.path.exists(coop_file):
+      for keyColumn in wellConstructionIndex.coopColumnL:
+         message, keyCount = wellConstructionIndex.buildKeyIndex(coop_file, keyColumn)
+         if len(message) > 0:
+            return message
+
+   # Column stores
+   #
+   for table in wellConstructionColumns.column_tableL:
+      nwis_file = os.path.join(snapshot_dir, "".join([table, "_01.txt"]))
+      if os.path.exists(nwis_file):
+         message, siteCount = wellConstructionColumns.buildColumnStore(nwis_file, wellConstructionColumns.storeDirName(snapshot_dir, table))
+         if len(message) > 0:
+            return message
+
+   # Database, then the interval, lithology and spatial stores of the backend
+   #
+   if backend == 'sqlite':
+      message, tableD = wellConstructionDatabase.importDatabase(snapshot_dir)
+      if len(message) > 0:
+         return message
+
+   message, count = wellConstructionIntervals.writeIntervalStore(snapshot_dir, backend)
+   if len(message) > 0:
+      return message
+
+   message, countD = wellConstructionLithology.writeLithologyStore(snapshot_dir, backend)
+   if len(message) > 0:
+      return message
+
+   message, count = wellConstructionSpatial.writeSpatialStore(snapshot_dir, backend)
+
+   return message
+
+# =============================================================================
+
+def removeDir (path):
+
+   shutil.rmtree(path, ignore_errors=True)
+
+# =============================================================================
+
+def publishSnapshot (data_dir, source_dir, backend='files', keep=snapshot_keep):
+
+   message     = ''
+
+   # Snapshot built under a temporary name, then published and switched to
+   #
+   name        = newSnapshotName(data_dir)
+   root_dir    = snapshotRoot(data_dir)
+   tmp_dir     = os.path.join(root_dir, name + '.tmp')
+   os.makedirs(tmp_dir)
+
+   fileL       = copySources(source_dir, tmp_dir)
+   if len(fileL) < 1:
+      removeDir(tmp_dir)
+      message = "No NWIS data files in %s" % source_dir
+      return message, None
+
+   message     = buildStores(tmp_dir, backend)
+   if len(message) > 0:
+      removeDir(tmp_dir)
+      return message, None
+
+   os.rename(tmp_dir, os.path.join(root_dir, name))
+
+   message     = switchSnapshot(data_dir, name)
+   if len(message) > 0:
+      return message, None
+
+   pruneSnapshots(data_dir, keep)
+
+   return message, name
+
+# =============================================================================
+
+def ingestSnapshot (data_dir, sourceL, delta=False, keep=snapshot_keep):
+
+   message     = ''
+
+   # Extract applied to a clone of the current snapshot
+   #
+   current_dir = wc.snapshotDir(data_dir)
+   if current_dir == data_dir:
+      message = "No current snapshot in %s, publish one first" % data_dir
+      return message, None, {}
+
+   name        = newSnapshotName(data_dir)
+   root_dir    = snapshotRoot(data_dir)
+   tmp_dir     = os.path.join(root_dir, name + '.tmp')
+   os.makedirs(tmp_dir)
+
+   cloneSnapshot(current_dir, tmp_dir)
+
+   message, reportD = wellConstructionIngest.ingestData(tmp_dir, sourceL, delta)
+   if len(message) > 0:
+      removeDir(tmp_dir)
+      return message, None, reportD
+
+   # Current snapshot kept when nothing changed
+   #
+   if sum(x['sites'] for x in reportD.values()) < 1:
+      removeDir(tmp_dir)
+      return message, None, reportD
+
+   os.rename(tmp_dir, os.path.join(root_dir, name))
+
+   message     = switchSnapshot(data_dir, name)
+   if len(message) > 0:
+      return message, None, reportD
+
+   pruneSnapshots(data_dir, keep)
+
+   return message, name, reportD
+
+# =============================================================================
+
+def pruneSnapshots (data_dir, keep=snapshot_keep):
+
+   # Newest snapshots kept, along with the current one and any older
+   #  temporary directories still being built
+   #
+   current  = currentName(data_dir)
+   nameL    = snapshotNames(data_dir)
+   removeL  = [x for x in nameL[:max(len(nameL) - keep, 0)] if x != current]
+   for name in removeL:
+      removeDir(os.path.join(snapshotRoot(data_dir), name))
+
+   return removeL
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   parser = argparse.ArgumentParser(description='Publish and switch versioned snapshots of the NWIS data directory')
+   parser.add_argument('--data', default='data', help='Directory holding the snapshots and the current pointer')
+   parser.add_argument('--keep', type=int, default=snapshot_keep, help='Snapshots kept when pruning (default %d)' % snapshot_keep)
+   subparsers = parser.add_subparsers(dest='command', required=True)
+
+   publishParser = subparsers.add_parser('publish', help='Publish a directory of NWIS data files as a new snapshot')
+   publishParser.add_argument('--backend', default=wc.backend, choices=['files', 'sqlite'], help='Backend the stores are built for')
+   publishParser.add_argument('source', help='Directory holding the NWIS data and lookup files')
+
+   ingestParser = subparsers.add_parser('ingest', help='Apply an extract to a copy of the current snapshot')
+   ingestParser.add_argument('--delta', action='store_true', help='Sources only add and replace rows, rows missing from them are kept')
+   ingestParser.add_argument('sources', nargs='+', help='Table files named <table>_01.txt or directories holding them')
+
+   switchParser = subparsers.add_parser('switch', help='Point requests at a published snapshot')
+   switchParser.add_argument('name', help='Snapshot name')
+
+   subparsers.add_parser('list', help='List the published snapshots')
+   subparsers.add_parser('prune', help='Remove all but the newest snapshots')
+
+   args   = parser.parse_args()
+
+   message = ''
+   if args.command == 'publish':
+      message, name = publishSnapshot(args.data, args.source, args.backend, args.keep)
+      if len(message) < 1:
+         screen_logger.info("Published snapshot %s" % name)
+
+   elif args.command == 'ingest':
+      message, name, reportD = ingestSnapshot(args.data, args.sources, args.delta, args.keep)
+      for table in sorted(reportD.keys()):
+         countD = reportD[table]
+         screen_logger.info("Applied %d rows for %d sites to %s, skipped %d rows not newer than the table" % (countD['rows'], countD['sites'], table, countD['skipped']))
+      if len(message) < 1 and name is None:
+         screen_logger.info("No changes, kept snapshot %s" % currentName(args.data))
+      elif len(message) < 1:
+         screen_logger.info("Published snapshot %s" % name)
+
+   elif args.command == 'switch':
+      message = switchSnapshot(args.data, args.name)
+      if len(message) < 1:
+         screen_logger.info("Switched to snapshot %s" % args.name)
+
+   elif args.command == 'list':
+      current = currentName(args.data)
+      for name in snapshotNames(args.data):
+         screen_logger.info("%s %s" % ('*' if name == current else ' ', name))
+
+   elif args.command == 'prune':
+      for name in pruneSnapshots(args.data, args.keep):
+         screen_logger.info("Removed snapshot %s" % name)
+
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   sys.exit(0)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionSpatial.py
+#
+# Project:  wellConstruction
+# Purpose:  Grid index over the sitefile coordinates answering which wells
+#            lie within a bounding box and which are nearest to a point,
+#            with a summary of each well, without reading the sitefile.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Sites are bucketed by dec_lat_va and dec_long_va into cells of a fixed
+# grid, cell_degrees on a side, numbered row by row from -90, -180. Only
+# occupied cells are stored, in cell order, so the cells of one grid row
+# within a longitude range are a contiguous run. A bounding box reads the
+# runs of the rows it spans and keeps the sites inside it. A nearest query
+# searches rings of cells around the point until the k-th nearest site is
+# closer than any site outside the rings can be. Distances are great circle
+# distances in feet. Sites without coordinates are not indexed.
+#
+# Store layout (data/spatial/<version>/, see wellConstructionStore)
+#
+#   meta.json           site and cell counts, cell size and source versions
+#   cell.I              uint32 occupied cells in order
+#   cell.rows           uint32 first site of each cell plus the final count
+#   site_no.keys        site numbers in cell order, NUL padded to 15 bytes
+#   station_nm.keys     station names, NUL padded to 50 bytes
+#   lat.d lon.d         float64 dec_lat_va and dec_long_va
+#   alt.d well.d hole.d float64 alt_va, well_depth_va and hole_depth_va,
+#                        NaN for blanks
+#
+# Usage
+#
+#   python wellConstructionSpatial.py --data data
+#
+###############################################################################
+
+import os, sys
+
+import json, math, bisect
+
+from array import array
+
+import wellConstructionDatabase
+from wellConstructionStore import sourceVersion, mapFile, MappedKeys, writeKeys, writeArray, newStore, publishStore, readStoreMeta, openStore
+from wellConstructionIntervals import readTableRows, toFloat
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+store_version   = 1
+key_width       = 15
+name_width      = 50
+
+cell_degrees    = 0.1
+grid_columns    = int(round(360.0 / cell_degrees))
+earth_radius    = 6371008.8 / 0.3048
+
+summaryColumnD  = {
+                   'alt'  : 'alt_va',
+                   'well' : 'well_depth_va',
+                   'hole' : 'hole_depth_va'
+                  }
+
+# =============================================================================
+
+def storeDirName (data_dir):
+
+   return os.path.join(data_dir, "spatial")
+
+# =============================================================================
+
+def sourceFileList (data_dir, backend='files'):
+
+   if backend == 'sqlite':
+      return [wellConstructionDatabase.databaseFileName(data_dir)]
+
+   return [os.path.join(data_dir, "sitefile_01.txt")]
+
+# =============================================================================
+
+def gridRow (lat):
+
+   return int(math.floor((lat + 90.0) / cell_degrees))
+
+# =============================================================================
+
+def gridColumn (lon):
+
+   return min(int(math.floor((lon + 180.0) / cell_degrees)), grid_columns - 1)
+
+# =============================================================================
+
+def siteDistance (fromL, toL):
+
+   # Great circle distance in feet between two latitude, longitude pairs
+   #
+   lat1, lon1 = [math.radians(x) for x in fromL]
+   lat2, lon2 = [math.radians(x) for x in toL]
+
+   value = math.sin((lat2 - lat1) / 2.0) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2.0) ** 2
+
+   return 2.0 * earth_radius * math.asin(min(1.0, math.sqrt(value)))
+
+# =============================================================================
+
+def readLocations (data_dir, backend='files'):
+
+   # Cell, coordinates and summary values of every site with coordinates
+   #
+   message, columnL, rowL = readTableRows('sitefile', data_dir, backend)
+   if len(message) > 0:
+      return message, []
+
+   siteIndex   = columnL.index('site_no')
+   nameIndex   = columnL.index('station_nm')
+   latIndex    = columnL.index('dec_lat_va')
+   lonIndex    = columnL.index('dec_long_va')
+   indexL      = [columnL.index(summaryColumnD[x]) for x in ['alt', 'well', 'hole']]
+
+   locationL   = []
+   for valuesL in rowL:
+      lat = toFloat(valuesL[latIndex])
+      lon = toFloat(valuesL[lonIndex])
+      if lat != lat or lon != lon or abs(lat) > 90.0 or abs(lon) > 180.0:
+         continue
+      locationL.append(tuple([gridRow(lat) * grid_columns + gridColumn(lon), valuesL[siteIndex], lat, lon] +
+                             [toFloat(valuesL[x]) for x in indexL] +
+                             [valuesL[nameIndex]]))
+
+   locationL.sort()
+
+   return message, locationL
+
+# =============================================================================
+
+def buildGrid (locationL):
+
+   # Occupied cells and the sites of each in cell order
+   #
+   store       = {
+                  'cells' : array('I'),
+                  'rows'  : array('I'),
+                  'sites' : [x[1] for x in locationL],
+                  'names' : [x[-1] for x in locationL]
+                 }
+   for name, position in [('lat', 2), ('lon', 3), ('alt', 4), ('well', 5), ('hole', 6)]:
+      store[name] = array('d', [x[position] for x in locationL])
+
+   for i, location in enumerate(locationL):
+      if len(store['cells']) < 1 or store['cells'][-1] != location[0]:
+         store['cells'].append(location[0])
+         store['rows'].append(i)
+   store['rows'].append(len(locationL))
+
+   return store
+
+# =============================================================================
+
+def writeSpatialStore (data_dir, backend='files'):
+
+   message     = ''
+
+   versionD    = sourceVersion(sourceFileList(data_dir, backend))
+
+   message, locationL = readLocations(data_dir, backend)
+   if len(message) > 0:
+      return message, 0
+
+   store       = buildGrid(locationL)
+
+   # Write store into a new version of the store directory
+   #
+   tmp_dir     = newStore(storeDirName(data_dir))
+
+   writeKeys(os.path.join(tmp_dir, "site_no.keys"), store['sites'], key_width)
+   writeKeys(os.path.join(tmp_dir, "station_nm.keys"), store['names'], name_width)
+   writeArray(os.path.join(tmp_dir, "cell.I"), store['cells'])
+   writeArray(os.path.join(tmp_dir, "cell.rows"), store['rows'])
+
+   for name in ['lat', 'lon', 'alt', 'well', 'hole']:
+      writeArray(os.path.join(tmp_dir, "%s.%s" % (name, store[name].typecode)), store[name])
+
+   metaD = {
+            'version'      : store_version,
+            'byteorder'    : sys.byteorder,
+            'backend'      : backend,
+            'sources'      : versionD,
+            'cell_degrees' : cell_degrees,
+            'sites'        : len(store['sites']),
+            'cells'        : len(store['cells'])
+           }
+
+   publishStore(tmp_dir, metaD)
+
+   return message, len(store['sites'])
+
+# =============================================================================
+
+def mapSpatialStore (data_dir, backend='files'):
+
+   # Mapped store files, None without a store current with the sources
+   #
+   version_dir, metaD = readStoreMeta(storeDirName(data_dir), {
+                                                               'version'      : store_version,
+                                                               'backend'      : backend,
+                                                               'cell_degrees' : cell_degrees,
+                                                               'sources'      : sourceVersion(sourceFileList(data_dir, backend))
+                                                              })
+   if version_dir is None:
+      return None
+
+   store = {
+            'sites' : MappedKeys(mapFile(os.path.join(version_dir, "site_no.keys")), key_width),
+            'names' : MappedKeys(mapFile(os.path.join(version_dir, "station_nm.keys")), name_width),
+            'cells' : mapFile(os.path.join(version_dir, "cell.I"), 'I'),
+            'rows'  : mapFile(os.path.join(version_dir, "cell.rows"), 'I')
+           }
+   for name in ['lat', 'lon', 'alt', 'well', 'hole']:
+      store[name] = mapFile(os.path.join(version_dir, "%s.d" % name), 'd')
+
+   return store
+
+# =============================================================================
+
+def loadSpatialStore (data_dir, backend='files'):
+
+   # Mapped store files, or locations read from the sitefile without a current store
+   #
+   store       = mapSpatialStore(data_dir, backend)
+   if store is None:
+      message, locationL = readLocations(data_dir, backend)
+      if len(message) > 0:
+         return message, None
+      store = buildGrid(locationL)
+
+   # Cell positions and the rows and columns holding sites
+   #
+   store['position'] = dict((cell, i) for i, cell in enumerate(store['cells']))
+   gridRowL          = [x // grid_columns for x in store['cells']]
+   gridColumnL       = [x % grid_columns for x in store['cells']]
+   store['extent']   = (min(gridRowL, default=0), max(gridRowL, default=-1),
+                        min(gridColumnL, default=0), max(gridColumnL, default=-1))
+
+   return '', store
+
+# =============================================================================
+
+def openSpatialStore (data_dir, backend='files'):
+
+   # Store kept per process for the current version of the sources
+   #
+   versionD    = sourceVersion(sourceFileList(data_dir, backend))
+   storeKey    = (os.path.abspath(data_dir), ('spatial', backend), json.dumps(versionD, sort_keys=True))
+
+   return openStore(storeKey, lambda: loadSpatialStore(data_dir, backend))
+
+# =============================================================================
+
+def siteSummary (store, row):
+
+   def value (x):
+      return None if x != x else x
+
+   return {
+           'site_no'       : store['sites'][row],
+           'station_nm'    : store['names'][row],
+           'dec_lat_va'    : store['lat'][row],
+           'dec_long_va'   : store['lon'][row],
+           'alt_va'        : value(store['alt'][row]),
+           'well_depth_va' : value(store['well'][row]),
+           'hole_depth_va' : value(store['hole'][row])
+          }
+
+# =============================================================================
+
+def cellSites (store, cell):
+
+   # Rows of the sites in one cell
+   #
+   position = store['position'].get(cell)
+   if position is None:
+      return range(0)
+
+   return range(store['rows'][position], store['rows'][position + 1])
+
+# =============================================================================
+
+def queryBox (store, west, south, east, north):
+
+   # Sites within the box in site_no order, a west edge east of the east
+   #  edge wraps across 180 degrees
+   #
+   if west <= east:
+      spanL = [(gridColumn(west), gridColumn(east))]
+   elif gridColumn(west) <= gridColumn(east):
+      spanL = [(0, grid_columns - 1)]
+   else:
+      spanL = [(gridColumn(west), grid_columns - 1), (0, gridColumn(east))]
+
+   rowL     = []
+   for gridRowNumber in range(max(gridRow(south), store['extent'][0]), min(gridRow(north), store['extent'][1]) + 1):
+      for first, last in spanL:
+         start = bisect.bisect_left(store['cells'], gridRowNumber * grid_columns + first)
+         end   = bisect.bisect_right(store['cells'], gridRowNumber * grid_columns + last)
+         for position in range(start, end):
+            for row in range(store['rows'][position], store['rows'][position + 1]):
+               lat = store['lat'][row]
+               lon = store['lon'][row]
+               if lat < south or lat > north:
+                  continue
+               if (west <= lon <= east) if west <= east else (lon >= west or lon <= east):
+                  rowL.append(row)
+
+   return [siteSummary(store, x) for x in sorted(rowL, key=lambda x: store['sites'][x])]
+
+# =============================================================================
+
+def ringBound (lat, lon, rowNumber, columnNumber, ring):
+
+   # Shortest distance from the point to any site outside the ring of cells
+   #
+   south    = (rowNumber - ring) * cell_degrees - 90.0
+   north    = (rowNumber + ring + 1) * cell_degrees - 90.0
+   west     = (columnNumber - ring) * cell_degrees - 180.0
+   east     = (columnNumber + ring + 1) * cell_degrees - 180.0
+
+   bound    = earth_radius * math.radians(min(lat - south, north - lat))
+
+   # Ring edges are meridians until the ring wraps the whole globe, the
+   #  nearest point of a meridian 90 degrees or more away is the pole
+   #
+   offset   = min(lon - west, east - lon)
+   if east - west < 360.0:
+      if offset < 90.0:
+         bound = min(bound, earth_radius * math.asin(math.cos(math.radians(lat)) * math.sin(math.radians(offset))))
+      else:
+         bound = min(bound, earth_radius * math.radians(90.0 - abs(lat)))
+
+   return bound
+
+# =============================================================================
+
+def queryNearest (store, lat, lon, k):
+
+   # Rings of cells searched outward until no unsearched site can be closer
+   #  than the k-th nearest found, columns wrap across 180 degrees
+   #
+   rowNumber    = gridRow(lat)
+   columnNumber = gridColumn(lon)
+   first_row, last_row, first_column, last_column = store['extent']
+
+   nearL    = []
+   if len(store['sites']) < 1:
+      return nearL
+
+   ring     = 0
+   rowS     = set()
+   while True:
+      for cellRow in range(max(rowNumber - ring, first_row), min(rowNumber + ring, last_row) + 1):
+         if abs(cellRow - rowNumber) == ring:
+            columnL = range(columnNumber - ring, columnNumber + ring + 1)
+         else:
+            columnL = [columnNumber - ring, columnNumber + ring]
+         for cellColumn in sorted(set(x % grid_columns for x in columnL)):
+            if cellColumn < first_column or cellColumn > last_column:
+               continue
+            for row in cellSites(store, cellRow * grid_columns + cellColumn):
+               if row in rowS:
+                  continue
+               rowS.add(row)
+               nearL.append((siteDistance((lat, lon), (store['lat'][row], store['lon'][row])), store['sites'][row], row))
+
+      nearL.sort()
+      del nearL[k:]
+
+      if rowNumber - ring <= first_row and rowNumber + ring >= last_row and \
+         ((columnNumber - ring <= first_column and columnNumber + ring >= last_column) or 2 * ring + 1 >= grid_columns):
+         break
+      if len(nearL) >= k and nearL[-1][0] <= ringBound(lat, lon, rowNumber, columnNumber, ring):
+         break
+      ring += 1
+
+   siteL    = []
+   for distance, site_no, row in nearL:
+      summaryD = siteSummary(store, row)
+      summaryD['distance'] = distance
+      siteL.append(summaryD)
+
+   return siteL
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   screen_logger = logging.getLogger()
+   formatter     = logging.Formatter(fmt='%(message)s')
+   console       = logging.StreamHandler()
+   console.setFormatter(formatter)
+   screen_logger.addHandler(console)
+   screen_logger.setLevel(logging.INFO)
+
+   parser = argparse.ArgumentParser(description='Build the grid index over the sitefile coordinates')
+   parser.add_argument('--data', default='data', help='Directory holding the NWIS data files')
+   parser.add_argument('--backend', default=os.environ.get('WELL_CONSTRUCTION_BACKEND', 'files'), choices=['files', 'sqlite'], help='Read the sitefile from the flat file or the SQLite database')
+   args   = parser.parse_args()
+
+   message, siteCount = writeSpatialStore(args.data, args.backend)
+   if len(message) > 0:
+      screen_logger.error(message)
+      sys.exit(1)
+
+   screen_logger.info("Indexed %d sites in %s" % (siteCount, storeDirName(args.data)))
+
+   sys.exit(0)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionStore.py
+#
+# Project:  wellConstruction
+# Purpose:  Shared handling of the memory-mapped stores built from the NWIS
+#            tables: versioned store directories switched with one rename,
+#            mapped files and the per-process cache of open stores.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Each store directory (data/columns/<table>, data/intervals, ...) holds one
+# subdirectory per version of the store and the file current naming the
+# version requests read. A new version is written to a temporary directory,
+# meta.json last, renamed into place and then named in current with a
+# rename, so a reader always finds a whole store and reads its meta.json and
+# arrays from the same version. The previous version is kept for readers
+# that resolved current just before the switch; older ones are removed.
+# A store directory without current is read as it is.
+#
+# A store records the size and modification time of its sources, taken
+# before the sources are read, so a change during a build leaves the store
+# out of date rather than wrong.
+#
+###############################################################################
+
+import os, sys, glob, shutil
+
+import json, mmap, time, threading
+
+from array import array
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+store_pointer   = "current"
+store_keep      = 2
+
+storeD          = {}
+storeLock       = threading.Lock()
+
+# =============================================================================
+
+def sourceVersion (fileL):
+
+   versionD = {}
+   for source_file in fileL:
+      if os.path.exists(source_file):
+         statInfo = os.stat(source_file)
+         versionD[os.path.basename(source_file)] = [statInfo.st_size, statInfo.st_mtime_ns]
+
+   return versionD
+
+# =============================================================================
+
+def mapFile (file, typeCode=None):
+
+   fh = open(file, 'rb')
+   if os.fstat(fh.fileno()).st_size < 1:
+      fh.close()
+      if typeCode is None:
+         return b''
+      return array(typeCode)
+
+   fileMap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+   fh.close()
+
+   if typeCode is None:
+      return fileMap
+
+   return memoryview(fileMap).cast(typeCode)
+
+# =============================================================================
+
+class MappedKeys:
+
+   # Fixed width, NUL padded keys of a mapped file decoded as they are
+   #  indexed, so opening a store does not decode every key
+   #
+   def __init__ (self, keys, width):
+
+      self.keys  = keys
+      self.width = width
+      self.count = len(keys) // width
+
+   def __len__ (self):
+
+      return self.count
+
+   def __getitem__ (self, index):
+
+      if index < 0:
+         index += self.count
+      if index < 0 or index >= self.count:
+         raise IndexError(index)
+
+      return self.keys[index * self.width:(index + 1) * self.width].rstrip(b'\0').decode('utf-8')
+
+   def __iter__ (self):
+
+      for index in range(self.count):
+         yield self[index]
+
+# =============================================================================
+
+def writeKeys (file, keyL, width):
+
+   # Keys NUL padded, and cut, to the width
+   #
+   fh = open(file, 'wb')
+   fh.write(b''.join([x.encode('utf-8')[:width].ljust(width, b'\0') for x in keyL]))
+   fh.close()
+
+# =============================================================================
+
+def writeArray (file, values):
+
+   fh = open(file, 'wb')
+   values.tofile(fh)
+   fh.close()
+
+# =============================================================================
+
+def storeVersions (store_dir):
+
+   # Published versions of a store, oldest first
+   #
+   if not os.path.isdir(store_dir):
+      return []
+
+   return sorted([x for x in os.listdir(store_dir) if not x.endswith('.tmp') and os.path.isdir(os.path.join(store_dir, x))])
+
+# =============================================================================
+
+def newStore (store_dir):
+
+   # Temporary directory for a new version of the store, named for the time
+   #  it was started
+   #
+   os.makedirs(store_dir, exist_ok=True)
+
+   name     = "v%d" % time.time_ns()
+   while os.path.exists(os.path.join(store_dir, name)) or os.path.exists(os.path.join(store_dir, name + ".tmp")):
+      name  = "v%d" % time.time_ns()
+
+   tmp_dir  = os.path.join(store_dir, name + ".tmp")
+   os.makedirs(tmp_dir)
+
+   return tmp_dir
+
+# =============================================================================
+
+def publishStore (tmp_dir, metaD):
+
+   # Meta data written last, the version renamed into place and named in
+   #  the pointer with a rename
+   #
+   store_dir    = os.path.dirname(tmp_dir)
+   name         = os.path.basename(tmp_dir)[:-len(".tmp")]
+
+   fh = open(os.path.join(tmp_dir, "meta.json"), 'w')
+   json.dump(metaD, fh, indent=1)
+   fh.close()
+
+   os.rename(tmp_dir, os.path.join(store_dir, name))
+
+   pointer_file = os.path.join(store_dir, store_pointer)
+   tmp_file     = "%s.%d.tmp" % (pointer_file, os.getpid())
+
+   fh = open(tmp_file, 'w')
+   fh.write(name + "\n")
+   fh.close()
+
+   os.replace(tmp_file, pointer_file)
+
+   # Versions before the previous one, and the files of a store written
+   #  before stores were versioned
+   #
+   oldL         = [x for x in storeVersions(store_dir) if x != name]
+   for old_name in oldL[:max(0, len(oldL) - (store_keep - 1))]:
+      shutil.rmtree(os.path.join(store_dir, old_name), ignore_errors=True)
+
+   for old_file in glob.glob(os.path.join(store_dir, "*")):
+      if os.path.isfile(old_file) and os.path.basename(old_file) != store_pointer and not old_file.endswith(".tmp"):
+         os.remove(old_file)
+
+# =============================================================================
+
+def storeVersionDir (store_dir):
+
+   # Version named by the pointer, or the store directory itself without
+   #  one, None when the named version is missing
+   #
+   pointer_file = os.path.join(store_dir, store_pointer)
+   if not os.path.exists(pointer_file):
+      return store_dir
+
+   try:
+      fh = open(pointer_file, 'r')
+      name = fh.read().strip()
+      fh.close()
+   except OSError:
+      return None
+
+   version_dir  = os.path.join(store_dir, name)
+   if len(name) < 1 or not os.path.isdir(version_dir):
+      return None
+
+   return version_dir
+
+# =============================================================================
+
+def readStoreMeta (store_dir, checkD):
+
+   # Version directory and meta data of a store whose meta data match every
+   #  entry of checkD, None without a current store
+   #
+   version_dir  = storeVersionDir(store_dir)
+   if version_dir is None:
+      return None, None
+
+   meta_file    = os.path.join(version_dir, "meta.json")
+   if not os.path.exists(meta_file):
+      return None, None
+
+   fh = open(meta_file, 'r')
+   metaD = json.load(fh)
+   fh.close()
+
+   checkD = dict(checkD)
+   checkD['byteorder'] = sys.byteorder
+   for key, value in checkD.items():
+      if metaD.get(key) != value:
+         return None, None
+
+   return version_dir, metaD
+
+# =============================================================================
+
+def openStore (storeKey, loadStore):
+
+   # Store kept per process under (data directory, store name, version of
+   #  the sources), the stores of earlier versions of the same sources
+   #  dropped. loadStore returns a message and the store, None when there
+   #  is none to keep
+   #
+   with storeLock:
+      if storeKey in storeD:
+         return '', storeD[storeKey]
+
+   message, store = loadStore()
+   if len(message) > 0 or store is None:
+      return message, store
+
+   with storeLock:
+      for oldKey in [x for x in storeD if x[:2] == storeKey[:2]]:
+         del storeD[oldKey]
+      storeD[storeKey] = store
+
+   return message, store
+
+# =============================================================================
+
+def releaseStores (released):
+
+   # Stores of the data directories for which released is true dropped,
+   #  requests still using them keep their own references
+   #
+   with storeLock:
+      for oldKey in [x for x in storeD if released(x[0])]:
+         del storeD[oldKey]
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellConstructionSvg.py
+#
+# Project:  wellConstruction
+# Purpose:  Server-side rendering of the well construction diagram as a
+#            standalone SVG from the assembled sitefile, lithology and well
+#            construction structures, laid out like d3.well_construction.js.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Leonard Orzol <llorzol@usgs.gov>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Lithology and open interval patterns are the files in htdocs/lithology_patterns,
+# referenced through WELL_CONSTRUCTION_PATTERNS (default ../lithology_patterns,
+# the directory beside cgi-bin) or embedded as data URIs for use outside the
+# web site. Axis ticks come from get_max_min as in the browser.
+#
+# Usage
+#
+#   python wellConstructionSvg.py --site 420358121280001 --output 420358121280001.svg
+#
+###############################################################################
+
+import os, sys
+
+import base64
+
+from xml.sax.saxutils import escape, quoteattr
+
+from wellConstructionExtents import extentAxes
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+pattern_url     = os.environ.get('WELL_CONSTRUCTION_PATTERNS', '../lithology_patterns')
+pattern_dir     = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'htdocs', 'lithology_patterns')
+
+svg_width       = 600
+svg_height      = 700
+
+y_box_min       = 50
+y_box_max       = 600
+y_axis          = y_box_max - y_box_min
+
+x_box_min       = 75
+x_box_width     = 150
+x_box_max       = x_box_min + x_box_width
+x_axis          = x_box_max - x_box_min
+
+text_size       = 9
+tic_length      = 6
+legend_box      = 20
+
+seal_color      = '#ED9EE9'
+
+mimeTypeD       = {'.svg': 'image/svg+xml', '.png': 'image/png'}
+
+patternDataD    = {}
+
+svgStyle        = """
+.site_title {font-family: Verdana; font-size: 14px; font-weight: bold;}
+.tic_labels {font-family: Verdana; font-size: 9px; text-anchor: end;}
+.tic_labels_right {font-family: Verdana; font-size: 9px; text-anchor: start;}
+.x_tic_labels {font-family: Verdana; font-size: 9px; text-anchor: middle;}
+.x_axis_label {font-family: Verdana; font-size: 12px; font-weight: bold; text-anchor: middle;}
+.y_axis_label {font-family: Verdana; font-size: 12px; font-weight: bold; text-anchor: middle;}
+.legend_descriptions {font-family: Verdana; font-size: 9px; text-anchor: start;}
+"""
+
+# =============================================================================
+
+def patternHref (image, embed=False):
+
+   # Pattern file as a data URI, read once per process, or a link to it
+   #
+   if not embed:
+      return "/".join([pattern_url.rstrip('/'), image])
+
+   if image not in patternDataD:
+      pattern_file = os.path.join(pattern_dir, os.path.basename(image))
+      mimeType     = mimeTypeD.get(os.path.splitext(image)[1].lower(), 'application/octet-stream')
+      try:
+         with open(pattern_file, 'rb') as fh:
+            patternDataD[image] = "data:%s;base64,%s" % (mimeType, base64.b64encode(fh.read()).decode('ascii'))
+      except OSError:
+         patternDataD[image] = "/".join([pattern_url.rstrip('/'), image])
+
+   return patternDataD[image]
+
+# =============================================================================
+
+def number (value):
+
+   return ("%.3f" % value).rstrip('0').rstrip('.')
+
+# =============================================================================
+
+def rect (x, y, width, height, fill, strokeWidth=1):
+
+   return '<rect x="%s" y="%s" width="%s" height="%s" fill=%s stroke="black" stroke-width="%d"/>' % \
+          (number(x), number(y), number(width), number(height), quoteattr(fill), strokeWidth)
+
+# =============================================================================
+
+def text (x, y, label, cssClass, transform=None):
+
+   if transform is not None:
+      return '<text transform="%s" class="%s">%s</text>' % (transform, cssClass, escape(str(label)))
+
+   return '<text x="%s" y="%s" class="%s">%s</text>' % (number(x), number(y), cssClass, escape(str(label)))
+
+# =============================================================================
+
+def toDepth (value, default):
+
+   try:
+      return float(value)
+   except (TypeError, ValueError):
+      return default
+
+# =============================================================================
+
+def altitudeAccuracy (alt_va):
+
+   # Decimal places of the land surface altitude as recorded
+   #
+   alt_va = str(alt_va).strip()
+   if '.' in alt_va:
+      return len(alt_va.split('.', 1)[1])
+
+   return 0
+
+# =============================================================================
+
+def renderWellSvg (site_no, siteD, geohD, wellD, extent, land_surface=0.0, embed=False):
+
+   depth_max, depth_min, dia_max = extent
+
+   svgL     = []
+   defsL    = []
+   legendL  = []
+   legendD  = {}
+   patternS = set()
+
+   svgL.append('<?xml version="1.0" encoding="utf-8"?>')
+   svgL.append('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" width="%d" height="%d" viewBox="0 0 %d %d">' %
+               (svg_width, svg_height, svg_width, svg_height))
+   svgL.append('<style>%s</style>' % svgStyle)
+   svgL.append('<rect x="0" y="0" width="%d" height="%d" fill="white"/>' % (svg_width, svg_height))
+
+   # Site title and axis box
+   #
+   svgL.append(text(x_box_min, y_box_min * 0.5, "Site %s" % site_no, 'site_title'))
+   svgL.append(rect(x_box_min, y_box_min, x_box_max - x_box_min, y_box_max, '#cccccc', 2))
+
+   # No well construction information
+   #
+   axisD = extentAxes(extent)
+   if len(wellD) < 1 or axisD['y'] is None:
+      transform = "translate(%s, %s) rotate(-90)" % (number((x_box_max + x_box_min) * 0.5), number((y_box_max + y_box_min) * 0.5))
+      svgL.append(text(0, 0, "No Well Construction Information", 'y_axis_label', transform))
+      svgL.append('</svg>')
+      return "\n".join(svgL)
+
+   y_min, y_max, y_interval = axisD['y']
+   y_range  = y_max - y_min
+
+   def yPixel (depth):
+      return y_box_min + y_axis * (depth - y_min) / y_range
+
+   def addPattern (image):
+      if image not in patternS:
+         patternS.add(image)
+         defsL.append('<pattern id=%s patternUnits="userSpaceOnUse" width="100" height="100"><image xlink:href=%s x="0" y="0" width="100" height="100"/></pattern>' %
+                      (quoteattr(image), quoteattr(patternHref(image, embed))))
+      return "url(#%s)" % image
+
+   def addLegend (key, description, fill):
+      if key not in legendD:
+         legendD[key] = True
+         legendL.append((description, fill))
+
+   # Left depth axis
+   #
+   axisL    = ['<g stroke="black" stroke-width="1">']
+   labelL   = []
+   axisL.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' % (x_box_min, y_box_min, x_box_min, y_box_max))
+   y = y_min
+   while y <= y_max:
+      y_tic = yPixel(y)
+      axisL.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' % (x_box_min - tic_length, number(y_tic), x_box_min, number(y_tic)))
+      labelL.append(text(x_box_min - tic_length - 3, y_tic + text_size * 0.35, "%.0f" % y, 'tic_labels'))
+      y += y_interval
+
+   labelOffset = (len(str(y_max)) + 5) * text_size * 0.6
+   transform   = "translate(%s, %s) rotate(-90)" % (number(x_box_min - labelOffset), number((y_box_max + y_box_min) * 0.5))
+   labelL.append(text(0, 0, "Depth Below Land Surface, in feet", 'y_axis_label', transform))
+
+   # Right elevation axis
+   #
+   accuracy      = altitudeAccuracy(siteD.get('alt_va', ''))
+   elevation_max = land_surface
+   elevation_min = elevation_max - y_max
+   axisL.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' % (x_box_max, y_box_min, x_box_max, y_box_max))
+   elevation = elevation_max
+   while elevation >= elevation_min:
+      y_tic = yPixel(elevation_max - elevation)
+      axisL.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' % (x_box_max, number(y_tic), x_box_max + tic_length, number(y_tic)))
+      labelL.append(text(x_box_max + tic_length + 3, y_tic + text_size * 0.35, "%.*f" % (accuracy, elevation), 'tic_labels_right'))
+      elevation -= y_interval
+
+   labelOffset = (len(str(y_max)) + 5) * text_size * 0.6
+   transform   = "translate(%s, %s) rotate(-90)" % (number(x_box_max + labelOffset), number((y_box_max + y_box_min) * 0.5))
+   labelL.append(text(0, 0, "Elevation, in feet %s" % siteD.get('alt_datum_cd', ''), 'y_axis_label', transform))
+
+   # Borehole diameter labels
+   #
+   x_mid   = (x_box_max + x_box_min) * 0.5
+   x_range = None
+   if axisD['x'] is not None:
+      x_min, x_max, x_interval = axisD['x']
+      x_range = x_max - x_min
+      label   = "%g" % x_max
+      label_y = y_box_max + y_box_min + text_size * 1.5
+      axisL.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' % (number(x_mid), y_box_max + y_box_min, number(x_mid), y_box_max + y_box_min - 10))
+      labelL.append(text(x_box_min, label_y, label, 'x_tic_labels'))
+      labelL.append(text(x_mid, label_y, "0", 'x_tic_labels'))
+      labelL.append(text(x_box_max, label_y, label, 'x_tic_labels'))
+      labelL.append(text(x_mid, y_box_max + y_box_min + text_size * 4, "Borehole Diameter, inches", 'x_axis_label'))
+
+   axisL.append('</g>')
+
+   # Lithology across the width of the box
+   #
+   lithologyL = ['<g class="lithology">']
+   for geoh_seq_nu in sorted(geohD.keys()):
+      recordD     = geohD[geoh_seq_nu]
+      lith_cd     = recordD['lith_cd']
+      description = recordD['lith_ds']
+      if len(recordD['lith_unit_cd']) > 0:
+         description += " [%s]" % recordD['lith_unit_ds']
+
+      if len(lith_cd) < 1 and len(recordD['lith_unit_cd']) > 0:
+         lith_cd     = recordD['lith_unit_cd']
+         description = recordD['lith_unit_ds']
+         fill        = 'red'
+      elif len(recordD['image']) > 0:
+         fill        = addPattern(recordD['image'])
+      else:
+         fill        = 'white'
+
+      addLegend(lith_cd, description, fill)
+
+      top_depth = toDepth(recordD['lith_top_va'], y_min)
+      bot_depth = toDepth(recordD['lith_bottom_va'], y_max)
+      y_top     = yPixel(top_depth)
+      lithologyL.append(rect(x_box_min, y_top, x_box_max - x_box_min, yPixel(bot_depth) - y_top, fill))
+   lithologyL.append('</g>')
+
+   # Seal, hole, casing and open intervals of each construction record
+   #
+   boreL   = ['<g class="wellBore">']
+   for cons_seq_nu in sorted(wellD.keys()):
+      consD = wellD[cons_seq_nu]
+
+      if 'gw_cons' in consD:
+         recordD = consD['gw_cons']
+         if len(str(recordD['seal_depth_va'])) > 0:
+            color   = recordD['seal_cl'] if len(recordD['seal_cl']) > 0 else seal_color
+            seal_ds = recordD['seal_ds'] if len(recordD['seal_ds']) > 0 else "Unknown"
+            addLegend("Seal, %s" % seal_ds, "Seal, %s" % seal_ds, color)
+
+            width = (x_box_max - x_box_min) * 0.9
+            y_top = yPixel(0.0)
+            boreL.append(rect(x_mid - 0.5 * width, y_top, width, yPixel(toDepth(recordD['seal_depth_va'], 0.0)) - y_top, color))
+
+      if x_range is None or x_range <= 0:
+         continue
+
+      for seq_nu, recordD in consD.get('gw_hole', {}).items():
+         width = x_axis * recordD['hole_dia_va'] / x_range
+         y_top = yPixel(recordD['hole_top_va'])
+         boreL.append(rect(x_mid - 0.5 * width, y_top, width, yPixel(recordD['hole_bottom_va']) - y_top, 'white'))
+
+      for seq_nu, recordD in consD.get('gw_csng', {}).items():
+         material = recordD['csng_material_ds'] if len(recordD['csng_material_ds']) > 0 else "Not recorded"
+         color    = recordD['csng_material_cl'] if len(recordD['csng_material_cl']) > 0 else 'white'
+         addLegend("Casing, %s" % material, "Casing, %s" % material, color)
+
+         width = x_axis * recordD['csng_dia_va'] / x_range
+         y_top = yPixel(recordD['csng_top_va'])
+         boreL.append(rect(x_mid - 0.5 * width, y_top, width, yPixel(recordD['csng_bottom_va']) - y_top, color))
+
+      for seq_nu, recordD in consD.get('gw_open', {}).items():
+         fill  = addPattern(recordD['image']) if len(recordD['image']) > 0 else 'white'
+         addLegend("Open interval, %s" % recordD['open_ds'], "Open interval, %s" % recordD['open_ds'], fill)
+
+         width = x_axis * recordD['open_dia_va'] / x_range
+         y_top = yPixel(recordD['open_top_va'])
+         boreL.append(rect(x_mid - 0.5 * width, y_top, width, yPixel(recordD['open_bottom_va']) - y_top, fill))
+   boreL.append('</g>')
+
+   # Legend
+   #
+   x_legend = x_box_max + 100
+   y_top    = y_box_min
+   legendSvgL = ['<g class="legend_descriptions">']
+   for description, fill in legendL:
+      legendSvgL.append(rect(x_legend, y_top, legend_box, legend_box, fill))
+      legendSvgL.append(text(x_legend + legend_box * 1.25, y_top + legend_box * 0.5, description, 'legend_descriptions'))
+      y_top += legend_box * 1.5
+   legendSvgL.append('</g>')
+
+   if len(defsL) > 0:
+      svgL.append('<defs>%s</defs>' % "".join(defsL))
+   svgL.extend(lithologyL)
+   svgL.extend(boreL)
+   svgL.extend(axisL)
+   svgL.extend(labelL)
+   svgL.extend(legendSvgL)
+   svgL.append('</svg>')
+
+   return "\n".join(svgL)
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+   import argparse
+
+   import requestWellConstruction as wc
+
+   parser = argparse.ArgumentParser(description='Render well construction diagrams as SVG files')
+   parser.add_argument('--data', default=wc.data_dir, help='Directory holding the NWIS data files')
+   parser.add_argument('--site', action='append', required=True, help='NWIS site number, repeat for several sites')
+   parser.add_argument('--output', default='.', help='Output file for one site or directory for several')
+   parser.add_argument('--link', action='store_true', help='Link the pattern files instead of embedding them')
+   args   = parser.parse_args()
+
+   message, DefinitionsD, ImageInfoD, aqfrInfoD = wc.loadLookups(args.data)
+   if len(message) > 0:
+      print(message)
+      sys.exit(1)
+
+   for site_no in args.site:
+      message, siteInfoD = wc.readSiteInfo(site_no, args.data)
+      if len(message) < 1:
+         message, svgText = wc.buildWellConstructionSvg(site_no, siteInfoD, DefinitionsD, ImageInfoD, aqfrInfoD, not args.link)
+      if len(message) > 0:
+         print(message)
+         continue
+
+      output_file = args.output
+      if len(args.site) > 1 or os.path.isdir(output_file):
+         output_file = os.path.join(args.output, "%s.svg" % site_no)
+
+      with open(output_file, 'w') as fh:
+         fh.write(svgText)